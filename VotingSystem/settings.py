@@ -45,12 +45,15 @@ AUTH_USER_MODEL = 'vsapp.User'
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
+    'vsapp.querylog.QueryLogMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'vsapp.profiling.ProfilingMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'vsapp.ratelimit.RateLimitMiddleware',
 ]
 
 ROOT_URLCONF = 'VotingSystem.urls'
@@ -84,6 +87,30 @@ DATABASES = {
 }
 
 
+# Cache
+# Rate-limit buckets live here; use a shared backend (e.g. Redis) with several worker processes
+# https://docs.djangoproject.com/en/5.2/topics/cache/
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    }
+}
+
+
+# Sessions
+# Signed cookies keep the login -> OTP -> vote flow off the django_session
+# table, so session saves never compete with ballot writes for SQLite's lock.
+# They cannot be revoked server-side, hence the shorter lifetime. Switch to
+# 'django.contrib.sessions.backends.cached_db' to keep sessions on the server;
+# prune leftover rows with `manage.py cleanup_sessions`.
+# https://docs.djangoproject.com/en/5.2/topics/http/sessions/#using-cookie-based-sessions
+
+SESSION_ENGINE = 'django.contrib.sessions.backends.signed_cookies'
+SESSION_COOKIE_AGE = 60 * 60 * 8
+SESSION_COOKIE_HTTPONLY = True
+
+
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
 
@@ -128,3 +155,72 @@ MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 # https://docs.djangoproject.com/en/5.2/ref/settings/#default-auto-field
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
+
+
+# Rate limiting (vsapp.ratelimit)
+# Token buckets per URL name: each scope is (burst, tokens per minute). 'ip' is
+# generous because hostel and campus networks put many voters behind one
+# address; 'identity' is per account; 'endpoint' caps the whole endpoint.
+
+RATE_LIMIT_ENABLED = True
+
+RATE_LIMITS = {
+    'login': {'ip': (60, 60), 'identity': (5, 5), 'endpoint': (200, 1200)},
+    'admin_login': {'ip': (10, 5), 'identity': (5, 5)},
+    'otp_verify': {'ip': (60, 60), 'identity': (5, 3)},
+    'vote_with_election': {'ip': (120, 120), 'identity': (5, 5), 'endpoint': (300, 3000)},
+    'candidate_search': {'methods': ['GET'], 'ip': (60, 120), 'identity': (30, 60)},
+    'admin_voter_lookup': {'methods': ['GET'], 'identity': (60, 240)},
+    'verify_receipt': {'ip': (20, 20)},
+    'receipts_api': {'methods': ['GET', 'POST'], 'ip': (30, 30), 'endpoint': (600, 1200)},
+    'results_export': {'methods': ['GET'], 'ip': (10, 10), 'endpoint': (120, 600)},
+}
+
+
+# Ballot commits (vsapp.ballots)
+# 'transaction' writes each ballot in its own transaction. 'group' hands ballots
+# to one writer thread per process that commits up to BALLOT_GROUP_MAX_BATCH of
+# them per transaction, waiting at most BALLOT_GROUP_MAX_WAIT seconds to fill a
+# batch. A request reports success only after its batch has committed, and is
+# withdrawn with an error after BALLOT_COMMIT_TIMEOUT seconds in the queue.
+
+BALLOT_COMMIT_MODE = 'transaction'
+BALLOT_GROUP_MAX_BATCH = 200
+BALLOT_GROUP_MAX_WAIT = 0.005
+BALLOT_COMMIT_TIMEOUT = 10.0
+
+
+# Request profiling (vsapp.profiling)
+# Admins add ?_profile=1 (or ?_profile=pyinstrument) to any URL; captures are
+# listed at /adm/profiles/. Each process keeps the last PROFILE_BUFFER_SIZE.
+
+PROFILING_ENABLED = True
+PROFILE_BUFFER_SIZE = 50
+
+
+# Query log (vsapp.querylog)
+# Every request's queries are fingerprinted and counted per view; statements
+# slower than QUERY_LOG_SLOW_MS are logged with their views.py/models.py line.
+# Counters are written per process to QUERY_LOG_DIR and merged by
+# `manage.py top_queries`.
+
+QUERY_LOG_ENABLED = True
+QUERY_LOG_SLOW_MS = 100
+QUERY_LOG_DIR = os.path.join(BASE_DIR, 'querylog')
+QUERY_LOG_FLUSH_INTERVAL = 30
+
+
+# Template query guard (vsapp.models)
+# When True, templates that read Election/Position/Candidate vote statistics
+# from objects not loaded with .with_stats() raise LazyQueryError instead of
+# quietly running one query per object. Turn on in tests and while developing.
+
+STRICT_TEMPLATE_QUERIES = False
+
+
+# Tally counters (vsapp.tallies)
+# Each vote counter is spread over up to TALLY_SHARDS rows so concurrent
+# ballots for the same candidate update different rows. Fold them back with
+# `manage.py compact_tallies` (e.g. from cron every few minutes).
+
+TALLY_SHARDS = 8
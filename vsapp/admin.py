@@ -1,8 +1,49 @@
 from django.contrib import admin
+from django.core.paginator import Paginator
+from django.db import DatabaseError, connection, models
+from django.db.models.functions import Cast, NullIf
+from django.utils.functional import cached_property
 from .models import *
+from .models import count_subquery
+from .lifecycle import status_changed
+
+ESTIMATE_THRESHOLD = 10000  # Below this an exact COUNT(*) is cheap enough
+
+
+def estimated_count(model):
+    """Approximate row count without scanning the table, or None when the database cannot tell"""
+    table = connection.ops.quote_name(model._meta.db_table)
+    try:
+        with connection.cursor() as cursor:
+            if connection.vendor == 'sqlite':
+                # Every row gets a rowid one above the largest so far, so this is
+                # an upper bound that only drifts after deletes; read from the b-tree's end
+                cursor.execute(f'SELECT MAX(rowid) FROM {table}')
+            elif connection.vendor == 'postgresql':
+                cursor.execute('SELECT reltuples::bigint FROM pg_class WHERE oid = %s::regclass', [table])
+            else:
+                return None
+            row = cursor.fetchone()
+    except DatabaseError:
+        return None
+    return row[0] if row and row[0] is not None and row[0] >= 0 else None
+
+
+class EstimatedCountPaginator(Paginator):
+    """Use the table's estimated size for unfiltered changelists of large tables"""
+
+    @cached_property
+    def count(self):
+        query = self.object_list.query
+        if not query.where:
+            estimate = estimated_count(self.object_list.model)
+            if estimate is not None and estimate >= ESTIMATE_THRESHOLD:
+                return estimate
+        return super().count
+
 
 @admin.register(User)
-class User(admin.ModelAdmin):
+class UserAdmin(admin.ModelAdmin):
     list_display = ['matric_number', 'user_type', 'department', 'level', 'has_voted']
     list_filter = ['user_type', 'department', 'level', 'has_voted']
     search_fields = ['user_type', 'matric_number', 'first_name', 'last_name', 'username']
@@ -10,21 +51,73 @@ class User(admin.ModelAdmin):
 
 @admin.register(Election)
 class ElectionAdmin(admin.ModelAdmin):
-    list_display = ['title', 'status', 'start_date', 'end_date', 'voter_turnout']
+    list_display = ['title', 'status', 'start_date', 'end_date', 'candidate_count', 'total_votes', 'voter_turnout']
     list_filter = ['status', 'start_date']
     search_fields = ['title', 'description']
-    readonly_fields = ['id', 'created_at', 'updated_at']
+    readonly_fields = ['id', 'created_at', 'updated_at', 'eligible_count', 'roll_frozen_at']
+
+    def get_queryset(self, request):
+        # Ballots over eligible voters, as voter_turnout computes it, so the column sorts in SQL
+        return super().get_queryset(request).with_stats().annotate(
+            voter_turnout_agg=Cast('ballots_agg', models.FloatField()) * 100 / NullIf('eligible_voters_agg', 0),
+        )
+
+    @admin.display(description='Candidates', ordering='candidate_count_agg')
+    def candidate_count(self, obj):
+        return obj.candidate_count
+
+    @admin.display(description='Votes', ordering='total_votes_agg')
+    def total_votes(self, obj):
+        return obj.total_votes
+
+    @admin.display(description='Turnout', ordering='voter_turnout_agg')
+    def voter_turnout(self, obj):
+        return f'{obj.voter_turnout:.1f}%'
+
+    def save_model(self, request, obj, form, change):
+        previous_status = form.initial.get('status') if change else None
+        super().save_model(request, obj, form, change)
+        rules_changed = {'eligible_departments', 'eligible_levels'} & set(form.changed_data)
+        status_changed(obj, previous_status, bool(rules_changed))
+
+@admin.register(Position)
+class PositionAdmin(admin.ModelAdmin):
+    list_display = ['title', 'election', 'order', 'total_votes']
+    list_filter = ['election']
+    list_select_related = ['election']
+
+    def get_queryset(self, request):
+        return super().get_queryset(request).with_stats()
+
+    @admin.display(description='Votes', ordering='total_votes_agg')
+    def total_votes(self, obj):
+        return obj.total_votes
 
 @admin.register(Candidate)
 class CandidateAdmin(admin.ModelAdmin):
     list_display = ['full_name', 'position', 'department', 'vote_count']
     list_filter = ['position__election', 'department']
+    list_select_related = ['position__election']
     search_fields = ['full_name', 'manifesto']
 
+    def get_queryset(self, request):
+        # Only the vote count: with_stats() would also total each row's position
+        return super().get_queryset(request).annotate(
+            vote_count_agg=count_subquery(Vote.objects.filter(candidate=models.OuterRef('pk')), 'candidate'),
+        )
+
+    @admin.display(description='Votes', ordering='vote_count_agg')
+    def vote_count(self, obj):
+        return obj.vote_count
+
 @admin.register(Vote)
 class VoteAdmin(admin.ModelAdmin):
     list_display = ['id', 'candidate', 'timestamp']
-    readonly_fields = ['id', 'vote_hash', 'timestamp']
+    list_select_related = ['candidate__position__election']
+    readonly_fields = ['id', 'election', 'candidate', 'hash_hex', 'timestamp']
+    ordering = ['-id']  # Insertion order; sorting on timestamp would sort the whole table
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
     
     def has_add_permission(self, request):
         return False  # Votes should only be created through voting interface
@@ -32,11 +125,36 @@ class VoteAdmin(admin.ModelAdmin):
     def has_change_permission(self, request, obj=None):
         return False  # Votes are immutable
 
+@admin.register(VoterRecord)
+class VoterRecordAdmin(admin.ModelAdmin):
+    list_display = ['voter', 'election', 'voted_at']
+    list_filter = ['election']
+    list_select_related = ['voter', 'election']
+    search_fields = ['voter__matric_number']
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+
+@admin.register(ResultSnapshot)
+class ResultSnapshotAdmin(admin.ModelAdmin):
+    list_display = ['election', 'total_votes', 'turnout', 'ledger_root', 'created_at']
+    list_select_related = ['election']
+    readonly_fields = ['election', 'payload', 'total_votes', 'total_voters', 'ballots_cast',
+                       'turnout', 'ledger_root', 'artifact', 'created_at']
+
+    def has_add_permission(self, request):
+        return False  # Snapshots are frozen when an election closes
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
 @admin.register(AuditLog)
 class AuditLogAdmin(admin.ModelAdmin):
-    list_display = ['action_type', 'user', 'description', 'timestamp']
-    list_filter = ['action_type', 'timestamp']
-    readonly_fields = ['id', 'user', 'action_type', 'description', 'timestamp']
+    list_display = ['event', 'user', 'description', 'timestamp']
+    list_filter = ['event', 'timestamp']
+    list_select_related = ['user']
+    readonly_fields = ['id', 'user', 'event', 'description', 'params', 'ip', 'agent', 'object_id', 'timestamp']
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
     
     def has_add_permission(self, request):
         return False
@@ -47,6 +165,4 @@ class AuditLogAdmin(admin.ModelAdmin):
     def has_delete_permission(self, request, obj=None):
         return False
 
-admin.site.register(Position)
-admin.site.register(VoterRecord)
 admin.site.register(SystemSetting)
@@ -0,0 +1,346 @@
+"""
+Election archives.
+
+An archive is a zip file holding one election with its positions, candidates,
+votes, voter records, audit entries, results snapshot, the users they refer
+to and the candidate photos. Rows are written as JSON lines in chunks of a
+fixed size, each with a SHA-256 checksum listed in ``manifest.json``, so
+export streams rows with ``.iterator()`` and import loads them with batched
+``bulk_create`` without holding whole tables in memory.
+"""
+import hashlib
+import io
+import json
+import zipfile
+from contextlib import contextmanager
+from datetime import date, datetime
+from uuid import UUID
+
+from django.contrib.auth.hashers import make_password
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import transaction
+from django.db.models import Exists, OuterRef, Q
+from django.utils import timezone
+
+from .audit import intern_values, parse_legacy
+from .models import (
+    AuditLog, Candidate, Election, IPAddress, Position, ResultSnapshot, User, UserAgent, Vote, VoterRecord,
+)
+from .eligibility import freeze_roll
+from .search import rebuild_index
+from .tallies import rebuild as rebuild_tallies
+from .turnout import rebuild as rebuild_turnout
+
+ARCHIVE_FORMAT = 'votingsys-election-archive'
+ARCHIVE_VERSION = 2
+READABLE_VERSIONS = {1, 2}  # Version 1 audit entries are free text, parsed into events on import
+MANIFEST_NAME = 'manifest.json'
+MEDIA_DIR = 'media'
+DEFAULT_CHUNK_SIZE = 10000
+LOOKUP_BATCH = 900
+
+# Audit client details travel as values, not as ids local to this database
+AUDIT_COLUMNS = ['id', 'user_id', 'event', 'params', 'ip__address', 'agent__value', 'timestamp', 'object_id']
+# Profile fields of an archived user; credentials and privileges never travel
+USER_FIELDS = [
+    'username', 'first_name', 'last_name', 'email', 'matric_number', 'department', 'level', 'phone', 'is_active',
+    'date_joined',
+]
+# Archived columns per table, in load order. Users are matched to existing
+# accounts on import, so only identifying and profile fields travel.
+TABLES = [
+    ('users', User, ['id'] + USER_FIELDS),
+    ('elections', Election, [
+        'id', 'title', 'description', 'start_date', 'end_date', 'status', 'created_by_id', 'created_at', 'updated_at',
+        'eligible_departments', 'eligible_levels', 'eligible_count', 'roll_frozen_at',
+    ]),
+    ('positions', Position, None),
+    ('candidates', Candidate, None),
+    ('votes', Vote, ['election_id', 'candidate_id', 'vote_hash', 'timestamp', 'ip_address']),
+    ('voter_records', VoterRecord, None),
+    ('audit_logs', AuditLog, AUDIT_COLUMNS),
+    ('result_snapshots', ResultSnapshot, [
+        'election_id', 'payload', 'total_votes', 'total_voters', 'ballots_cast', 'turnout', 'ledger_root', 'created_at',
+    ]),
+]
+# Columns holding a User id, remapped to the matching account on import
+USER_COLUMNS = {'created_by_id', 'user_id', 'voter_id'}
+# Dictionary columns interned on import: column -> (attname, dictionary)
+DICTIONARY_COLUMNS = {'ip__address': ('ip_id', IPAddress), 'agent__value': ('agent_id', UserAgent)}
+# Regenerated on the target: photo variants lazily, search rows by rebuild_index()
+SKIPPED_COLUMNS = {'photo_variants'}
+
+
+class ArchiveError(Exception):
+    pass
+
+
+@contextmanager
+def explicit_timestamps(*fields):
+    """Let bulk_create keep the timestamps we set instead of auto_now/auto_now_add"""
+    saved = [(field, field.auto_now, field.auto_now_add) for field in fields]
+    for field in fields:
+        field.auto_now = field.auto_now_add = False
+    try:
+        yield
+    finally:
+        for field, auto_now, auto_now_add in saved:
+            field.auto_now, field.auto_now_add = auto_now, auto_now_add
+
+
+def _columns(model, columns):
+    if columns is None:
+        columns = [f.attname for f in model._meta.concrete_fields if f.attname not in SKIPPED_COLUMNS]
+    return columns
+
+
+def _encode(value):
+    if isinstance(value, UUID):
+        return value.hex
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    if isinstance(value, (bytes, memoryview)):
+        return bytes(value).hex()
+    return value
+
+
+def election_querysets(election):
+    """The rows that make up an election, keyed by table name"""
+    audit = AuditLog.objects.filter(
+        Q(object_id=election.id)
+        # Vote entries written before they were tagged with the election
+        | Q(object_id__isnull=True, event=AuditLog.Event.VOTE_CAST, params__title=election.title)
+    )
+    users = User.objects.filter(
+        Q(id=election.created_by_id)
+        | Exists(Candidate.objects.filter(user=OuterRef('pk'), position__election=election))
+        | Exists(VoterRecord.objects.filter(voter=OuterRef('pk'), election=election))
+        | Exists(audit.filter(user=OuterRef('pk')))
+    )
+    return {
+        'users': users.order_by('id'),
+        'elections': Election.objects.filter(id=election.id),
+        'positions': Position.objects.filter(election=election).order_by('order', 'id'),
+        'candidates': Candidate.objects.filter(position__election=election).order_by('ordinal'),
+        'votes': Vote.objects.filter(election=election).order_by('id'),
+        'voter_records': VoterRecord.objects.filter(election=election).order_by('voted_at', 'id'),
+        'audit_logs': audit.order_by('timestamp', 'id'),
+        'result_snapshots': ResultSnapshot.objects.filter(election=election),
+    }
+
+
+def export_election(election, path, chunk_size=DEFAULT_CHUNK_SIZE, progress=None):
+    """Write an election archive to ``path``; returns the manifest"""
+    querysets = election_querysets(election)
+    manifest = {
+        'format': ARCHIVE_FORMAT,
+        'version': ARCHIVE_VERSION,
+        'created_at': timezone.now().isoformat(),
+        'election': {'id': election.id.hex, 'title': election.title, 'status': election.status},
+        'tables': {},
+        'media': [],
+    }
+    with zipfile.ZipFile(path, 'w', compression=zipfile.ZIP_DEFLATED, compresslevel=6) as archive, \
+            transaction.atomic():  # One read transaction: a consistent view of every table
+        for table, model, columns in TABLES:
+            columns = _columns(model, columns)
+            rows = querysets[table].values_list(*columns).iterator(chunk_size=chunk_size)
+            manifest['tables'][table] = {'columns': columns, 'rows': 0, 'chunks': []}
+            for chunk in _chunks(rows, chunk_size):
+                name = f"{table}/{len(manifest['tables'][table]['chunks']):06d}.jsonl"
+                data = ''.join(
+                    json.dumps([_encode(value) for value in row], separators=(',', ':')) + '\n' for row in chunk
+                ).encode()
+                archive.writestr(name, data)
+                manifest['tables'][table]['chunks'].append({
+                    'name': name, 'rows': len(chunk), 'sha256': hashlib.sha256(data).hexdigest(),
+                })
+                manifest['tables'][table]['rows'] += len(chunk)
+                if progress:
+                    progress(table, manifest['tables'][table]['rows'])
+
+        for name in querysets['candidates'].exclude(photo='').values_list('photo', flat=True):
+            try:
+                with default_storage.open(name, 'rb') as handle:
+                    data = handle.read()
+            except FileNotFoundError:
+                continue
+            archive.writestr(f'{MEDIA_DIR}/{name}', data, compress_type=zipfile.ZIP_STORED)  # Already compressed
+            manifest['media'].append({'name': name, 'sha256': hashlib.sha256(data).hexdigest()})
+
+        archive.writestr(MANIFEST_NAME, json.dumps(manifest, indent=2))
+    return manifest
+
+
+def _chunks(rows, size):
+    chunk = []
+    for row in rows:
+        chunk.append(row)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def read_manifest(archive):
+    try:
+        manifest = json.loads(archive.read(MANIFEST_NAME))
+    except KeyError:
+        raise ArchiveError('Not an election archive: manifest.json is missing.')
+    if manifest.get('format') != ARCHIVE_FORMAT or manifest.get('version') not in READABLE_VERSIONS:
+        raise ArchiveError(f"Unsupported archive format {manifest.get('format')} v{manifest.get('version')}.")
+    return manifest
+
+
+def verify_archive(archive, manifest):
+    """Check every chunk and photo against its checksum before anything is loaded"""
+    entries = [chunk for table in manifest['tables'].values() for chunk in table['chunks']]
+    entries += [{'name': f"{MEDIA_DIR}/{item['name']}", 'sha256': item['sha256']} for item in manifest['media']]
+    for entry in entries:
+        digest = hashlib.sha256()
+        try:
+            with archive.open(entry['name']) as handle:
+                for block in iter(lambda: handle.read(1 << 20), b''):
+                    digest.update(block)
+        except KeyError:
+            raise ArchiveError(f"{entry['name']} is listed in the manifest but missing from the archive.")
+        if digest.hexdigest() != entry['sha256']:
+            raise ArchiveError(f"Checksum mismatch for {entry['name']}.")
+
+
+def import_election(path, replace=False, batch_size=DEFAULT_CHUNK_SIZE, progress=None):
+    """Load an election archive; returns the imported Election"""
+    with zipfile.ZipFile(path) as archive:
+        manifest = read_manifest(archive)
+        verify_archive(archive, manifest)
+        election_id = UUID(manifest['election']['id'])
+
+        with transaction.atomic():
+            existing = Election.objects.filter(id=election_id)
+            if existing.exists():
+                if not replace:
+                    raise ArchiveError(f'Election {election_id} already exists; use --replace to overwrite it.')
+                existing.delete()
+
+            user_map = {}
+            timestamp_fields = [
+                Election._meta.get_field('created_at'), Election._meta.get_field('updated_at'),
+                Vote._meta.get_field('timestamp'), VoterRecord._meta.get_field('voted_at'),
+                AuditLog._meta.get_field('timestamp'), ResultSnapshot._meta.get_field('created_at'),
+            ]
+            with explicit_timestamps(*timestamp_fields):
+                for table, model, _ in TABLES:
+                    spec = manifest['tables'][table]
+                    loaded = 0
+                    for chunk in spec['chunks']:
+                        with archive.open(chunk['name']) as handle:
+                            rows = [json.loads(line) for line in io.TextIOWrapper(handle, encoding='utf-8')]
+                        columns = spec['columns']
+                        if table == 'users':
+                            _load_users(columns, rows, user_map)
+                        else:
+                            if model is AuditLog and 'description' in columns:
+                                columns, rows = _upgrade_audit_rows(columns, rows)
+                            interned = _intern_columns(columns, rows)
+                            objects = [_instance(model, columns, row, user_map, interned) for row in rows]
+                            # Audit entries outlive deleted elections, so they may already be here
+                            model.objects.bulk_create(
+                                objects, batch_size=batch_size, ignore_conflicts=model is AuditLog,
+                            )
+                        loaded += len(rows)
+                        if progress:
+                            progress(table, loaded)
+
+            User.objects.filter(
+                Exists(VoterRecord.objects.filter(voter=OuterRef('pk'), election_id=election_id)),
+                has_voted=False,
+            ).update(has_voted=True)
+
+        for item in manifest['media']:
+            if not default_storage.exists(item['name']):
+                default_storage.save(item['name'], ContentFile(archive.read(f"{MEDIA_DIR}/{item['name']}")))
+
+    rebuild_index()  # Candidates were bulk-created without signals
+    election = Election.objects.get(id=election_id)
+    rebuild_tallies(election)  # Counters are derived from the ledger, not archived
+    rebuild_turnout(election)
+    if election.status == 'active' and election.eligible_count is not None:
+        freeze_roll(election)  # The roll is not archived; compile it against the users here
+    return election
+
+
+def _load_users(columns, rows, user_map):
+    """Map archived users onto existing accounts by matric number or username, creating the rest"""
+    records = [dict(zip(columns, row)) for row in rows]
+    by_matric, by_username = {}, {}
+    for offset in range(0, len(records), LOOKUP_BATCH):  # Stay under SQLite's parameter limit
+        batch = records[offset:offset + LOOKUP_BATCH]
+        by_matric.update(User.objects.filter(
+            matric_number__in=[r['matric_number'] for r in batch if r['matric_number']]
+        ).values_list('matric_number', 'id'))
+        by_username.update(User.objects.filter(
+            username__in=[r['username'] for r in batch]
+        ).values_list('username', 'id'))
+
+    missing = []
+    for record in records:
+        user_id = by_matric.get(record['matric_number']) or by_username.get(record['username'])
+        if user_id:
+            user_map[record['id']] = user_id
+        else:
+            missing.append(record)
+
+    # Accounts that only exist in the archive come back as voters who cannot
+    # sign in until a password is set; older archives carry hashes and staff
+    # flags, which are ignored
+    created = User.objects.bulk_create([
+        User(
+            **{field: record[field] for field in USER_FIELDS if field in record},
+            user_type='voter', password=make_password(None),
+        )
+        for record in missing
+    ])
+    for record, user in zip(missing, created):
+        user_map[record['id']] = user.pk
+
+
+def _upgrade_audit_rows(columns, rows):
+    """Version 1 audit rows (free text) in the current columns"""
+    upgraded = []
+    for row in rows:
+        values = dict(zip(columns, row))
+        event, params = parse_legacy(values['action_type'], values['description'])
+        content_type, object_id = values['content_type'], values['object_id']
+        try:
+            election_id = UUID(object_id) if content_type == 'election' else None
+        except ValueError:
+            election_id = None
+        if election_id is None and (content_type or object_id):
+            params.update(content_type=content_type, object_id=object_id)  # As migration 0012 keeps them
+        upgraded.append([
+            values['id'], values['user_id'], event, params, values['ip_address'], values['user_agent'],
+            values['timestamp'], election_id,
+        ])
+    return AUDIT_COLUMNS, upgraded
+
+
+def _intern_columns(columns, rows):
+    """``{column: {value: id}}`` for the dictionary columns of a chunk"""
+    return {
+        column: intern_values(DICTIONARY_COLUMNS[column][1], [row[columns.index(column)] for row in rows])
+        for column in DICTIONARY_COLUMNS.keys() & set(columns)
+    }
+
+
+def _instance(model, columns, row, user_map, interned):
+    values = dict(zip(columns, row))
+    for column in USER_COLUMNS & values.keys():
+        if values[column] is not None:
+            values[column] = user_map[values[column]]
+    for column, ids in interned.items():
+        values[DICTIONARY_COLUMNS[column][0]] = ids.get(values.pop(column))
+    if 'vote_hash' in values:
+        values['vote_hash'] = bytes.fromhex(values['vote_hash'])
+    return model(**values)
@@ -0,0 +1,119 @@
+"""
+Audit entries.
+
+The audit log is the largest table, so its rows are kept small. An entry
+stores an event code and the few parameters its message needs (a title, a
+name) instead of the formatted text; ``AuditLog.description`` renders the
+message on display. The client's User-Agent and IP address repeat across
+thousands of entries, so each distinct value is stored once in
+``UserAgent`` or ``IPAddress`` and entries reference it by integer id.
+
+Each process caches the ids it has interned, per database (connection alias
+and database name), so a command that points a connection at a scratch
+database never sees ids from another one. An id is cached only once the
+transaction that looked it up commits, so a rollback never leaves the cache
+pointing at a row that was never written.
+"""
+import re
+from functools import partial
+
+from django.db import connections, router, transaction
+
+from .models import AuditLog, IPAddress, UserAgent
+
+CACHE_SIZE = 10000  # Ids cached per dictionary; the cache starts over when full
+LOOKUP_BATCH = 900  # Values per IN (...) query; SQLite allows 999 parameters
+
+VALUE_FIELDS = {UserAgent: 'value', IPAddress: 'address'}
+_ids = {}  # (alias, database name, model) -> {value: id}
+
+
+def _cache(model):
+    alias = router.db_for_write(model)
+    return _ids.setdefault((alias, connections[alias].settings_dict['NAME'], model), {})
+
+
+def _prepare(model, value):
+    if model is UserAgent:
+        return value[:UserAgent.MAX_LENGTH]
+    return model._meta.get_field(VALUE_FIELDS[model]).get_prep_value(value)  # Normalises IPv6
+
+
+def _remember(cache, found):
+    if len(cache) + len(found) > CACHE_SIZE:
+        cache.clear()
+    cache.update(found)
+
+
+def intern_values(model, values):
+    """``{value: id}`` of the ``UserAgent`` or ``IPAddress`` rows holding ``values``, creating missing ones"""
+    field, cache = VALUE_FIELDS[model], _cache(model)
+    prepared = {value: _prepare(model, value) for value in set(values) if value}
+    found = {key: cache[key] for key in prepared.values() if key in cache}
+    missing = sorted(set(prepared.values()) - found.keys())
+    if missing:
+        model.objects.bulk_create([model(**{field: key}) for key in missing], ignore_conflicts=True)
+        looked_up = {}
+        for start in range(0, len(missing), LOOKUP_BATCH):
+            looked_up.update(
+                model.objects.filter(**{f'{field}__in': missing[start:start + LOOKUP_BATCH]}).values_list(field, 'id')
+            )
+        transaction.on_commit(partial(_remember, cache, looked_up))
+        found.update(looked_up)
+    return {value: found[key] for value, key in prepared.items()}
+
+
+def intern(model, value):
+    return intern_values(model, [value]).get(value)
+
+
+def clear_cache():
+    _ids.clear()
+
+
+def audit_entry(event, user=None, ip_address=None, user_agent=None, object_id=None, **params):
+    """An unsaved entry for ``event``; ``params`` fill in the event's message"""
+    return AuditLog(
+        user=user,
+        event=event,
+        params=params,
+        ip_id=intern(IPAddress, ip_address),
+        agent_id=intern(UserAgent, user_agent),
+        object_id=object_id,
+    )
+
+
+def log_event(request, event, user=None, object_id=None, **params):
+    """Write an entry for ``event`` with the request's client details; ``user`` defaults to the request's"""
+    entry = audit_entry(
+        event,
+        user=user or request.user,
+        ip_address=request.META.get('REMOTE_ADDR'),
+        user_agent=request.META.get('HTTP_USER_AGENT'),
+        object_id=object_id,
+        **params,
+    )
+    entry.save()
+    return entry
+
+
+def _message_pattern(message):
+    # Splitting on a group alternates literal text and parameter names
+    parts = re.split(r'\{(\w+)\}', message)
+    return re.compile(''.join(
+        f'(?P<{part}>.*)' if index % 2 else re.escape(part) for index, part in enumerate(parts)
+    ), re.DOTALL)
+
+
+LEGACY_PATTERNS = [
+    (event, _message_pattern(message)) for event, message in AuditLog.MESSAGES.items() if event != AuditLog.Event.LEGACY
+]
+
+
+def parse_legacy(action_type, description):
+    """``(event, params)`` for a free-text entry written before event codes"""
+    for event, pattern in LEGACY_PATTERNS:
+        match = pattern.fullmatch(description)
+        if match:
+            return event, match.groupdict()
+    return AuditLog.Event.LEGACY, {'action': action_type, 'text': description}
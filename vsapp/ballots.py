@@ -0,0 +1,234 @@
+"""
+Ballot commits.
+
+``commit_ballot`` writes a validated ballot: its votes, the voter record, the
+voter's has_voted flag, the audit entry, the tally counters and the turnout
+rollups, all or nothing. With ``BALLOT_COMMIT_MODE = 'transaction'`` (the
+default) each request does this in its own transaction. With ``'group'``
+the request hands the ballot to a single writer thread per process, which
+commits up to ``BALLOT_GROUP_MAX_BATCH`` ballots per transaction with one
+bulk insert per table, so SQLite takes its write lock and syncs the journal
+once per batch instead of once per voter.
+
+Durability is the same in both modes: a request only reports success after
+the transaction holding its ballot has committed. If the request gives up
+waiting (``BALLOT_COMMIT_TIMEOUT``) before the writer has picked the ballot
+up, the ballot is withdrawn and ``BallotTimeout`` is raised; once the writer
+has started on it, the request waits for the batch to finish. Ballots still
+queued when the process exits are written before it stops, but a crash loses
+them, as it would lose requests still in flight in per-request mode; their
+voters never saw a success page.
+"""
+import atexit
+import hashlib
+import logging
+import queue
+import secrets
+import threading
+import time
+from collections import namedtuple
+from concurrent.futures import Future
+from concurrent.futures import TimeoutError as FutureTimeoutError
+
+from django.conf import settings
+from django.db import IntegrityError, connection, transaction
+from django.utils import timezone
+
+from .audit import intern_values
+from .models import AuditLog, IPAddress, User, UserAgent, Vote, VoterRecord
+from .tallies import ballot_counts, increment
+from .turnout import ballot_buckets, record as record_turnout
+
+logger = logging.getLogger(__name__)
+
+Ballot = namedtuple('Ballot', ['election', 'voter', 'candidates', 'ip_address', 'user_agent'])
+
+
+class BallotTimeout(Exception):
+    """The ballot was not written in time and has been withdrawn"""
+
+
+def write_ballots(ballots):
+    """
+    Write ballots inside the caller's transaction with one insert per table.
+
+    Returns the VoterRecord of each ballot. Raises IntegrityError if any
+    voter already has a ballot in that election; nothing is read before the
+    first insert, so SQLite never has to upgrade a read lock to a write lock.
+    """
+    votes, records, voter_ids = [], [], set()
+    for ballot in ballots:
+        election, voter = ballot.election, ballot.voter
+        # Record voter participation
+        records.append(VoterRecord(voter=voter, election=election, verification_code=secrets.token_urlsafe(16)))
+        for candidate in ballot.candidates:
+            # Create vote hash (non-reversible, anonymized)
+            vote_data = f"{voter.id}-{candidate.id}-{timezone.now()}"
+            votes.append(Vote(
+                election=election,
+                candidate=candidate,
+                vote_hash=hashlib.sha256(vote_data.encode()).digest(),
+                ip_address=ballot.ip_address,
+            ))
+        if not voter.has_voted:
+            voter_ids.add(voter.pk)
+
+    # The unique (voter, election) constraint on VoterRecord rejects second ballots
+    VoterRecord.objects.bulk_create(records)
+    Vote.objects.bulk_create(votes)
+    if voter_ids:
+        User.objects.filter(pk__in=voter_ids).update(has_voted=True)
+    # Log the votes; client details are interned after the first insert, under the write lock
+    ip_ids = intern_values(IPAddress, [ballot.ip_address for ballot in ballots])
+    agent_ids = intern_values(UserAgent, [ballot.user_agent for ballot in ballots])
+    AuditLog.objects.bulk_create([
+        AuditLog(
+            user=ballot.voter,
+            event=AuditLog.Event.VOTE_CAST,
+            params={'title': ballot.election.title},
+            ip_id=ip_ids.get(ballot.ip_address),
+            agent_id=agent_ids.get(ballot.user_agent),
+            object_id=ballot.election.pk,
+        )
+        for ballot in ballots
+    ])
+    increment(ballot_counts(ballots))
+    record_turnout(ballot_buckets(ballots, records))
+    return records
+
+
+def write_ballot(ballot):
+    """Write one ballot inside the caller's transaction; returns the VoterRecord"""
+    return write_ballots([ballot])[0]
+
+
+def commit_ballot(ballot):
+    """
+    Durably write a ballot and return its VoterRecord.
+
+    Raises IntegrityError if the voter already has a ballot in the election
+    and BallotTimeout if the group writer could not get to it in time.
+    """
+    if getattr(settings, 'BALLOT_COMMIT_MODE', 'transaction') != 'group':
+        with transaction.atomic():
+            return write_ballot(ballot)
+    return get_writer().submit(ballot)
+
+
+class BallotWriter:
+    """Single thread that commits queued ballots in batches"""
+
+    def __init__(self, max_batch=200, max_wait=0.005, timeout=10.0):
+        self.max_batch = max_batch
+        self.max_wait = max_wait
+        self.timeout = timeout
+        self.queue = queue.Queue()
+        self.batches = 0
+        self.ballots = 0
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def start(self):
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name='ballot-writer', daemon=True)
+                self._thread.start()
+
+    def stop(self):
+        """Write what is queued, then stop the thread"""
+        if self._thread is not None and self._thread.is_alive():
+            self.queue.put(None)
+            self._thread.join()
+
+    def submit(self, ballot):
+        self.start()
+        future = Future()
+        self.queue.put((ballot, future))
+        try:
+            return future.result(timeout=self.timeout)
+        except FutureTimeoutError:
+            if future.cancel():
+                raise BallotTimeout('The ballot could not be written in time.')
+            # Already in a batch that is being written; it will finish shortly
+            return future.result()
+
+    def _next_batch(self):
+        """Block for one ballot, then gather whatever else arrives within max_wait"""
+        first = self.queue.get()
+        if first is None:
+            return None
+        batch = [first]
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch:
+            remaining = deadline - time.monotonic()
+            try:
+                item = self.queue.get(timeout=remaining) if remaining > 0 else self.queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is None:
+                self.queue.put(None)  # Stop after this batch
+                break
+            batch.append(item)
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._next_batch()
+            if batch is None:
+                break
+            batch = [(ballot, future) for ballot, future in batch if future.set_running_or_notify_cancel()]
+            if batch:
+                self._commit(batch)
+        connection.close()
+
+    def _commit(self, batch):
+        ballots = [ballot for ballot, _ in batch]
+        try:
+            try:
+                with transaction.atomic():
+                    outcomes = write_ballots(ballots)
+            except IntegrityError:
+                # A voter in the batch already has a ballot; retry with one
+                # savepoint per ballot so only theirs fails
+                with transaction.atomic():
+                    outcomes = [self._write_one(ballot) for ballot in ballots]
+        except Exception as exc:
+            logger.exception('Ballot batch of %d failed to commit', len(batch))
+            connection.close()  # Start the next batch on a fresh connection
+            for _, future in batch:
+                future.set_exception(exc)
+            return
+
+        # Only now, with the transaction committed, do the requests hear back
+        self.batches += 1
+        self.ballots += len(batch)
+        for (_, future), outcome in zip(batch, outcomes):
+            if isinstance(outcome, Exception):
+                future.set_exception(outcome)
+            else:
+                future.set_result(outcome)
+
+    @staticmethod
+    def _write_one(ballot):
+        try:
+            with transaction.atomic():
+                return write_ballot(ballot)
+        except IntegrityError as exc:
+            return exc
+
+
+_writer = None
+_writer_lock = threading.Lock()
+
+
+def get_writer():
+    global _writer
+    with _writer_lock:
+        if _writer is None:
+            _writer = BallotWriter(
+                max_batch=getattr(settings, 'BALLOT_GROUP_MAX_BATCH', 200),
+                max_wait=getattr(settings, 'BALLOT_GROUP_MAX_WAIT', 0.005),
+                timeout=getattr(settings, 'BALLOT_COMMIT_TIMEOUT', 10.0),
+            )
+            atexit.register(_writer.stop)
+        return _writer
@@ -0,0 +1,73 @@
+"""
+Per-election eligibility rolls.
+
+An election lists the departments and levels it is open to; an empty list
+admits any. When the election opens the rules are compiled into a frozen
+roll: one ``EligibleVoter`` row per eligible voter, written with a single
+``INSERT ... SELECT``, and the roll's size is stored on the election as
+``eligible_count``. Checking a voter is then one probe of the unique
+(election, voter) index, and turnout divides by a stored number instead of
+counting users on every render. Voters registered or moved after opening
+are not on the roll; reopening the election freezes it again.
+
+Elections opened before rolls existed have no roll (``eligible_count`` is
+None) and stay open to every active voter.
+"""
+from django.db import connection, transaction
+from django.db.models import Exists, OuterRef, Q
+from django.utils import timezone
+
+from .models import Election, EligibleVoter, User
+
+
+def parse_rule_list(text):
+    """Comma or newline separated form input as a list without blanks or duplicates"""
+    values = []
+    for value in (text or '').replace('\n', ',').split(','):
+        value = value.strip()
+        if value and value not in values:
+            values.append(value)
+    return values
+
+
+def eligible_users(election):
+    """Active voters matching the election's rules"""
+    users = User.objects.filter(user_type='voter', is_active=True)
+    if election.eligible_departments:
+        users = users.filter(department__in=election.eligible_departments)
+    if election.eligible_levels:
+        users = users.filter(level__in=election.eligible_levels)
+    return users
+
+
+def freeze_roll(election):
+    """Compile the rules into the election's roll, replacing any earlier one; returns its size"""
+    table = connection.ops.quote_name(EligibleVoter._meta.db_table)
+    select, params = eligible_users(election).order_by().values('id').query.sql_with_params()
+    election_id = Election._meta.pk.get_db_prep_value(election.pk, connection)
+    with transaction.atomic():
+        EligibleVoter.objects.filter(election=election).delete()
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'INSERT INTO {table} (election_id, voter_id) SELECT %s, eligible.id FROM ({select}) eligible',
+                [election_id, *params],
+            )
+            election.eligible_count = cursor.rowcount
+        election.roll_frozen_at = timezone.now()
+        Election.objects.filter(pk=election.pk).update(
+            eligible_count=election.eligible_count, roll_frozen_at=election.roll_frozen_at,
+        )
+    return election.eligible_count
+
+
+def is_eligible(election, user):
+    if election.eligible_count is None:
+        return user.user_type == 'voter' and user.is_active
+    return EligibleVoter.objects.filter(election=election, voter=user).exists()
+
+
+def open_to(user):
+    """Filter for the elections ``user`` may vote in: one roll probe per election"""
+    return Q(eligible_count__isnull=True) | Exists(
+        EligibleVoter.objects.filter(election=OuterRef('pk'), voter=user)
+    )
@@ -0,0 +1,99 @@
+"""
+Candidate photo variants.
+
+Uploaded photos are cropped and resized into a few fixed sizes, encoded as
+WebP and JPEG, and stored under content-hashed names so they can be cached
+forever. Variants are generated on upload, lazily the first time a photo
+without variants is displayed, or in bulk with ``manage.py build_photo_variants``.
+"""
+import hashlib
+import io
+import logging
+import re
+
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.urls import reverse
+from PIL import Image, ImageOps, UnidentifiedImageError, features
+
+logger = logging.getLogger(__name__)
+
+PHOTO_SIZES = {
+    'thumb': 160,  # Ballot, results and admin cards (80px at 2x)
+    'card': 320,   # Profile modals
+}
+VARIANT_DIR = 'candidates/variants'
+VARIANT_NAME = re.compile(r'^[0-9a-f]{16}-[a-z]+\.(webp|jpg)$')
+IMMUTABLE_CACHE_CONTROL = 'public, max-age=31536000, immutable'
+
+_ENCODERS = {
+    'jpeg': ('jpg', {'format': 'JPEG', 'quality': 82, 'optimize': True, 'progressive': True}),
+    'webp': ('webp', {'format': 'WEBP', 'quality': 80, 'method': 4}),
+}
+
+
+def variant_formats():
+    return ['webp', 'jpeg'] if features.check('webp') else ['jpeg']
+
+
+def render_photo_variants(candidate, force=False):
+    """Render every size and format of a candidate's photo; returns the variants without saving them"""
+    if not candidate.photo:
+        return {}
+    variants = candidate.photo_variants or {}
+    if not force and variants.get('source') == candidate.photo.name:
+        return variants
+
+    try:
+        candidate.photo.open('rb')
+        try:
+            data = candidate.photo.read()
+        finally:
+            candidate.photo.close()
+        digest = hashlib.sha256(data).hexdigest()[:16]
+        with Image.open(io.BytesIO(data)) as source:
+            source = ImageOps.exif_transpose(source).convert('RGB')
+            variants = {'source': candidate.photo.name}
+            for size_name, size in PHOTO_SIZES.items():
+                image = ImageOps.fit(source, (size, size), Image.LANCZOS)
+                variants[size_name] = {}
+                for fmt in variant_formats():
+                    extension, options = _ENCODERS[fmt]
+                    name = f'{VARIANT_DIR}/{digest}-{size_name}.{extension}'
+                    if force or not default_storage.exists(name):
+                        buffer = io.BytesIO()
+                        image.save(buffer, **options)
+                        if default_storage.exists(name):
+                            default_storage.delete(name)
+                        default_storage.save(name, ContentFile(buffer.getvalue()))
+                    variants[size_name][fmt] = name.rsplit('/', 1)[1]
+    except (OSError, UnidentifiedImageError, Image.DecompressionBombError) as exc:
+        logger.warning('Could not build photo variants for candidate %s: %s', candidate.pk, exc)
+        variants = {'source': candidate.photo.name}  # Serve the original; do not retry on every view
+    return variants
+
+
+def generate_photo_variants(candidate, force=False):
+    """Render every size and format of a candidate's photo and record them on the candidate"""
+    if not candidate.photo:
+        return {}
+    variants = render_photo_variants(candidate, force)
+    if variants is candidate.photo_variants:
+        return variants  # Already up to date
+
+    candidate.photo_variants = variants
+    if candidate.pk:
+        type(candidate).objects.filter(pk=candidate.pk).update(photo_variants=variants)
+    return variants
+
+
+def photo_variant_url(candidate, size='thumb', fmt=None, fallback=True):
+    """URL of a photo variant, generating variants on first use; falls back to the original upload unless told not to"""
+    if not candidate.photo:
+        return None
+    variants = generate_photo_variants(candidate)
+    formats = variants.get(size, {})
+    name = formats.get(fmt) if fmt else next(iter(formats.values()), None)
+    if not name:
+        return candidate.photo.url if fallback else None
+    return reverse('photo_variant', args=[name])
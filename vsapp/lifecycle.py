@@ -0,0 +1,17 @@
+"""
+Election status changes.
+
+Opening an election freezes its eligibility roll and closing it freezes the
+results. Officers change status from the admin pages and from the Django
+admin; both call ``status_changed`` after saving so the two stay in step.
+"""
+from .eligibility import freeze_roll
+from .results import freeze_results
+
+
+def status_changed(election, previous_status, rules_changed=False):
+    """Run the side effects of a saved election changing status (or eligibility rules)"""
+    if election.status == 'active' and (previous_status != 'active' or rules_changed):
+        freeze_roll(election)
+    if election.status == 'closed' and previous_status != 'closed':
+        freeze_results(election)
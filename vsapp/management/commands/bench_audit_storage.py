@@ -0,0 +1,130 @@
+import json
+import os
+import random
+import sqlite3
+import tempfile
+import time
+import uuid
+from datetime import datetime, timedelta
+
+from django.core.management.base import BaseCommand
+
+from vsapp.management.commands.seed_election import USER_AGENTS
+
+# Audit table layouts as Django creates them on SQLite, before and after the
+# compact audit migration (0012_compact_audit_storage).
+LAYOUTS = {
+    'legacy': {
+        'tables': [
+            'CREATE TABLE audit (id char(32) NOT NULL PRIMARY KEY, action_type varchar(20) NOT NULL, '
+            'description text NOT NULL, ip_address char(39) NULL, user_agent text NOT NULL, '
+            'timestamp datetime NOT NULL, content_type varchar(50) NOT NULL, object_id varchar(100) NOT NULL, '
+            'user_id integer NULL)',
+        ],
+        'indexes': [
+            'CREATE INDEX audit_user_timestamp ON audit (user_id, timestamp)',
+            'CREATE INDEX audit_action_timestamp ON audit (action_type, timestamp)',
+            'CREATE INDEX audit_timestamp ON audit (timestamp)',
+        ],
+        'insert': (
+            'INSERT INTO audit (id, action_type, description, ip_address, user_agent, timestamp, content_type, '
+            'object_id, user_id) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)'
+        ),
+    },
+    'compact': {
+        'tables': [
+            'CREATE TABLE agent (id integer NOT NULL PRIMARY KEY AUTOINCREMENT, value varchar(512) NOT NULL UNIQUE)',
+            'CREATE TABLE ip (id integer NOT NULL PRIMARY KEY AUTOINCREMENT, address char(39) NOT NULL UNIQUE)',
+            'CREATE TABLE audit (id char(32) NOT NULL PRIMARY KEY, event smallint unsigned NOT NULL, '
+            'params text NOT NULL, timestamp datetime NOT NULL, object_id char(32) NULL, user_id integer NULL, '
+            'ip_id bigint NULL, agent_id bigint NULL)',
+        ],
+        'indexes': [
+            'CREATE INDEX audit_user_timestamp ON audit (user_id, timestamp)',
+            'CREATE INDEX audit_event_timestamp ON audit (event, timestamp)',
+            'CREATE INDEX audit_timestamp ON audit (timestamp)',
+        ],
+        'insert': (
+            'INSERT INTO audit (id, event, params, timestamp, object_id, user_id, ip_id, agent_id) '
+            'VALUES (?, ?, ?, ?, ?, ?, ?, ?)'
+        ),
+    },
+}
+
+
+class Command(BaseCommand):
+    help = 'Compare size and speed of the legacy and compact AuditLog table layouts on SQLite'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=200000, help='Number of audit entries to insert')
+        parser.add_argument('--voters', type=int, default=20000, help='Number of voters the entries belong to')
+        parser.add_argument('--batch', type=int, default=100, help='Entries per insert transaction')
+        parser.add_argument('--seed', type=int, default=1)
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+        election_id = uuid.UUID(int=rng.getrandbits(128))
+        title = 'Students Union General Election'
+        # One address per voter: a login and a vote from each, as seed_election writes them
+        addresses = [f'10.{rng.randint(0, 255)}.{rng.randint(0, 255)}.{rng.randint(1, 254)}' for _ in range(options['voters'])]
+        start = datetime(2025, 1, 1, 8, 0)
+        entries = []
+        for i in range(options['rows']):
+            voter = rng.randrange(options['voters'])
+            entries.append((
+                uuid.UUID(int=rng.getrandbits(128)).hex,
+                i % 2,  # Alternate logins and votes
+                (start + timedelta(milliseconds=i * 50)).isoformat(' '),
+                voter + 1,
+                addresses[voter],
+                USER_AGENTS[voter % len(USER_AGENTS)],
+            ))
+
+        self.stdout.write(f"{options['rows']} entries, {options['voters']} voters, {options['batch']} per transaction")
+        self.stdout.write(f"{'layout':<10}{'size (MiB)':>12}{'bytes/entry':>13}{'insert (s)':>12}{'entries/s':>12}")
+        for name, layout in LAYOUTS.items():
+            result = self._run(layout, name, entries, election_id, title, options['batch'])
+            self.stdout.write(
+                f"{name:<10}{result['size'] / 2 ** 20:>12.2f}{result['size'] / len(entries):>13.1f}"
+                f"{result['insert']:>12.2f}{len(entries) / result['insert']:>12.0f}"
+            )
+
+    def _run(self, layout, name, entries, election_id, title, batch):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, f'{name}.sqlite3')
+            db = sqlite3.connect(path)
+            for statement in layout['tables'] + layout['indexes']:
+                db.execute(statement)
+
+            agent_ids, ip_ids = {}, {}
+            started = time.perf_counter()
+            for offset in range(0, len(entries), batch):
+                with db:
+                    if name == 'legacy':
+                        rows = [
+                            (pk, 'vote', f'Voted in election: {title}', ip, agent, ts, 'election', str(election_id), user)
+                            if vote else (pk, 'login', 'Voter login', ip, agent, ts, '', '', user)
+                            for pk, vote, ts, user, ip, agent in entries[offset:offset + batch]
+                        ]
+                    else:
+                        rows = []
+                        for pk, vote, ts, user, ip, agent in entries[offset:offset + batch]:
+                            # Interned as audit.intern_values does, with the process cache in front
+                            if agent not in agent_ids:
+                                db.execute('INSERT OR IGNORE INTO agent (value) VALUES (?)', [agent])
+                                agent_ids[agent] = db.execute('SELECT id FROM agent WHERE value = ?', [agent]).fetchone()[0]
+                            if ip not in ip_ids:
+                                db.execute('INSERT OR IGNORE INTO ip (address) VALUES (?)', [ip])
+                                ip_ids[ip] = db.execute('SELECT id FROM ip WHERE address = ?', [ip]).fetchone()[0]
+                            rows.append(
+                                (pk, 30, json.dumps({'title': title}), ts, election_id.hex, user, ip_ids[ip], agent_ids[agent])
+                                if vote else (pk, 4, '{}', ts, None, user, ip_ids[ip], agent_ids[agent])
+                            )
+                    db.executemany(layout['insert'], rows)
+            insert = time.perf_counter() - started
+
+            db.execute('VACUUM')
+            page_size = db.execute('PRAGMA page_size').fetchone()[0]
+            page_count = db.execute('PRAGMA page_count').fetchone()[0]
+            db.close()
+        return {'size': page_size * page_count, 'insert': insert}
@@ -0,0 +1,145 @@
+import os
+import random
+import statistics
+import tempfile
+import threading
+import time
+from datetime import timedelta
+
+from django.contrib.auth.hashers import make_password
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import OperationalError, connection, transaction
+from django.utils import timezone
+
+from vsapp.audit import clear_cache as clear_audit_cache
+from vsapp.ballots import Ballot, BallotTimeout, BallotWriter, write_ballot
+from vsapp.models import Candidate, Election, Position, User, VoterRecord
+
+
+class Command(BaseCommand):
+    help = 'Compare per-request ballot transactions with group commit on a scratch SQLite database'
+    requires_system_checks = []
+
+    def add_arguments(self, parser):
+        parser.add_argument('--voters', type=int, default=3000, help='Ballots to cast per mode')
+        parser.add_argument('--threads', type=int, default=32, help='Concurrent request threads')
+        parser.add_argument('--positions', type=int, default=4)
+        parser.add_argument('--batch', type=int, default=200, help='Group commit: most ballots per transaction')
+        parser.add_argument('--wait', type=float, default=0.005, help='Group commit: seconds to wait to fill a batch')
+        parser.add_argument('--wal', action='store_true', help='Use journal_mode=WAL instead of the rollback journal')
+        parser.add_argument('--modes', nargs='+', default=['transaction', 'group'], choices=['transaction', 'group'])
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'sqlite':
+            raise CommandError('This benchmark targets SQLite.')
+        connection.close()
+        original_name = connection.settings_dict['NAME']
+        self.stdout.write(
+            f"{options['voters']} ballots x {options['positions']} positions, {options['threads']} threads, "
+            f"journal={'wal' if options['wal'] else 'delete'}"
+        )
+        self.stdout.write(
+            f"{'mode':<13}{'ballots/s':>10}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'errors':>8}{'commits':>9}"
+        )
+        try:
+            with tempfile.TemporaryDirectory() as tmp:
+                for mode in options['modes']:
+                    # Every thread opens its connection from this settings dict
+                    connection.settings_dict['NAME'] = os.path.join(tmp, f'{mode}.sqlite3')
+                    clear_audit_cache()  # Ids interned in an earlier scratch database are gone
+                    result = self._run(mode, options)
+                    connection.close()
+                    self.stdout.write(
+                        f"{mode:<13}{result['rate']:>10.0f}{result['p50'] * 1000:>9.1f}{result['p95'] * 1000:>9.1f}"
+                        f"{result['p99'] * 1000:>9.1f}{result['errors']:>8}{result['commits']:>9}"
+                    )
+        finally:
+            connection.close()
+            connection.settings_dict['NAME'] = original_name
+
+    def _fixture(self, options):
+        call_command('migrate', verbosity=0)
+        if options['wal']:
+            with connection.cursor() as cursor:
+                cursor.execute('PRAGMA journal_mode=WAL')
+        password = make_password('bench')
+        admin = User.objects.create(username='bench-admin', password=password, user_type='admin')
+        now = timezone.now()
+        election = Election.objects.create(
+            title='Benchmark', description='', start_date=now - timedelta(hours=1),
+            end_date=now + timedelta(hours=1), status='active', created_by=admin,
+        )
+        User.objects.bulk_create([
+            User(username=f'bench-{i}', password=password, matric_number=f'B{i:07d}')
+            for i in range(options['voters'])
+        ])
+        voters = list(User.objects.filter(user_type='voter'))
+        positions = []
+        for order in range(options['positions']):
+            position = Position.objects.create(election=election, title=f'Position {order}', order=order)
+            position.bench_candidates = [
+                Candidate.objects.create(position=position, user=voters[order * 3 + i], full_name=f'Candidate {i}',
+                                         department='', level='', manifesto='')
+                for i in range(3)
+            ]
+            positions.append(position)
+        connection.close()  # The request threads open their own connections
+        return election, positions, voters
+
+    def _run(self, mode, options):
+        election, positions, voters = self._fixture(options)
+        rng = random.Random(1)
+        ballots = [
+            Ballot(election, voter, [rng.choice(p.bench_candidates) for p in positions], '10.0.0.1', 'bench')
+            for voter in voters
+        ]
+        writer = BallotWriter(max_batch=options['batch'], max_wait=options['wait'], timeout=60) \
+            if mode == 'group' else None
+        latencies, errors = [], []
+        lock = threading.Lock()
+
+        def worker(share):
+            mine, failed = [], 0
+            for ballot in share:
+                started = time.perf_counter()
+                try:
+                    if writer:
+                        writer.submit(ballot)
+                    else:
+                        with transaction.atomic():
+                            write_ballot(ballot)
+                except (OperationalError, BallotTimeout):  # "database is locked" after the busy timeout
+                    failed += 1
+                    continue
+                mine.append(time.perf_counter() - started)
+            connection.close()
+            with lock:
+                latencies.extend(mine)
+                errors.append(failed)
+
+        threads = [
+            threading.Thread(target=worker, args=(ballots[i::options['threads']],))
+            for i in range(options['threads'])
+        ]
+        started = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - started
+        if writer:
+            writer.stop()
+
+        written = VoterRecord.objects.filter(election=election).count()
+        if written != len(latencies):
+            raise CommandError(f'{mode}: {len(latencies)} ballots reported written but {written} found.')
+        quantiles = statistics.quantiles(latencies, n=100) if len(latencies) > 1 else [0] * 99
+        return {
+            'rate': len(latencies) / elapsed,
+            'p50': quantiles[49],
+            'p95': quantiles[94],
+            'p99': quantiles[98],
+            'errors': sum(errors),
+            'commits': writer.batches if writer else len(latencies),
+        }
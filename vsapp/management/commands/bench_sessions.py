@@ -0,0 +1,128 @@
+import os
+import re
+import tempfile
+from collections import Counter
+from datetime import timedelta
+
+from django.contrib.auth.hashers import make_password
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import Client
+from django.test.utils import override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from vsapp.audit import clear_cache as clear_audit_cache
+from vsapp.models import Candidate, Election, Position, User, VoterRecord
+
+ENGINES = {
+    'db': 'django.contrib.sessions.backends.db',
+    'cached_db': 'django.contrib.sessions.backends.cached_db',
+    'signed_cookies': 'django.contrib.sessions.backends.signed_cookies',
+}
+WRITE = re.compile(r'^\s*(?:INSERT\s+INTO|UPDATE|DELETE\s+FROM)\s+"?(\w+)"?', re.IGNORECASE)
+READ = re.compile(r'^\s*SELECT\b.*\bFROM\s+"?(\w+)"?', re.IGNORECASE | re.DOTALL)
+
+
+class StatementCounter:
+    """execute_wrapper counting reads and writes per table"""
+
+    def __init__(self):
+        self.writes = Counter()
+        self.reads = Counter()
+
+    def __call__(self, execute, sql, params, many, context):
+        match = WRITE.match(sql)
+        if match:
+            self.writes[match.group(1)] += 1
+        else:
+            match = READ.match(sql)
+            if match:
+                self.reads[match.group(1)] += 1
+        return execute(sql, params, many, context)
+
+
+class Command(BaseCommand):
+    help = 'Count database reads and writes per completed ballot (login, OTP, vote) for each session engine'
+    requires_system_checks = []
+
+    def add_arguments(self, parser):
+        parser.add_argument('--voters', type=int, default=50, help='Complete voter flows per engine')
+        parser.add_argument('--engines', nargs='+', default=list(ENGINES), choices=list(ENGINES))
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'sqlite':
+            raise CommandError('This benchmark targets SQLite.')
+        connection.close()
+        original_name = connection.settings_dict['NAME']
+        self.stdout.write(f"{options['voters']} login -> OTP -> vote flows per engine; counts are per ballot")
+        self.stdout.write(
+            f"{'engine':<16}{'session writes':>15}{'session reads':>14}{'all writes':>12}{'all reads':>11}"
+        )
+        # Fast hashing and no rate limits: the benchmark counts statements, not CPU
+        overrides = override_settings(
+            ALLOWED_HOSTS=['testserver'],
+            PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher'],
+            RATE_LIMIT_ENABLED=False,
+            QUERY_LOG_ENABLED=False,
+            BALLOT_COMMIT_MODE='transaction',
+        )
+        try:
+            with tempfile.TemporaryDirectory() as tmp, overrides:
+                for name in options['engines']:
+                    connection.settings_dict['NAME'] = os.path.join(tmp, f'{name}.sqlite3')
+                    clear_audit_cache()  # Fresh database; forget ids interned in the last one
+                    with override_settings(SESSION_ENGINE=ENGINES[name]):
+                        counter, ballots = self._run(options['voters'])
+                    connection.close()
+                    sessions = 'django_session'
+                    self.stdout.write(
+                        f"{name:<16}{counter.writes[sessions] / ballots:>15.2f}{counter.reads[sessions] / ballots:>14.2f}"
+                        f"{sum(counter.writes.values()) / ballots:>12.2f}{sum(counter.reads.values()) / ballots:>11.2f}"
+                    )
+        finally:
+            connection.close()
+            connection.settings_dict['NAME'] = original_name
+
+    def _fixture(self, voters):
+        call_command('migrate', verbosity=0)
+        password = make_password('bench')
+        admin = User.objects.create(username='bench-admin', password=password, user_type='admin')
+        now = timezone.now()
+        election = Election.objects.create(
+            title='Benchmark', description='', start_date=now - timedelta(hours=1),
+            end_date=now + timedelta(hours=1), status='active', created_by=admin,
+        )
+        User.objects.bulk_create([
+            User(username=f'bench-{i}', password=password, matric_number=f'B{i:07d}') for i in range(voters)
+        ])
+        users = list(User.objects.filter(user_type='voter'))
+        ballot = {}
+        for order in range(3):
+            position = Position.objects.create(election=election, title=f'Position {order}', order=order)
+            candidate = Candidate.objects.create(position=position, user=users[order], full_name=f'Candidate {order}',
+                                                 department='', level='', manifesto='')
+            ballot[f'position_{position.id}'] = [str(candidate.id)]
+        return election, users, ballot
+
+    def _run(self, voters):
+        election, users, ballot = self._fixture(voters)
+        counter = StatementCounter()
+        otp = make_password('123456')
+        for user in users:
+            client = Client()
+            with connection.execute_wrapper(counter):
+                client.post(reverse('login'), {'matric_number': user.matric_number, 'password': 'bench'})
+            # The OTP is delivered out of band; set a known one outside the counted requests
+            User.objects.filter(pk=user.pk).update(otp_code=otp)
+            with connection.execute_wrapper(counter):
+                client.post(reverse('otp_verify'), {'otp': '123456'})
+                client.get(reverse('vote'))
+                response = client.post(reverse('vote_with_election', args=[election.id]), ballot)
+                client.get(response.url)
+
+        ballots = VoterRecord.objects.filter(election=election).count()
+        if ballots != len(users):
+            raise CommandError(f'Only {ballots} of {len(users)} flows ended in a ballot.')
+        return counter, ballots
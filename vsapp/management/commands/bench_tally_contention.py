@@ -0,0 +1,109 @@
+import os
+import random
+import statistics
+import tempfile
+import threading
+import time
+from datetime import timedelta
+
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import OperationalError, connection, transaction
+from django.utils import timezone
+
+from vsapp.models import Election, TallyShard, User
+from vsapp.tallies import compact, increment, totals
+
+
+class Command(BaseCommand):
+    help = 'Measure concurrent increments of one hot tally counter with different shard counts'
+    requires_system_checks = []
+
+    def add_arguments(self, parser):
+        parser.add_argument('--increments', type=int, default=4000, help='Increments per shard setting')
+        parser.add_argument('--threads', type=int, default=16)
+        parser.add_argument('--shards', type=int, nargs='+', default=[1, 8])
+        parser.add_argument('--hold', type=float, default=0.0,
+                            help='Seconds to keep each transaction open after the increment, like other ballot work')
+
+    def handle(self, *args, **options):
+        # SQLite runs on scratch files; elsewhere a throwaway draft election is
+        # created in the configured database and deleted again
+        scratch = connection.vendor == 'sqlite'
+        original_name = connection.settings_dict['NAME']
+        self.stdout.write(
+            f"{options['increments']} increments of one counter, {options['threads']} threads, {connection.vendor}"
+        )
+        self.stdout.write(f"{'shards':>6}{'inc/s':>10}{'p50 ms':>9}{'p99 ms':>9}{'errors':>8}{'rows':>6}{'total':>8}")
+        try:
+            with tempfile.TemporaryDirectory() as tmp:
+                for shards in options['shards']:
+                    if scratch:
+                        connection.close()
+                        connection.settings_dict['NAME'] = os.path.join(tmp, f'tally-{shards}.sqlite3')
+                        call_command('migrate', verbosity=0)
+                    result = self._run(shards, options)
+                    self.stdout.write(
+                        f"{shards:>6}{result['rate']:>10.0f}{result['p50'] * 1000:>9.1f}{result['p99'] * 1000:>9.1f}"
+                        f"{result['errors']:>8}{result['rows']:>6}{result['total']:>8}"
+                    )
+        finally:
+            connection.close()
+            connection.settings_dict['NAME'] = original_name
+
+    def _run(self, shards, options):
+        now = timezone.now()
+        admin, _ = User.objects.get_or_create(username='bench-tally-admin', defaults={'user_type': 'admin'})
+        election = Election.objects.create(
+            title=f'Tally benchmark ({shards} shards)', description='', start_date=now - timedelta(hours=1),
+            end_date=now + timedelta(hours=1), status='draft', created_by=admin,
+        )
+        counts = {(election.pk, 1): 1}
+        latencies, errors = [], []
+        lock = threading.Lock()
+
+        def worker(n):
+            rng = random.Random()
+            mine, failed = [], 0
+            for _ in range(n):
+                started = time.perf_counter()
+                try:
+                    with transaction.atomic():
+                        increment(counts, shards=shards, rng=rng)
+                        if options['hold']:
+                            time.sleep(options['hold'])
+                except OperationalError:  # Lock wait timed out
+                    failed += 1
+                    continue
+                mine.append(time.perf_counter() - started)
+            connection.close()
+            with lock:
+                latencies.extend(mine)
+                errors.append(failed)
+
+        per_thread = options['increments'] // options['threads']
+        threads = [threading.Thread(target=worker, args=(per_thread,)) for _ in range(options['threads'])]
+        started = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - started
+
+        rows = TallyShard.objects.filter(election=election).count()
+        total = totals(election).get(1, 0)
+        if total != len(latencies):
+            raise CommandError(f'{shards} shards: {len(latencies)} increments committed but the counter reads {total}.')
+        compact(election)
+        if TallyShard.objects.filter(election=election).count() != 1 or totals(election)[1] != total:
+            raise CommandError('Compaction changed the counter.')
+        election.delete()
+        quantiles = statistics.quantiles(latencies, n=100) if len(latencies) > 1 else [0] * 99
+        return {
+            'rate': len(latencies) / elapsed,
+            'p50': quantiles[49],
+            'p99': quantiles[98],
+            'errors': sum(errors),
+            'rows': rows,
+            'total': total,
+        }
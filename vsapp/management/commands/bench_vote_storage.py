@@ -0,0 +1,112 @@
+import hashlib
+import os
+import random
+import sqlite3
+import tempfile
+import time
+import uuid
+from datetime import datetime, timedelta
+
+from django.core.management.base import BaseCommand
+
+# Vote table layouts as Django creates them on SQLite, before and after the
+# compact schema migration (0004_compact_vote_storage).
+LAYOUTS = {
+    'legacy': {
+        'table': (
+            'CREATE TABLE vote (id char(32) NOT NULL PRIMARY KEY, vote_hash varchar(256) NOT NULL UNIQUE, '
+            'timestamp datetime NOT NULL, ip_address char(39) NULL, '
+            'candidate_id char(32) NOT NULL, election_id char(32) NOT NULL)'
+        ),
+        'indexes': [
+            'CREATE INDEX vote_election_candidate ON vote (election_id, candidate_id)',
+            'CREATE INDEX vote_candidate_timestamp ON vote (candidate_id, timestamp)',
+            'CREATE INDEX vote_hash_idx ON vote (vote_hash)',
+        ],
+        'insert': 'INSERT INTO vote (id, vote_hash, timestamp, ip_address, candidate_id, election_id) VALUES (?, ?, ?, ?, ?, ?)',
+    },
+    'compact': {
+        'table': (
+            'CREATE TABLE vote (id integer NOT NULL PRIMARY KEY AUTOINCREMENT, vote_hash BLOB NOT NULL UNIQUE, '
+            'timestamp datetime NOT NULL, ip_address char(39) NULL, '
+            'candidate_id char(32) NOT NULL, election_id char(32) NOT NULL)'
+        ),
+        'indexes': [
+            'CREATE INDEX vote_election_candidate ON vote (election_id, candidate_id)',
+            'CREATE INDEX vote_candidate_timestamp ON vote (candidate_id, timestamp)',
+        ],
+        'insert': 'INSERT INTO vote (vote_hash, timestamp, ip_address, candidate_id, election_id) VALUES (?, ?, ?, ?, ?)',
+    },
+}
+
+
+class Command(BaseCommand):
+    help = 'Compare size and speed of the legacy and compact Vote table layouts on SQLite'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=200000, help='Number of votes to insert')
+        parser.add_argument('--candidates', type=int, default=30, help='Number of candidates in the election')
+        parser.add_argument('--lookups', type=int, default=2000, help='Number of hash lookups to time')
+        parser.add_argument('--seed', type=int, default=1)
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+        election_id = uuid.UUID(int=rng.getrandbits(128)).hex
+        candidate_ids = [uuid.UUID(int=rng.getrandbits(128)).hex for _ in range(options['candidates'])]
+        start = datetime(2025, 1, 1, 8, 0)
+        ballots = [
+            (
+                hashlib.sha256(f"{options['seed']}-{i}".encode()).digest(),
+                (start + timedelta(milliseconds=i * 50)).isoformat(' '),
+                f'10.0.{i % 256}.{(i // 256) % 256}',
+                rng.choice(candidate_ids),
+            )
+            for i in range(options['rows'])
+        ]
+        probes = [ballot[0] for ballot in rng.sample(ballots, min(options['lookups'], len(ballots)))]
+
+        self.stdout.write(f"{options['rows']} votes, {options['candidates']} candidates")
+        self.stdout.write(f"{'layout':<10}{'size (MiB)':>12}{'bytes/vote':>12}{'insert (s)':>12}{'tally (ms)':>12}{'lookup (us)':>13}")
+        for name, layout in LAYOUTS.items():
+            result = self._run(layout, name, ballots, election_id, probes)
+            self.stdout.write(
+                f"{name:<10}{result['size'] / 2 ** 20:>12.2f}{result['size'] / len(ballots):>12.1f}"
+                f"{result['insert']:>12.2f}{result['tally'] * 1000:>12.1f}{result['lookup'] * 1e6:>13.1f}"
+            )
+
+    def _run(self, layout, name, ballots, election_id, probes):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, f'{name}.sqlite3')
+            db = sqlite3.connect(path)
+            db.execute(layout['table'])
+            for statement in layout['indexes']:
+                db.execute(statement)
+
+            if name == 'legacy':
+                rows = [(uuid.uuid4().hex, digest.hex(), ts, ip, cand, election_id) for digest, ts, ip, cand in ballots]
+                as_key = bytes.hex
+            else:
+                rows = [(digest, ts, ip, cand, election_id) for digest, ts, ip, cand in ballots]
+                as_key = bytes
+
+            started = time.perf_counter()
+            with db:
+                db.executemany(layout['insert'], rows)
+            insert = time.perf_counter() - started
+
+            tally_sql = 'SELECT candidate_id, COUNT(*) FROM vote WHERE election_id = ? GROUP BY candidate_id'
+            started = time.perf_counter()
+            for _ in range(5):
+                db.execute(tally_sql, [election_id]).fetchall()
+            tally = (time.perf_counter() - started) / 5
+
+            started = time.perf_counter()
+            for probe in probes:
+                db.execute('SELECT 1 FROM vote WHERE vote_hash = ?', [as_key(probe)]).fetchone()
+            lookup = (time.perf_counter() - started) / max(1, len(probes))
+
+            db.execute('VACUUM')
+            page_size = db.execute('PRAGMA page_size').fetchone()[0]
+            page_count = db.execute('PRAGMA page_count').fetchone()[0]
+            db.close()
+        return {'size': page_size * page_count, 'insert': insert, 'tally': tally, 'lookup': lookup}
@@ -0,0 +1,38 @@
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+from vsapp.images import generate_photo_variants
+from vsapp.models import Candidate
+
+
+class Command(BaseCommand):
+    help = 'Generate resized WebP/JPEG variants for candidate photos that do not have them yet'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--force', action='store_true', help='Re-render variants for every photo')
+        parser.add_argument('--workers', type=int, default=4, help='Number of photos processed in parallel')
+
+    def handle(self, *args, **options):
+        candidates = [
+            candidate for candidate in Candidate.objects.exclude(photo='')
+            if options['force'] or candidate.photo_variants.get('source') != candidate.photo.name
+        ]
+        if not candidates:
+            self.stdout.write('All candidate photos already have variants.')
+            return
+
+        def build(candidate):
+            try:
+                return generate_photo_variants(candidate, force=options['force'])
+            finally:
+                connections.close_all()
+
+        with ThreadPoolExecutor(max_workers=max(1, options['workers'])) as pool:
+            results = list(pool.map(build, candidates))
+
+        failed = sum(1 for variants in results if set(variants) == {'source'})
+        self.stdout.write(self.style.SUCCESS(f'Built variants for {len(candidates) - failed} photo(s)'))
+        if failed:
+            self.stdout.write(self.style.WARNING(f'{failed} photo(s) could not be decoded; the originals will be served'))
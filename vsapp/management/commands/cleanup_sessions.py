@@ -0,0 +1,42 @@
+import time
+
+from django.contrib.sessions.models import Session
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+
+class Command(BaseCommand):
+    help = 'Delete expired database sessions in small batches, stopping after a time or batch budget'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000, help='Sessions deleted per transaction')
+        parser.add_argument('--max-batches', type=int, default=100, help='Stop after this many batches (0: no limit)')
+        parser.add_argument('--max-seconds', type=float, default=60.0, help='Stop after this long (0: no limit)')
+        parser.add_argument('--pause', type=float, default=0.05,
+                            help='Seconds to sleep between batches so other writers get the lock')
+
+    def handle(self, *args, **options):
+        now = timezone.now()  # Fixed, so sessions expiring during the run wait for the next one
+        started = time.monotonic()
+        deleted = batches = 0
+        while True:
+            # One DELETE ... WHERE session_key IN (SELECT ... LIMIT n) per batch, so the
+            # write lock is held for one short statement and never upgraded from a read
+            expired = Session.objects.filter(expire_date__lt=now).values('session_key')
+            count, _ = Session.objects.filter(session_key__in=expired[:options['batch_size']]).delete()
+            deleted += count
+            batches += 1
+            if count < options['batch_size']:
+                break
+            if options['max_batches'] and batches >= options['max_batches']:
+                break
+            if options['max_seconds'] and time.monotonic() - started >= options['max_seconds']:
+                break
+            time.sleep(options['pause'])
+
+        remaining = Session.objects.filter(expire_date__lt=now).count()
+        message = f'Deleted {deleted} expired sessions in {batches} batches ({time.monotonic() - started:.1f}s).'
+        if remaining:
+            self.stdout.write(self.style.WARNING(f'{message} {remaining} remain; run again to continue.'))
+        else:
+            self.stdout.write(self.style.SUCCESS(message))
@@ -0,0 +1,36 @@
+from django.core.exceptions import ValidationError
+from django.core.management.base import BaseCommand, CommandError
+
+from vsapp.models import Election, TallyShard
+from vsapp.tallies import compact, rebuild
+from vsapp.turnout import rebuild as rebuild_turnout
+
+
+class Command(BaseCommand):
+    help = 'Fold sharded tally counters into one row each, or rebuild them from the vote ledger'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--election', help='Only this election (default: all)')
+        parser.add_argument('--rebuild', action='store_true',
+                            help='Recompute the counters and turnout rollups from votes and voter records instead')
+
+    def handle(self, *args, **options):
+        election = None
+        if options['election']:
+            try:
+                election = Election.objects.get(id=options['election'])
+            except (Election.DoesNotExist, ValidationError):
+                raise CommandError(f"Election {options['election']} not found.")
+
+        if options['rebuild']:
+            for target in [election] if election else Election.objects.all():
+                counts = rebuild(target)
+                rebuild_turnout(target)
+                self.stdout.write(
+                    f'{target.title}: {len(counts) - 1} candidate counters, {counts[TallyShard.BALLOTS]} ballots'
+                )
+            self.stdout.write(self.style.SUCCESS('Tallies and turnout rebuilt from the ledger.'))
+            return
+
+        removed = compact(election)
+        self.stdout.write(self.style.SUCCESS(f'Compacted tallies: {removed} shard rows folded away.'))
@@ -0,0 +1,200 @@
+import json
+import time
+
+from django.core.management.base import BaseCommand
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import DatabaseError, connection
+from django.db.models import Count, Exists, F, OuterRef
+
+from vsapp.models import (
+    AuditLog, Candidate, Election, EligibleVoter, IPAddress, Position, ResultSnapshot, SystemSetting, TallyShard,
+    TurnoutRollup, User, UserAgent, Vote, VoterRecord,
+)
+
+MODELS = [
+    User, Election, Position, Candidate, Vote, VoterRecord, TallyShard, TurnoutRollup, EligibleVoter, AuditLog,
+    UserAgent, IPAddress, ResultSnapshot, SystemSetting,
+]
+
+
+def _grouped(queryset, key):
+    return {row[key]: row['n'] for row in queryset.values(key).annotate(n=Count('pk')).order_by()}
+
+
+def table_sizes():
+    """Row counts per table, plus on-disk bytes for tables and indexes where SQLite exposes them"""
+    sizes = {}
+    if connection.vendor == 'sqlite':
+        try:
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    'SELECT m.tbl_name, d.name = m.tbl_name, SUM(d.pgsize) FROM dbstat d '
+                    'JOIN sqlite_master m ON m.name = d.name GROUP BY 1, 2'
+                )
+                for table, is_table, size in cursor.fetchall():
+                    sizes[(table, bool(is_table))] = size
+        except DatabaseError:
+            pass  # SQLite built without the dbstat virtual table
+
+    tables = []
+    for model in MODELS:
+        table = model._meta.db_table
+        tables.append({
+            'table': table,
+            'rows': model.objects.count(),
+            'bytes': sizes.get((table, True)) if sizes else None,
+            'index_bytes': sizes.get((table, False), 0) if sizes else None,
+        })
+    return tables
+
+
+def election_counts():
+    """Per-election totals from one grouped query per table"""
+    positions = _grouped(Position.objects.all(), 'election')
+    candidates = _grouped(Candidate.objects.all(), 'position__election')
+    votes = _grouped(Vote.objects.all(), 'election')
+    records = _grouped(VoterRecord.objects.all(), 'election')
+    return [
+        {
+            'id': election['id'],
+            'title': election['title'],
+            'status': election['status'],
+            'positions': positions.get(election['id'], 0),
+            'candidates': candidates.get(election['id'], 0),
+            'votes': votes.get(election['id'], 0),
+            'voter_records': records.get(election['id'], 0),
+        }
+        for election in Election.objects.values('id', 'title', 'status')
+    ]
+
+
+def consistency_checks(elections):
+    """Ledger and bookkeeping problems that the schema cannot rule out on its own"""
+    records = {e['id']: e['voter_records'] for e in elections}
+    votes = {e['id']: e['votes'] for e in elections}
+    checks = {}
+
+    # Ballots cannot be tied to voters, so compare per-position vote counts with
+    # the most the recorded voters could have cast there.
+    position_votes = (
+        Vote.objects.values('election', 'candidate__position', 'candidate__position__title',
+                            'candidate__position__max_votes')
+        .annotate(n=Count('pk'))
+        .order_by()
+    )
+    checks['ballots_without_voter_records'] = [
+        {
+            'election': row['election'],
+            'position': row['candidate__position__title'],
+            'votes': row['n'],
+            'voter_records': records.get(row['election'], 0),
+        }
+        for row in position_votes
+        if row['n'] > records.get(row['election'], 0) * max(1, row['candidate__position__max_votes'])
+    ]
+    # Every voter record implies at least one vote in its election
+    checks['voter_records_without_ballots'] = [
+        {'election': election_id, 'voter_records': count, 'votes': votes.get(election_id, 0)}
+        for election_id, count in records.items()
+        if count > votes.get(election_id, 0)
+    ]
+
+    has_record = Exists(VoterRecord.objects.filter(voter=OuterRef('pk')))
+    voters = User.objects.filter(user_type='voter')
+    checks['has_voted_drift'] = {
+        'flagged_without_record': voters.filter(has_voted=True).exclude(has_record).count(),
+        'record_without_flag': voters.filter(has_record, has_voted=False).count(),
+    }
+
+    candidate_table = Candidate._meta.db_table
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'SELECT COUNT(*) FROM {candidate_table} c '
+            f'LEFT JOIN {Position._meta.db_table} p ON p.id = c.position_id '
+            f'LEFT JOIN {User._meta.db_table} u ON u.id = c.user_id '
+            'WHERE p.id IS NULL OR u.id IS NULL'
+        )
+        orphaned_candidates = cursor.fetchone()[0]
+        cursor.execute(
+            f'SELECT COUNT(*) FROM {Vote._meta.db_table} v '
+            f'LEFT JOIN {candidate_table} c ON c.id = v.candidate_id WHERE c.id IS NULL'
+        )
+        orphaned_votes = cursor.fetchone()[0]
+    checks['orphaned_candidates'] = orphaned_candidates
+    checks['orphaned_votes'] = orphaned_votes
+    checks['votes_with_mismatched_election'] = (
+        Vote.objects.exclude(election=F('candidate__position__election')).count()
+    )
+    return checks
+
+
+def problem_count(checks):
+    return (
+        len(checks['ballots_without_voter_records'])
+        + len(checks['voter_records_without_ballots'])
+        + sum(checks['has_voted_drift'].values())
+        + checks['orphaned_candidates']
+        + checks['orphaned_votes']
+        + checks['votes_with_mismatched_election']
+    )
+
+
+class Command(BaseCommand):
+    help = 'Report table sizes, per-election counts and consistency problems using aggregate queries'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--json', action='store_true', help='Print the report as JSON')
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        elections = election_counts()
+        report = {
+            'tables': table_sizes(),
+            'elections': elections,
+            'checks': consistency_checks(elections),
+        }
+        report['problems'] = problem_count(report['checks'])
+        report['seconds'] = round(time.perf_counter() - started, 3)
+
+        if options['json']:
+            self.stdout.write(json.dumps(report, cls=DjangoJSONEncoder, indent=2))
+        else:
+            self._print(report)
+
+    def _print(self, report):
+        self.stdout.write(self.style.MIGRATE_HEADING('Tables'))
+        for table in report['tables']:
+            size = ''
+            if table['bytes'] is not None:
+                size = f"  {table['bytes'] / 2 ** 20:8.2f} MiB data  {table['index_bytes'] / 2 ** 20:8.2f} MiB indexes"
+            self.stdout.write(f"  {table['table']:<28}{table['rows']:>12} rows{size}")
+
+        self.stdout.write(self.style.MIGRATE_HEADING('Elections'))
+        for e in report['elections']:
+            self.stdout.write(
+                f"  {e['title']} [{e['status']}] {e['id']}: {e['positions']} positions, "
+                f"{e['candidates']} candidates, {e['votes']} votes, {e['voter_records']} voter records"
+            )
+
+        self.stdout.write(self.style.MIGRATE_HEADING('Consistency'))
+        checks = report['checks']
+        for row in checks['ballots_without_voter_records']:
+            self.stdout.write(self.style.ERROR(
+                f"  {row['position']} in {row['election']}: {row['votes']} votes but only "
+                f"{row['voter_records']} voter records"
+            ))
+        for row in checks['voter_records_without_ballots']:
+            self.stdout.write(self.style.ERROR(
+                f"  {row['election']}: {row['voter_records']} voter records but {row['votes']} votes"
+            ))
+        drift = checks['has_voted_drift']
+        self.stdout.write(
+            f"  has_voted drift: {drift['flagged_without_record']} flagged without a record, "
+            f"{drift['record_without_flag']} with a record but not flagged"
+        )
+        self.stdout.write(f"  orphaned candidates: {checks['orphaned_candidates']}")
+        self.stdout.write(f"  orphaned votes: {checks['orphaned_votes']}")
+        self.stdout.write(f"  votes filed under the wrong election: {checks['votes_with_mismatched_election']}")
+
+        style = self.style.SUCCESS if not report['problems'] else self.style.WARNING
+        self.stdout.write(style(f"{report['problems']} problem(s) found in {report['seconds']}s"))
@@ -0,0 +1,77 @@
+from django.core.exceptions import ValidationError
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.db.models import Count
+from django.test.utils import CaptureQueriesContext
+
+from vsapp.models import Candidate, Election, Position, User, Vote, VoterRecord
+
+
+def _hot_paths(election, position, voter):
+    """(label, callable) pairs for the queries on the voting and results paths"""
+    return [
+        ('results: vote tally per candidate',
+         lambda: list(Vote.objects.filter(election=election).values('candidate').annotate(n=Count('id')).order_by())),
+        ('results: election vote total',
+         lambda: Vote.objects.filter(election=election).count()),
+        ('results: candidates by position',
+         lambda: list(Candidate.objects.filter(position=position))),
+        ('results: ledger hashes in order',
+         lambda: list(Vote.objects.filter(election=election).order_by('vote_hash').values_list('vote_hash', flat=True)[:1])),
+        ('voting: voter record lookup',
+         lambda: VoterRecord.objects.filter(voter=voter, election=election).exists()),
+        ('turnout: eligible voter count',
+         lambda: User.objects.filter(user_type='voter', is_active=True).count()),
+        ('turnout: ballots cast',
+         lambda: VoterRecord.objects.filter(election=election).count()),
+    ]
+
+
+class Command(BaseCommand):
+    help = 'Print the query plan of every hot query on the voting and results paths'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--election', help='Election id to plan against (defaults to the latest election)')
+        parser.add_argument('--sql', action='store_true', help='Also print the SQL of each query')
+        parser.add_argument('--fail-on-scan', action='store_true',
+                            help='Exit with an error if any plan contains a full table scan')
+
+    def handle(self, *args, **options):
+        if options['election']:
+            try:
+                election = Election.objects.get(id=options['election'])
+            except (Election.DoesNotExist, ValidationError):
+                raise CommandError(f"Election {options['election']} not found.")
+        else:
+            # Plans do not depend on the row existing, so an empty database still works
+            election = Election.objects.order_by('-created_at').first() or Election(title='(none)')
+        position = Position.objects.filter(election=election).first() if election.pk else None
+        position = position or Position(election=election)
+        voter = User.objects.filter(user_type='voter').first() or User(pk=0)
+
+        explain = 'EXPLAIN QUERY PLAN' if connection.vendor == 'sqlite' else 'EXPLAIN'
+        scans = []
+        for label, run in _hot_paths(election, position, voter):
+            with CaptureQueriesContext(connection) as ctx:
+                run()
+            self.stdout.write(self.style.MIGRATE_HEADING(label))
+            for query in ctx.captured_queries:
+                if options['sql']:
+                    self.stdout.write(f"  {query['sql']}")
+                with connection.cursor() as cursor:
+                    cursor.execute(f"{explain} {query['sql']}")
+                    rows = cursor.fetchall()
+                for row in rows:
+                    detail = row[-1]
+                    line = f'    {detail}'
+                    if connection.vendor == 'sqlite' and detail.startswith('SCAN') and 'INDEX' not in detail:
+                        scans.append(label)
+                        line = self.style.WARNING(line)
+                    self.stdout.write(line)
+
+        if scans:
+            self.stdout.write(self.style.WARNING(f'{len(scans)} full table scan(s): {", ".join(sorted(set(scans)))}'))
+            if options['fail_on_scan']:
+                raise CommandError('Hot queries perform full table scans.')
+        else:
+            self.stdout.write(self.style.SUCCESS('No full table scans on hot paths.'))
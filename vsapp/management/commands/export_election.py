@@ -0,0 +1,39 @@
+import os
+import time
+
+from django.core.exceptions import ValidationError
+from django.core.management.base import BaseCommand, CommandError
+
+from vsapp.archive import DEFAULT_CHUNK_SIZE, export_election
+from vsapp.models import Election
+
+
+class Command(BaseCommand):
+    help = 'Write an election with its ballots, voter records, audit entries and photos to a compressed archive'
+
+    def add_arguments(self, parser):
+        parser.add_argument('election_id', help='UUID of the election to export')
+        parser.add_argument('-o', '--output', help='Archive path (default: election-<id>.zip)')
+        parser.add_argument('--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE, help='Rows per archive chunk')
+
+    def handle(self, *args, **options):
+        try:
+            election = Election.objects.get(id=options['election_id'])
+        except (Election.DoesNotExist, ValidationError):
+            raise CommandError(f"Election {options['election_id']} not found.")
+        self.verbosity = options['verbosity']
+        path = options['output'] or f'election-{election.id}.zip'
+
+        started = time.perf_counter()
+        manifest = export_election(election, path, chunk_size=options['chunk_size'], progress=self._progress)
+        for table, spec in manifest['tables'].items():
+            self.stdout.write(f"  {table:<18}{spec['rows']:>10} rows in {len(spec['chunks'])} chunk(s)")
+        self.stdout.write(f"  {'photos':<18}{len(manifest['media']):>10}")
+        self.stdout.write(self.style.SUCCESS(
+            f'Exported {election.title} to {path} ({os.path.getsize(path) / 2 ** 20:.2f} MiB) '
+            f'in {time.perf_counter() - started:.1f}s'
+        ))
+
+    def _progress(self, table, rows):
+        if self.verbosity > 1:
+            self.stdout.write(f'  {table}: {rows} rows')
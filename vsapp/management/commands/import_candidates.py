@@ -0,0 +1,50 @@
+import time
+import zipfile
+
+from django.core.exceptions import ValidationError
+from django.core.management.base import BaseCommand, CommandError
+
+from vsapp.audit import audit_entry
+from vsapp.models import AuditLog, Election
+from vsapp.nominations import DEFAULT_WORKERS, NominationError, import_candidates, open_csv, read_rows
+
+
+class Command(BaseCommand):
+    help = 'Add candidates to an election from a CSV file and an optional zip of photos'
+
+    def add_arguments(self, parser):
+        parser.add_argument('election_id', help='Election to add the candidates to')
+        parser.add_argument('csv', help='CSV with matric_number and position columns, and optionally '
+                                        'full_name, department, level, manifesto and photo')
+        parser.add_argument('--photos', help='Zip of the photos named in the photo column')
+        parser.add_argument('--workers', type=int, default=DEFAULT_WORKERS, help='Threads storing and resizing photos')
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        try:
+            election = Election.objects.get(id=options['election_id'])
+        except (Election.DoesNotExist, ValidationError):
+            raise CommandError(f"Election {options['election_id']} does not exist.")
+
+        try:
+            with open(options['csv'], 'rb') as handle:
+                rows = read_rows(open_csv(handle))
+            photos = zipfile.ZipFile(options['photos']) if options['photos'] else None
+            try:
+                counts = import_candidates(election, rows, photos, workers=options['workers'])
+            finally:
+                if photos:
+                    photos.close()
+        except NominationError as exc:
+            raise CommandError('The import was rejected:\n' + '\n'.join(f'  {error}' for error in exc.errors))
+        except (OSError, UnicodeDecodeError, zipfile.BadZipFile) as exc:
+            raise CommandError(str(exc))
+
+        audit_entry(
+            AuditLog.Event.CANDIDATES_IMPORTED, object_id=election.id, title=election.title,
+            candidates=counts['candidates'], positions=counts['positions'],
+        ).save()
+        self.stdout.write(self.style.SUCCESS(
+            f"Imported {counts['candidates']} candidates, {counts['positions']} new positions and "
+            f"{counts['photos']} photos into {election.title} in {time.perf_counter() - started:.1f}s"
+        ))
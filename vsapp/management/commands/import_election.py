@@ -0,0 +1,33 @@
+import time
+import zipfile
+
+from django.core.management.base import BaseCommand, CommandError
+
+from vsapp.archive import DEFAULT_CHUNK_SIZE, ArchiveError, import_election
+
+
+class Command(BaseCommand):
+    help = 'Load an election archive written by export_election'
+
+    def add_arguments(self, parser):
+        parser.add_argument('archive', help='Path to the archive')
+        parser.add_argument('--replace', action='store_true', help='Delete and replace the election if it already exists')
+        parser.add_argument('--batch-size', type=int, default=DEFAULT_CHUNK_SIZE, help='Rows per bulk insert')
+
+    def handle(self, *args, **options):
+        self.verbosity = options['verbosity']
+        started = time.perf_counter()
+        try:
+            election = import_election(
+                options['archive'], replace=options['replace'], batch_size=options['batch_size'],
+                progress=self._progress,
+            )
+        except (ArchiveError, OSError, zipfile.BadZipFile) as exc:
+            raise CommandError(str(exc))
+        self.stdout.write(self.style.SUCCESS(
+            f'Imported {election.title} ({election.id}) in {time.perf_counter() - started:.1f}s'
+        ))
+
+    def _progress(self, table, rows):
+        if self.verbosity > 1:
+            self.stdout.write(f'  {table}: {rows} rows')
@@ -0,0 +1,18 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from vsapp.search import fts_enabled, rebuild_index
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the candidate full-text search index from the candidate tables'
+
+    def handle(self, *args, **options):
+        if not fts_enabled():
+            raise CommandError('The search index needs SQLite FTS5; other databases search with icontains.')
+        started = time.perf_counter()
+        count = rebuild_index()
+        self.stdout.write(self.style.SUCCESS(
+            f'Indexed {count} candidate(s) in {time.perf_counter() - started:.2f}s'
+        ))
@@ -0,0 +1,68 @@
+import json
+import os
+import time
+
+from django.core.exceptions import ValidationError
+from django.core.management.base import BaseCommand, CommandError
+
+from vsapp.models import Election
+from vsapp.recount import DEFAULT_RANGE_SIZE, recount, sign_report, verify_report
+
+
+class Command(BaseCommand):
+    help = 'Recount an election from the vote ledger and report every stored total that disagrees, signed'
+
+    def add_arguments(self, parser):
+        parser.add_argument('election_id', nargs='?', help='UUID of the election to recount')
+        parser.add_argument('--workers', type=int, default=os.cpu_count() or 1, help='Counting processes')
+        parser.add_argument('--range-size', type=int, default=DEFAULT_RANGE_SIZE, help='Vote ids per work unit')
+        parser.add_argument('-o', '--output', help='Write the signed JSON report here')
+        parser.add_argument('--verify', metavar='REPORT', help='Check the signature of a saved report and exit')
+
+    def handle(self, *args, **options):
+        if options['verify']:
+            with open(options['verify']) as f:
+                report = json.load(f)
+            if not verify_report(report):
+                raise CommandError(f"{options['verify']}: signature does not match.")
+            self.stdout.write(self.style.SUCCESS(
+                f"{options['verify']}: signature valid ({report['election']['title']}, {report['generated_at']})."
+            ))
+            return
+
+        if not options['election_id']:
+            raise CommandError('Give an election id, or --verify a report.')
+        try:
+            election = Election.objects.get(id=options['election_id'])
+        except (Election.DoesNotExist, ValidationError):
+            raise CommandError(f"Election {options['election_id']} not found.")
+
+        started = time.perf_counter()
+        report = recount(election, workers=options['workers'], range_size=options['range_size'])
+        elapsed = time.perf_counter() - started
+
+        self.stdout.write(f"{election.title} ({election.status})")
+        for position in report['positions']:
+            self.stdout.write(self.style.MIGRATE_HEADING(f"  {position['title']}: {position['votes']} votes"))
+            for candidate in position['candidates']:
+                self.stdout.write(f"    {candidate['ordinal']:>4}  {candidate['full_name']:<40}{candidate['votes']:>10}")
+        self.stdout.write(
+            f"  {report['total_votes']} votes, {report['ballots']} ballots, ledger root {report['ledger_root']}"
+        )
+
+        signed = sign_report(report)
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                f.write(signed)
+            self.stdout.write(f"  Signed report written to {options['output']}")
+        else:
+            self.stdout.write(f"  Signature {json.loads(signed)['signature']}")
+
+        if report['differences']:
+            for diff in report['differences']:
+                delta = f" ({diff['delta']:+d})" if 'delta' in diff else ''
+                self.stdout.write(self.style.ERROR(
+                    f"  {diff['subject']}: {diff['source']} has {diff['recorded']}, recount has {diff['recount']}{delta}"
+                ))
+            raise CommandError(f"Recount found {len(report['differences'])} difference(s) in {elapsed:.1f}s.")
+        self.stdout.write(self.style.SUCCESS(f'Recount matches every stored total ({elapsed:.1f}s).'))
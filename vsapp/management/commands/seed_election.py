@@ -0,0 +1,287 @@
+import base64
+import bisect
+import hashlib
+import itertools
+import random
+import time
+import uuid
+from datetime import timedelta
+
+from django.contrib.auth.hashers import make_password
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.utils import timezone
+
+from vsapp.archive import explicit_timestamps
+from vsapp.audit import intern_values
+from vsapp.eligibility import freeze_roll
+from vsapp.models import AuditLog, Candidate, Election, IPAddress, Position, User, UserAgent, Vote, VoterRecord
+from vsapp.search import rebuild_index
+from vsapp.tallies import rebuild as rebuild_tallies
+from vsapp.turnout import rebuild as rebuild_turnout
+
+DEPARTMENTS = [
+    'Computer Science', 'Electrical Engineering', 'Mechanical Engineering', 'Medicine', 'Law',
+    'Economics', 'Accounting', 'Mass Communication', 'Microbiology', 'Architecture',
+    'Political Science', 'English', 'Physics', 'Chemistry', 'Mathematics', 'Pharmacy',
+]
+LEVELS = ['100', '200', '300', '400', '500']
+POSITION_TITLES = [
+    'President', 'Vice President', 'General Secretary', 'Assistant General Secretary',
+    'Financial Secretary', 'Treasurer', 'Director of Socials', 'Director of Sports',
+    'Director of Welfare', 'Public Relations Officer', 'Director of Transport', 'Librarian',
+]
+FIRST_NAMES = ['Ada', 'Tunde', 'Chioma', 'Ibrahim', 'Ngozi', 'Segun', 'Aisha', 'Emeka', 'Funke', 'Musa',
+               'Zainab', 'Kelechi', 'Bola', 'Yusuf', 'Amaka', 'Dapo', 'Halima', 'Obinna', 'Temi', 'Sani']
+LAST_NAMES = ['Okafor', 'Adeyemi', 'Bello', 'Eze', 'Ogunleye', 'Abubakar', 'Nwosu', 'Balogun', 'Okeke',
+              'Lawal', 'Ibe', 'Afolabi', 'Danjuma', 'Chukwu', 'Olawale', 'Umar', 'Nnaji', 'Akande']
+USER_AGENTS = [
+    'Mozilla/5.0 (Linux; Android 13; SM-A135F) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0 Mobile Safari/537.36',
+    'Mozilla/5.0 (iPhone; CPU iPhone OS 17_1 like Mac OS X) AppleWebKit/605.1.15 (KHTML, like Gecko) Version/17.1 Mobile/15E148 Safari/604.1',
+    'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0 Safari/537.36',
+    'Mozilla/5.0 (Linux; Android 12; TECNO KG5) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/119.0 Mobile Safari/537.36',
+]
+MANIFESTO_WORDS = (
+    'students welfare hostel water electricity transport library wifi security sports clean '
+    'transparent accountable union budget scholarship exams lecturers feedback cafeteria prices '
+    'health clinic safety night buses internships careers fair mentorship clubs culture week '
+    'accessible inclusive disabled representation faculty department congress open meetings '
+    'reports spending audit digital portal complaints response time'
+).split()
+SEED_PASSWORD = 'password'
+
+
+class Command(BaseCommand):
+    help = (
+        'Generate a large synthetic election with voters, candidates, ballots, voter records '
+        'and audit history. Output is deterministic for a given --seed. '
+        f'Seeded voters log in with the password "{SEED_PASSWORD}".'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--voters', type=int, default=20000)
+        parser.add_argument('--positions', type=int, default=24)
+        parser.add_argument('--max-candidates', type=int, default=5, help='Candidates per position, at most')
+        parser.add_argument('--turnout', type=float, default=0.65, help='Fraction of voters who cast a ballot')
+        parser.add_argument('--abstain', type=float, default=0.05, help='Chance a voter skips a given position')
+        parser.add_argument('--hours', type=int, default=10, help='Length of the voting window')
+        parser.add_argument('--status', choices=['active', 'closed'], default='active')
+        parser.add_argument('--title', help='Election title (default: "Synthetic Election <seed>")')
+        parser.add_argument('--seed', type=int, default=1)
+        parser.add_argument('--chunk-size', type=int, default=5000)
+
+    def handle(self, *args, **options):
+        if not 0 <= options['turnout'] <= 1 or not 0 <= options['abstain'] < 1:
+            raise CommandError('--turnout and --abstain must be fractions.')
+        if options['max_candidates'] < 2 or options['max_candidates'] > options['voters']:
+            raise CommandError('--max-candidates must be at least 2 and at most --voters.')
+
+        self.rng = random.Random(options['seed'])
+        self.chunk_size = options['chunk_size']
+        started = time.perf_counter()
+
+        voters = self._voters(options)
+        election, positions = self._election(options, voters)
+        counts = self._ballots(options, election, positions, voters)
+        rebuild_index()  # bulk_create skips the signals that keep search in step
+        rebuild_tallies(election)  # and the counters and rollups commit_ballot maintains
+        rebuild_turnout(election)
+        freeze_roll(election)  # Seeded elections are open to every voter
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Seeded election {election.id} ({election.title}): {len(voters)} voters, "
+            f"{len(positions)} positions, {counts['candidates']} candidates, {counts['ballots']} ballots, "
+            f"{counts['votes']} votes, {counts['audit']} audit entries in {time.perf_counter() - started:.1f}s"
+        ))
+
+    def _uuid(self):
+        return uuid.UUID(int=self.rng.getrandbits(128), version=4)
+
+    def _flush(self, model, batch):
+        model.objects.bulk_create(batch, batch_size=self.chunk_size)
+        batch.clear()
+
+    def _flush_audits(self, audits, ips):
+        """Intern the client addresses of a batch of audit entries, then insert them"""
+        ip_ids = intern_values(IPAddress, ips)
+        for entry, ip in zip(audits, ips):
+            entry.ip_id = ip_ids[ip]
+        self._flush(AuditLog, audits)
+        ips.clear()
+
+    def _mark_voted(self, voter_ids):
+        for offset in range(0, len(voter_ids), 900):
+            User.objects.filter(id__in=voter_ids[offset:offset + 900]).update(has_voted=True)
+        voter_ids.clear()
+
+    def _voters(self, options):
+        """Create the seeded voter population, reusing any from an earlier run"""
+        prefix = f"seed{options['seed']}-"
+        existing = dict(User.objects.filter(username__startswith=prefix).values_list('username', 'id'))
+        password = make_password(SEED_PASSWORD)  # Hashing once keeps PBKDF2 out of the loop
+        batch = []
+        with transaction.atomic():
+            for i in range(options['voters']):
+                username = f'{prefix}{i:06d}'
+                first, last = self.rng.choice(FIRST_NAMES), self.rng.choice(LAST_NAMES)
+                department, level = self.rng.choice(DEPARTMENTS), self.rng.choice(LEVELS)
+                if username in existing:
+                    continue
+                batch.append(User(
+                    username=username,
+                    password=password,
+                    first_name=first,
+                    last_name=last,
+                    matric_number=f"S{options['seed']}/{i:06d}",
+                    department=department,
+                    level=level,
+                    user_type='voter',
+                ))
+                if len(batch) >= self.chunk_size:
+                    self._flush(User, batch)
+            self._flush(User, batch)
+
+        voters = list(
+            User.objects.filter(username__startswith=prefix)
+            .order_by('username')
+            .values_list('id', 'department', 'level')[:options['voters']]
+        )
+        self.stdout.write(f'{len(voters)} voters ready')
+        return voters
+
+    def _election(self, options, voters):
+        """Create the election, its positions and candidates"""
+        creator, _ = User.objects.get_or_create(username='seed-admin', defaults={'user_type': 'admin'})
+        now = timezone.now().replace(microsecond=0)
+        window = timedelta(hours=options['hours'])
+        if options['status'] == 'active':
+            start, end = now - window / 2, now + window / 2
+        else:
+            start, end = now - window - timedelta(days=1), now - timedelta(days=1)
+
+        election_id = self._uuid()
+        if Election.objects.filter(id=election_id).exists():
+            raise CommandError(f"Seed {options['seed']} was already generated as election {election_id}; "
+                               'delete it or pick another --seed.')
+        with transaction.atomic():
+            election = Election.objects.create(
+                id=election_id,
+                title=options['title'] or f"Synthetic Election {options['seed']}",
+                description='Generated by manage.py seed_election',
+                start_date=start,
+                end_date=end,
+                status=options['status'],
+                created_by=creator,
+            )
+            positions = []
+            for order in range(options['positions']):
+                if order < len(POSITION_TITLES):
+                    title = POSITION_TITLES[order]
+                else:
+                    title = f'{self.rng.choice(DEPARTMENTS)} Representative {order}'
+                positions.append(Position(id=self._uuid(), election=election, title=title, order=order))
+            Position.objects.bulk_create(positions)
+
+            candidates = []
+            ordinal = itertools.count(1)
+            for position in positions:
+                size = self.rng.randint(2, options['max_candidates'])
+                for voter_id, department, level in self.rng.sample(voters, size):
+                    candidates.append(Candidate(
+                        id=self._uuid(),
+                        position=position,
+                        user_id=voter_id,
+                        full_name=f'{self.rng.choice(FIRST_NAMES)} {self.rng.choice(LAST_NAMES)}',
+                        department=department,
+                        level=level,
+                        manifesto=' '.join(self.rng.choices(MANIFESTO_WORDS, k=self.rng.randint(40, 160))),
+                        ordinal=next(ordinal),
+                    ))
+            Candidate.objects.bulk_create(candidates, batch_size=self.chunk_size)
+
+        for position in positions:
+            position.seeded_candidates = [c for c in candidates if c.position is position]
+        return election, positions
+
+    def _ballots(self, options, election, positions, voters):
+        """Cast ballots with skewed candidate popularity and an election-day turnout curve"""
+        # Cumulative popularity weights per position; a gamma draw gives front-runners and long tails
+        choices = []
+        for position in positions:
+            weights = [self.rng.gammavariate(0.8, 1.0) for _ in position.seeded_candidates]
+            choices.append((position.seeded_candidates, list(itertools.accumulate(weights))))
+
+        start, window = election.start_date, election.end_date - election.start_date
+        if election.status == 'active':
+            window = min(window, timezone.now() - start)
+        seconds = window.total_seconds()
+
+        counts = {'candidates': sum(len(c) for c, _ in choices), 'ballots': 0, 'votes': 0, 'audit': 0}
+        votes, records, audits, audit_ips, voted_ids = [], [], [], [], []
+        agent_ids = intern_values(UserAgent, USER_AGENTS)
+        with explicit_timestamps(
+            Vote._meta.get_field('timestamp'),
+            VoterRecord._meta.get_field('voted_at'),
+            AuditLog._meta.get_field('timestamp'),
+        ), transaction.atomic():
+            for index, (voter_id, department, level) in enumerate(voters):
+                if self.rng.random() >= options['turnout']:
+                    continue
+                # Peaks mid-morning and tails off towards the close
+                cast_at = start + timedelta(seconds=self.rng.betavariate(2, 4) * seconds)
+                ip = f'10.{self.rng.randint(0, 255)}.{self.rng.randint(0, 255)}.{self.rng.randint(1, 254)}'
+                agent = self.rng.choice(USER_AGENTS)
+
+                selected = 0
+                for candidates, cumulative in choices:
+                    if self.rng.random() < options['abstain']:
+                        continue
+                    pick = self.rng.random() * cumulative[-1]
+                    candidate = candidates[bisect.bisect_right(cumulative, pick)]
+                    votes.append(Vote(
+                        election=election,
+                        candidate=candidate,
+                        vote_hash=hashlib.sha256(f"{options['seed']}:{index}:{candidate.id}".encode()).digest(),
+                        timestamp=cast_at,
+                        ip_address=ip,
+                    ))
+                    selected += 1
+                if not selected:
+                    continue
+
+                records.append(VoterRecord(
+                    id=self._uuid(),
+                    voter_id=voter_id,
+                    election=election,
+                    voted_at=cast_at,
+                    verification_code=base64.urlsafe_b64encode(self.rng.getrandbits(96).to_bytes(12, 'big')).decode(),
+                ))
+                audits.append(AuditLog(
+                    id=self._uuid(), user_id=voter_id, event=AuditLog.Event.VOTER_LOGIN,
+                    agent_id=agent_ids[agent], timestamp=cast_at - timedelta(minutes=2),
+                ))
+                audits.append(AuditLog(
+                    id=self._uuid(), user_id=voter_id, event=AuditLog.Event.VOTE_CAST,
+                    params={'title': election.title}, agent_id=agent_ids[agent], timestamp=cast_at,
+                    object_id=election.id,
+                ))
+                audit_ips += [ip, ip]
+                voted_ids.append(voter_id)
+                counts['ballots'] += 1
+                counts['votes'] += selected
+                counts['audit'] += 2
+
+                if len(votes) >= self.chunk_size:
+                    self._flush(Vote, votes)
+                if len(records) >= self.chunk_size:
+                    self._flush(VoterRecord, records)
+                    self._flush_audits(audits, audit_ips)
+                    self._mark_voted(voted_ids)
+                    self.stdout.write(f"  {counts['ballots']} ballots, {counts['votes']} votes")
+
+            self._flush(Vote, votes)
+            self._flush(VoterRecord, records)
+            self._flush_audits(audits, audit_ips)
+            self._mark_voted(voted_ids)
+        return counts
+
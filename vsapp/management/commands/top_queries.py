@@ -0,0 +1,60 @@
+from django.core.management.base import BaseCommand
+
+from vsapp.querylog import clear_all, load_all, stats_dir
+
+SORT_KEYS = {
+    'total': lambda row: row['total'],
+    'count': lambda row: row['count'],
+    'max': lambda row: row['max'],
+    'avg': lambda row: row['total'] / row['count'],
+}
+
+
+class Command(BaseCommand):
+    help = 'Report the query fingerprints that cost the most time, per view, from the query log'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sort', choices=sorted(SORT_KEYS), default='total')
+        parser.add_argument('--limit', type=int, default=20)
+        parser.add_argument('--view', help='Only views whose name contains this text')
+        parser.add_argument('--all-views', action='store_true', help='Merge each fingerprint across views')
+        parser.add_argument('--width', type=int, default=160, help='Truncate fingerprints to this many characters')
+        parser.add_argument('--reset', action='store_true', help='Delete the collected counters and exit')
+
+    def handle(self, *args, **options):
+        if options['reset']:
+            clear_all()
+            self.stdout.write(self.style.SUCCESS(f'Cleared query counters in {stats_dir()}.'))
+            return
+
+        rows = load_all()
+        if options['view']:
+            rows = [row for row in rows if options['view'] in row['view']]
+        if options['all_views']:
+            merged = {}
+            for row in rows:
+                entry = merged.setdefault(row['fingerprint'], {**row, 'view': '*', 'count': 0, 'total': 0.0, 'max': 0.0})
+                entry['count'] += row['count']
+                entry['total'] += row['total']
+                entry['max'] = max(entry['max'], row['max'])
+            rows = list(merged.values())
+        if not rows:
+            self.stdout.write(f'No queries recorded in {stats_dir()} yet.')
+            return
+
+        rows.sort(key=SORT_KEYS[options['sort']], reverse=True)
+        total = sum(row['total'] for row in rows)
+        self.stdout.write(
+            f"{len(rows)} fingerprints, {sum(row['count'] for row in rows)} queries, {total * 1000:.1f} ms in total"
+        )
+        for rank, row in enumerate(rows[:options['limit']], 1):
+            self.stdout.write(self.style.MIGRATE_HEADING(
+                f"{rank:>3}. {row['view']}  count={row['count']}  total={row['total'] * 1000:.1f}ms  "
+                f"avg={row['total'] / row['count'] * 1000:.2f}ms  max={row['max'] * 1000:.1f}ms"
+            ))
+            fingerprint = row['fingerprint']
+            if len(fingerprint) > options['width']:
+                fingerprint = fingerprint[:options['width'] - 3] + '...'
+            self.stdout.write(f'     {fingerprint}')
+            if row['location']:
+                self.stdout.write(f"     at {row['location']}")
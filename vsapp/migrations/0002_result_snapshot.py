@@ -0,0 +1,32 @@
+# Generated by Django 5.2.18 on 2026-10-19 08:34
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('vsapp', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ResultSnapshot',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('payload', models.JSONField()),
+                ('total_votes', models.PositiveIntegerField(default=0)),
+                ('total_voters', models.PositiveIntegerField(default=0)),
+                ('ballots_cast', models.PositiveIntegerField(default=0)),
+                ('turnout', models.FloatField(default=0)),
+                ('ledger_root', models.CharField(max_length=64)),
+                ('artifact', models.FileField(blank=True, upload_to='results/')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('election', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='result_snapshot', to='vsapp.election')),
+            ],
+            options={
+                'ordering': ['-created_at'],
+            },
+        ),
+    ]
@@ -0,0 +1,67 @@
+# Generated by Django 5.2.18 on 2026-10-19 08:35
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery
+
+
+def backfill_vote_election(apps, schema_editor):
+    Vote = apps.get_model('vsapp', 'Vote')
+    Candidate = apps.get_model('vsapp', 'Candidate')
+    election = Candidate.objects.filter(pk=OuterRef('candidate_id')).values('position__election_id')[:1]
+    Vote.objects.filter(election__isnull=True).update(election=Subquery(election))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auth', '0012_alter_user_first_name_max_length'),
+        ('vsapp', '0002_result_snapshot'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='vote',
+            name='vsapp_vote_vote_ha_f3bd19_idx',
+        ),
+        migrations.AddField(
+            model_name='vote',
+            name='election',
+            field=models.ForeignKey(db_index=False, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='votes', to='vsapp.election'),
+        ),
+        migrations.RunPython(backfill_vote_election, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='vote',
+            name='election',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='votes', to='vsapp.election'),
+        ),
+        migrations.AlterField(
+            model_name='candidate',
+            name='position',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='candidates', to='vsapp.position'),
+        ),
+        migrations.AlterField(
+            model_name='position',
+            name='election',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='positions', to='vsapp.election'),
+        ),
+        migrations.AlterField(
+            model_name='vote',
+            name='candidate',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='votes', to='vsapp.candidate'),
+        ),
+        migrations.AlterField(
+            model_name='voterrecord',
+            name='voter',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='voter_records', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AddIndex(
+            model_name='user',
+            index=models.Index(fields=['user_type', 'is_active'], name='vsapp_user_user_ty_1826dc_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='vote',
+            index=models.Index(fields=['election', 'candidate'], name='vsapp_vote_electio_c94184_idx'),
+        ),
+    ]
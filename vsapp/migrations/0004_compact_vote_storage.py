@@ -0,0 +1,133 @@
+import hashlib
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def assign_candidate_ordinals(apps, schema_editor):
+    Candidate = apps.get_model('vsapp', 'Candidate')
+    counters = {}
+    candidates = Candidate.objects.select_related('position').order_by(
+        'position__election_id', 'position__order', 'position__title', 'created_at'
+    )
+    for candidate in candidates.iterator(chunk_size=2000):
+        election_id = candidate.position.election_id
+        counters[election_id] = counters.get(election_id, 0) + 1
+        candidate.ordinal = counters[election_id]
+        candidate.save(update_fields=['ordinal'])
+
+
+def _digest(vote_hash):
+    try:
+        digest = bytes.fromhex(vote_hash)
+    except ValueError:
+        digest = b''
+    # Anything that is not a hex SHA-256 gets re-hashed so it still fits 32 bytes
+    return digest if len(digest) == 32 else hashlib.sha256(vote_hash.encode()).digest()
+
+
+def copy_votes(apps, schema_editor):
+    Vote = apps.get_model('vsapp', 'Vote')
+    CompactVote = apps.get_model('vsapp', 'CompactVote')
+    # Keep the original cast times instead of stamping the migration time
+    CompactVote._meta.get_field('timestamp').auto_now_add = False
+
+    batch = []
+    rows = Vote.objects.order_by('timestamp').values_list(
+        'election_id', 'candidate_id', 'vote_hash', 'timestamp', 'ip_address'
+    )
+    for election_id, candidate_id, vote_hash, timestamp, ip_address in rows.iterator(chunk_size=5000):
+        batch.append(CompactVote(
+            election_id=election_id,
+            candidate_id=candidate_id,
+            vote_hash=_digest(vote_hash),
+            timestamp=timestamp,
+            ip_address=ip_address,
+        ))
+        if len(batch) >= 5000:
+            CompactVote.objects.bulk_create(batch)
+            batch = []
+    if batch:
+        CompactVote.objects.bulk_create(batch)
+
+
+def restore_votes(apps, schema_editor):
+    Vote = apps.get_model('vsapp', 'Vote')
+    CompactVote = apps.get_model('vsapp', 'CompactVote')
+    Vote._meta.get_field('timestamp').auto_now_add = False
+
+    batch = []
+    rows = CompactVote.objects.order_by('timestamp').values_list(
+        'election_id', 'candidate_id', 'vote_hash', 'timestamp', 'ip_address'
+    )
+    for election_id, candidate_id, vote_hash, timestamp, ip_address in rows.iterator(chunk_size=5000):
+        batch.append(Vote(
+            election_id=election_id,
+            candidate_id=candidate_id,
+            vote_hash=bytes(vote_hash).hex(),  # Re-hashed legacy values come back as their SHA-256
+            timestamp=timestamp,
+            ip_address=ip_address,
+        ))
+        if len(batch) >= 5000:
+            Vote.objects.bulk_create(batch)
+            batch = []
+    if batch:
+        Vote.objects.bulk_create(batch)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('vsapp', '0003_vote_election_and_hot_path_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='candidate',
+            name='ordinal',
+            field=models.PositiveSmallIntegerField(default=0),
+        ),
+        migrations.RunPython(assign_candidate_ordinals, migrations.RunPython.noop),
+        # Rebuild the vote table with an integer key and binary digests, copy the
+        # ledger across in cast order, then swap it in under the original name.
+        migrations.CreateModel(
+            name='CompactVote',
+            fields=[
+                ('id', models.BigAutoField(primary_key=True, serialize=False)),
+                ('vote_hash', models.BinaryField(max_length=32, unique=True)),
+                ('timestamp', models.DateTimeField(auto_now_add=True)),
+                ('ip_address', models.GenericIPAddressField(blank=True, null=True)),
+                ('candidate', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='+', to='vsapp.candidate')),
+                ('election', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='+', to='vsapp.election')),
+            ],
+            options={
+                'ordering': ['-timestamp'],
+            },
+        ),
+        migrations.RunPython(copy_votes, restore_votes),
+        migrations.DeleteModel(
+            name='Vote',
+        ),
+        migrations.RenameModel(
+            old_name='CompactVote',
+            new_name='Vote',
+        ),
+        migrations.AlterField(
+            model_name='vote',
+            name='candidate',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='votes', to='vsapp.candidate'),
+        ),
+        migrations.AlterField(
+            model_name='vote',
+            name='election',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='votes', to='vsapp.election'),
+        ),
+        migrations.AddIndex(
+            model_name='vote',
+            index=models.Index(fields=['election', 'candidate'], name='vsapp_vote_electio_c94184_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='vote',
+            index=models.Index(fields=['candidate', 'timestamp'], name='vsapp_vote_candida_574d79_idx'),
+        ),
+    ]
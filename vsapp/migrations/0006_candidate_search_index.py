@@ -0,0 +1,33 @@
+from django.db import migrations
+
+
+def create_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    schema_editor.execute(
+        'CREATE VIRTUAL TABLE IF NOT EXISTS vsapp_candidate_fts USING fts5('
+        'candidate_id UNINDEXED, full_name, department, matric_number, '
+        "tokenize = 'unicode61 remove_diacritics 2')"
+    )
+    schema_editor.execute(
+        'INSERT INTO vsapp_candidate_fts (candidate_id, full_name, department, matric_number) '
+        "SELECT c.id, c.full_name, c.department, COALESCE(u.matric_number, '') "
+        'FROM vsapp_candidate c JOIN vsapp_user u ON u.id = c.user_id'
+    )
+
+
+def drop_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    schema_editor.execute('DROP TABLE IF EXISTS vsapp_candidate_fts')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('vsapp', '0005_candidate_photo_variants'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
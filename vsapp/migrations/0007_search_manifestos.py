@@ -0,0 +1,46 @@
+from django.db import migrations
+
+
+def create_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    schema_editor.execute('DROP TABLE IF EXISTS vsapp_candidate_fts')
+    schema_editor.execute(
+        'CREATE VIRTUAL TABLE vsapp_candidate_fts USING fts5('
+        'candidate_id UNINDEXED, full_name, department, matric_number, position, manifesto, '
+        "tokenize = 'unicode61 remove_diacritics 2')"
+    )
+    schema_editor.execute(
+        'INSERT INTO vsapp_candidate_fts (candidate_id, full_name, department, matric_number, position, manifesto) '
+        "SELECT c.id, c.full_name, c.department, COALESCE(u.matric_number, ''), p.title, c.manifesto "
+        'FROM vsapp_candidate c '
+        'JOIN vsapp_user u ON u.id = c.user_id '
+        'JOIN vsapp_position p ON p.id = c.position_id'
+    )
+
+
+def restore_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    schema_editor.execute('DROP TABLE IF EXISTS vsapp_candidate_fts')
+    schema_editor.execute(
+        'CREATE VIRTUAL TABLE vsapp_candidate_fts USING fts5('
+        'candidate_id UNINDEXED, full_name, department, matric_number, '
+        "tokenize = 'unicode61 remove_diacritics 2')"
+    )
+    schema_editor.execute(
+        'INSERT INTO vsapp_candidate_fts (candidate_id, full_name, department, matric_number) '
+        "SELECT c.id, c.full_name, c.department, COALESCE(u.matric_number, '') "
+        'FROM vsapp_candidate c JOIN vsapp_user u ON u.id = c.user_id'
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('vsapp', '0006_candidate_search_index'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, restore_search_index),
+    ]
@@ -0,0 +1,48 @@
+# Generated by Django 5.2.18 on 2026-10-19 09:19
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def backfill_tallies(apps, schema_editor):
+    Candidate = apps.get_model('vsapp', 'Candidate')
+    Vote = apps.get_model('vsapp', 'Vote')
+    VoterRecord = apps.get_model('vsapp', 'VoterRecord')
+    TallyShard = apps.get_model('vsapp', 'TallyShard')
+
+    ordinals = {
+        candidate_id: (election_id, ordinal)
+        for candidate_id, election_id, ordinal in Candidate.objects.values_list('id', 'position__election_id', 'ordinal')
+    }
+    shards = []
+    for candidate_id, n in Vote.objects.values_list('candidate').annotate(n=Count('id')).order_by():
+        election_id, ordinal = ordinals[candidate_id]
+        shards.append(TallyShard(election_id=election_id, counter=ordinal, shard=0, count=n))
+    for election_id, n in VoterRecord.objects.values_list('election').annotate(n=Count('id')).order_by():
+        shards.append(TallyShard(election_id=election_id, counter=0, shard=0, count=n))
+    TallyShard.objects.bulk_create(shards, batch_size=2000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('vsapp', '0008_auditlog_timestamp_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TallyShard',
+            fields=[
+                ('id', models.BigAutoField(primary_key=True, serialize=False)),
+                ('counter', models.PositiveSmallIntegerField()),
+                ('shard', models.PositiveSmallIntegerField()),
+                ('count', models.PositiveIntegerField(default=0)),
+                ('election', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='tally_shards', to='vsapp.election')),
+            ],
+            options={
+                'unique_together': {('election', 'counter', 'shard')},
+            },
+        ),
+        migrations.RunPython(backfill_tallies, migrations.RunPython.noop),
+    ]
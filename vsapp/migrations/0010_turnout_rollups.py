@@ -0,0 +1,49 @@
+# Generated by Django 5.2.18 on 2026-10-19 09:29
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Count
+from django.db.models.functions import TruncMinute
+
+
+def backfill_rollups(apps, schema_editor):
+    VoterRecord = apps.get_model('vsapp', 'VoterRecord')
+    TurnoutRollup = apps.get_model('vsapp', 'TurnoutRollup')
+
+    rows = []
+    minutes = (
+        VoterRecord.objects.annotate(minute=TruncMinute('voted_at'))
+        .values_list('election', 'minute').annotate(n=Count('id')).order_by()
+    )
+    for election_id, minute, n in minutes:
+        rows.append(TurnoutRollup(election_id=election_id, dimension='minute',
+                                  bucket=minute.strftime('%Y-%m-%dT%H:%M'), count=n))
+    for dimension in ['department', 'level']:
+        buckets = VoterRecord.objects.values_list('election', f'voter__{dimension}').annotate(n=Count('id')).order_by()
+        for election_id, bucket, n in buckets:
+            rows.append(TurnoutRollup(election_id=election_id, dimension=dimension, bucket=bucket or '', count=n))
+    TurnoutRollup.objects.bulk_create(rows, batch_size=2000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('vsapp', '0009_tally_shards'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TurnoutRollup',
+            fields=[
+                ('id', models.BigAutoField(primary_key=True, serialize=False)),
+                ('dimension', models.CharField(choices=[('minute', 'Minute'), ('department', 'Department'), ('level', 'Level')], max_length=10)),
+                ('bucket', models.CharField(blank=True, max_length=100)),
+                ('count', models.PositiveIntegerField(default=0)),
+                ('election', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='turnout_rollups', to='vsapp.election')),
+            ],
+            options={
+                'unique_together': {('election', 'dimension', 'bucket')},
+            },
+        ),
+        migrations.RunPython(backfill_rollups, migrations.RunPython.noop),
+    ]
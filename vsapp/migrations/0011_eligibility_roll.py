@@ -0,0 +1,46 @@
+# Generated by Django 5.2.18 on 2026-10-19 09:34
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('vsapp', '0010_turnout_rollups'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='election',
+            name='eligible_count',
+            field=models.PositiveIntegerField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='election',
+            name='eligible_departments',
+            field=models.JSONField(blank=True, default=list),
+        ),
+        migrations.AddField(
+            model_name='election',
+            name='eligible_levels',
+            field=models.JSONField(blank=True, default=list),
+        ),
+        migrations.AddField(
+            model_name='election',
+            name='roll_frozen_at',
+            field=models.DateTimeField(blank=True, editable=False, null=True),
+        ),
+        migrations.CreateModel(
+            name='EligibleVoter',
+            fields=[
+                ('id', models.BigAutoField(primary_key=True, serialize=False)),
+                ('election', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='roll', to='vsapp.election')),
+                ('voter', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='eligibility', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'unique_together': {('election', 'voter')},
+            },
+        ),
+    ]
@@ -0,0 +1,229 @@
+import json
+import re
+import uuid
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+# Event codes and messages as of this migration; ``{name}`` marks a parameter
+EVENTS = {
+    1: ('create', 'Voter account created'),
+    2: ('create', 'Admin account created for {username}'),
+    3: ('login', 'Admin login'),
+    4: ('login', 'Voter login'),
+    5: ('logout', 'User logout'),
+    10: ('create', 'Created election: {title}'),
+    11: ('update', 'Updated election: {title}'),
+    12: ('delete', 'Deleted election: {title}'),
+    20: ('create', 'Added candidate: {name}'),
+    21: ('update', 'Updated candidate: {name}'),
+    22: ('delete', 'Deleted candidate: {name}'),
+    30: ('vote', 'Voted in election: {title}'),
+}
+LEGACY = 0
+AGENT_MAX_LENGTH = 512
+BATCH = 2000
+
+
+def _pattern(message):
+    parts = re.split(r'\{(\w+)\}', message)
+    return re.compile(''.join(
+        f'(?P<{part}>.*)' if index % 2 else re.escape(part) for index, part in enumerate(parts)
+    ), re.DOTALL)
+
+
+PATTERNS = [(code, action, _pattern(message)) for code, (action, message) in EVENTS.items()]
+
+
+def _event(action_type, description):
+    for code, action, pattern in PATTERNS:
+        match = pattern.fullmatch(description) if action == action_type else None
+        if match:
+            return code, match.groupdict()
+    return LEGACY, {'action': action_type, 'text': description}
+
+
+def _election_ref(content_type, object_id):
+    """The election an entry points at, or None when it points at something else (or nothing)"""
+    if content_type != 'election' or not object_id:
+        return None
+    try:
+        return uuid.UUID(object_id)
+    except ValueError:
+        return None
+
+
+def _intern(model, field, values):
+    model.objects.bulk_create([model(**{field: value}) for value in sorted(values)], ignore_conflicts=True)
+    return dict(model.objects.values_list(field, 'id'))
+
+
+def _update(schema_editor, AuditLog, columns, rows):
+    connection = schema_editor.connection
+    quote = connection.ops.quote_name
+    assignments = ', '.join(f'{quote(column)} = %s' for column in columns)
+    with connection.cursor() as cursor:
+        cursor.executemany(f'UPDATE {quote(AuditLog._meta.db_table)} SET {assignments} WHERE id = %s', rows)
+
+
+def to_events(apps, schema_editor):
+    AuditLog = apps.get_model('vsapp', 'AuditLog')
+    IPAddress = apps.get_model('vsapp', 'IPAddress')
+    UserAgent = apps.get_model('vsapp', 'UserAgent')
+    connection = schema_editor.connection
+    uuid_field = AuditLog._meta.get_field('election_ref')
+
+    entries = AuditLog.objects.all()
+    agent_ids = _intern(UserAgent, 'value', {
+        agent[:AGENT_MAX_LENGTH] for agent in entries.exclude(user_agent='').values_list('user_agent', flat=True).distinct()
+    })
+    ip_ids = _intern(IPAddress, 'address', set(
+        entries.exclude(ip_address=None).values_list('ip_address', flat=True).distinct()
+    ))
+
+    rows = entries.values_list('id', 'action_type', 'description', 'ip_address', 'user_agent', 'content_type', 'object_id')
+    batch = []
+    for pk, action_type, description, ip_address, user_agent, content_type, object_id in rows.iterator(chunk_size=BATCH):
+        event, params = _event(action_type, description)
+        election_ref = _election_ref(content_type, object_id)
+        if election_ref is None and (content_type or object_id):
+            # Only elections get a column; any other reference rides along in params
+            params.update(content_type=content_type, object_id=object_id)
+        batch.append((
+            event, json.dumps(params), ip_ids.get(ip_address), agent_ids.get((user_agent or '')[:AGENT_MAX_LENGTH]),
+            uuid_field.get_db_prep_value(election_ref, connection), uuid_field.get_db_prep_value(pk, connection),
+        ))
+        if len(batch) >= BATCH:
+            _update(schema_editor, AuditLog, ['event', 'params', 'ip_id', 'agent_id', 'election_ref'], batch)
+            batch = []
+    _update(schema_editor, AuditLog, ['event', 'params', 'ip_id', 'agent_id', 'election_ref'], batch)
+
+
+def to_text(apps, schema_editor):
+    AuditLog = apps.get_model('vsapp', 'AuditLog')
+    connection = schema_editor.connection
+    uuid_field = AuditLog._meta.get_field('election_ref')
+
+    rows = AuditLog.objects.values_list('id', 'event', 'params', 'ip__address', 'agent__value', 'election_ref')
+    batch = []
+    for pk, event, params, ip_address, user_agent, election_ref in rows.iterator(chunk_size=BATCH):
+        if election_ref:
+            content_type, object_id = 'election', str(election_ref)
+        else:
+            content_type, object_id = params.pop('content_type', ''), params.pop('object_id', '')
+        if event in EVENTS:
+            action_type, message = EVENTS[event]
+            description = message.format(**params)
+        else:
+            action_type, description = params.get('action', ''), params.get('text', '')
+        batch.append((
+            action_type, description, ip_address, user_agent or '', content_type, object_id,
+            uuid_field.get_db_prep_value(pk, connection),
+        ))
+        if len(batch) >= BATCH:
+            _update(schema_editor, AuditLog, ['action_type', 'description', 'ip_address', 'user_agent', 'content_type', 'object_id'], batch)
+            batch = []
+    _update(schema_editor, AuditLog, ['action_type', 'description', 'ip_address', 'user_agent', 'content_type', 'object_id'], batch)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('vsapp', '0011_eligibility_roll'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='IPAddress',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('address', models.GenericIPAddressField(unique=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='UserAgent',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('value', models.CharField(max_length=512, unique=True)),
+            ],
+        ),
+        # Add the structured columns next to the free-text ones, convert every
+        # entry, then drop the text columns and their index.
+        migrations.AddField(
+            model_name='auditlog',
+            name='event',
+            field=models.PositiveSmallIntegerField(choices=[(0, 'Legacy entry'), (1, 'Voter account created'), (2, 'Admin account created'), (3, 'Admin login'), (4, 'Voter login'), (5, 'Logout'), (10, 'Election created'), (11, 'Election updated'), (12, 'Election deleted'), (20, 'Candidate added'), (21, 'Candidate updated'), (22, 'Candidate deleted'), (30, 'Vote cast')], default=0),
+            preserve_default=False,
+        ),
+        migrations.AddField(
+            model_name='auditlog',
+            name='params',
+            field=models.JSONField(blank=True, default=dict),
+        ),
+        migrations.AddField(
+            model_name='auditlog',
+            name='ip',
+            field=models.ForeignKey(blank=True, db_index=False, null=True, on_delete=django.db.models.deletion.PROTECT, related_name='+', to='vsapp.ipaddress'),
+        ),
+        migrations.AddField(
+            model_name='auditlog',
+            name='agent',
+            field=models.ForeignKey(blank=True, db_index=False, null=True, on_delete=django.db.models.deletion.PROTECT, related_name='+', to='vsapp.useragent'),
+        ),
+        migrations.AddField(
+            model_name='auditlog',
+            name='election_ref',
+            field=models.UUIDField(blank=True, null=True),
+        ),
+        migrations.RunPython(to_events, to_text),
+        # State only: lets unapplying re-add the text columns before to_text fills them
+        migrations.SeparateDatabaseAndState(state_operations=[
+            migrations.AlterField(
+                model_name='auditlog',
+                name='action_type',
+                field=models.CharField(default='', max_length=20),
+            ),
+            migrations.AlterField(
+                model_name='auditlog',
+                name='description',
+                field=models.TextField(default=''),
+            ),
+        ]),
+        migrations.RemoveIndex(
+            model_name='auditlog',
+            name='vsapp_audit_action__b4d3d0_idx',
+        ),
+        migrations.RemoveField(
+            model_name='auditlog',
+            name='action_type',
+        ),
+        migrations.RemoveField(
+            model_name='auditlog',
+            name='description',
+        ),
+        migrations.RemoveField(
+            model_name='auditlog',
+            name='ip_address',
+        ),
+        migrations.RemoveField(
+            model_name='auditlog',
+            name='user_agent',
+        ),
+        migrations.RemoveField(
+            model_name='auditlog',
+            name='content_type',
+        ),
+        migrations.RemoveField(
+            model_name='auditlog',
+            name='object_id',
+        ),
+        migrations.RenameField(
+            model_name='auditlog',
+            old_name='election_ref',
+            new_name='object_id',
+        ),
+        migrations.AddIndex(
+            model_name='auditlog',
+            index=models.Index(fields=['event', 'timestamp'], name='vsapp_audit_event_937ce2_idx'),
+        ),
+    ]
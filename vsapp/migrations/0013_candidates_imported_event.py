@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-19 09:53
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('vsapp', '0012_compact_audit_storage'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='auditlog',
+            name='event',
+            field=models.PositiveSmallIntegerField(choices=[(0, 'Legacy entry'), (1, 'Voter account created'), (2, 'Admin account created'), (3, 'Admin login'), (4, 'Voter login'), (5, 'Logout'), (10, 'Election created'), (11, 'Election updated'), (12, 'Election deleted'), (20, 'Candidate added'), (21, 'Candidate updated'), (22, 'Candidate deleted'), (23, 'Candidates imported'), (30, 'Vote cast')]),
+        ),
+    ]
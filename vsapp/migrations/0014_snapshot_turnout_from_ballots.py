@@ -0,0 +1,32 @@
+import json
+
+from django.core.files.base import ContentFile
+from django.db import migrations
+
+
+def recompute_turnout(apps, schema_editor):
+    # Snapshots frozen before turnout counted ballots divided the votes over
+    # every position by the eligible voters, which can exceed 100%
+    ResultSnapshot = apps.get_model('vsapp', 'ResultSnapshot')
+    for snapshot in ResultSnapshot.objects.iterator(chunk_size=200):
+        turnout = (snapshot.ballots_cast / snapshot.total_voters) * 100 if snapshot.total_voters else 0
+        if turnout == snapshot.turnout:
+            continue
+        snapshot.turnout = turnout
+        snapshot.payload['turnout'] = turnout
+        if snapshot.artifact:
+            snapshot.artifact.delete(save=False)
+            artifact = json.dumps(snapshot.payload, separators=(',', ':')).encode()
+            snapshot.artifact.save(f'{snapshot.election_id}.json', ContentFile(artifact), save=False)
+        snapshot.save(update_fields=['turnout', 'payload', 'artifact'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('vsapp', '0013_candidates_imported_event'),
+    ]
+
+    operations = [
+        migrations.RunPython(recompute_turnout, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,49 @@
+# Generated by Django 5.2.18 on 2026-10-19 10:39
+
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def renumber_duplicates(apps, schema_editor):
+    # Candidates created concurrently could be handed the same ordinal, and so
+    # share a tally counter. Later ones get fresh numbers and the election's
+    # candidate counters are recounted from its votes.
+    Candidate = apps.get_model('vsapp', 'Candidate')
+    Vote = apps.get_model('vsapp', 'Vote')
+    TallyShard = apps.get_model('vsapp', 'TallyShard')
+
+    seen, highest, renumbered = set(), {}, set()
+    for election_id, ordinal in Candidate.objects.values_list('position__election_id', 'ordinal'):
+        highest[election_id] = max(highest.get(election_id, 0), ordinal)
+    candidates = Candidate.objects.order_by('created_at', 'id').values_list('id', 'position__election_id', 'ordinal')
+    for candidate_id, election_id, ordinal in candidates.iterator(chunk_size=2000):
+        if (election_id, ordinal) not in seen:
+            seen.add((election_id, ordinal))
+            continue
+        highest[election_id] += 1
+        Candidate.objects.filter(id=candidate_id).update(ordinal=highest[election_id])
+        renumbered.add(election_id)
+
+    for election_id in renumbered:
+        ordinals = dict(Candidate.objects.filter(position__election_id=election_id).values_list('id', 'ordinal'))
+        TallyShard.objects.filter(election_id=election_id).exclude(counter=0).delete()
+        TallyShard.objects.bulk_create([
+            TallyShard(election_id=election_id, counter=ordinals[candidate_id], shard=0, count=n)
+            for candidate_id, n in Vote.objects.filter(election_id=election_id).values_list('candidate')
+            .annotate(n=Count('id')).order_by()
+        ])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('vsapp', '0014_snapshot_turnout_from_ballots'),
+    ]
+
+    operations = [
+        migrations.RunPython(renumber_duplicates, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='candidate',
+            constraint=models.UniqueConstraint(fields=('position', 'ordinal'), name='vsapp_candidate_unique_ordinal'),
+        ),
+    ]
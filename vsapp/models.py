@@ -1,8 +1,49 @@
-from django.db import models
+from django.conf import settings
+from django.db import IntegrityError, models, transaction
+from django.db.models.functions import Coalesce
 from django.contrib.auth.models import AbstractUser
 from django.utils import timezone
+import os
+import sys
 import uuid
 
+from .images import photo_variant_url
+
+# ==================== QUERY GUARD ====================
+
+TEMPLATE_ENGINE_FILE = os.path.join('django', 'template', 'base.py')
+
+
+class LazyQueryError(RuntimeError):
+    """A template used a stats property that had to query the database for its object"""
+
+
+def _rendering_template():
+    frame = sys._getframe(2)
+    while frame is not None:
+        if frame.f_code.co_filename.endswith(TEMPLATE_ENGINE_FILE):
+            return True
+        frame = frame.f_back
+    return False
+
+
+def lazy_query(instance, name):
+    """Called before a stats property falls back to its own query; raises in strict mode inside templates"""
+    if getattr(settings, 'STRICT_TEMPLATE_QUERIES', False) and _rendering_template():
+        model = type(instance).__name__
+        raise LazyQueryError(
+            f'{model}.{name} queried the database while rendering a template; '
+            f'load the objects with {model}.objects.with_stats()'
+        )
+
+
+def count_subquery(queryset, outer_field):
+    """COUNT(*) of ``queryset`` as a subquery, grouped on ``outer_field``; 0 when empty"""
+    return Coalesce(models.Subquery(
+        queryset.order_by().values(outer_field).annotate(n=models.Count('*')).values('n')
+    ), 0)
+
+
 # ==================== USER MODELS ====================
 
 class User(AbstractUser):
@@ -21,12 +62,34 @@ class User(AbstractUser):
     otp_code = models.CharField(max_length=6, blank=True)
     otp_created_at = models.DateTimeField(null=True, blank=True)
     
+    class Meta(AbstractUser.Meta):
+        indexes = [
+            models.Index(fields=['user_type', 'is_active']),  # Turnout denominators
+        ]
+    
     def __str__(self):
         return f"{self.get_full_name()} ({self.matric_number})"
 
 
 # ==================== ELECTION MODELS ====================
 
+class ElectionQuerySet(models.QuerySet):
+    def with_stats(self):
+        """Attach total_votes, ballots_cast, candidate_count and voter_turnout in the same query"""
+        return self.annotate(
+            total_votes_agg=count_subquery(Vote.objects.filter(election=models.OuterRef('pk')), 'election'),
+            ballots_agg=count_subquery(VoterRecord.objects.filter(election=models.OuterRef('pk')), 'election'),
+            candidate_count_agg=count_subquery(
+                Candidate.objects.filter(position__election=models.OuterRef('pk')), 'position__election'
+            ),
+            # The frozen roll's count once the election has opened, the live voter count before
+            eligible_voters_agg=Coalesce(
+                'eligible_count',
+                count_subquery(User.objects.filter(user_type='voter', is_active=True), 'user_type'),
+            ),
+        )
+
+
 class Election(models.Model):
     """Main election model"""
     STATUS_CHOICES = (
@@ -45,6 +108,15 @@ class Election(models.Model):
     created_by = models.ForeignKey(User, on_delete=models.CASCADE, related_name='elections_created')
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
+
+    # Eligibility rules: empty lists admit every department/level (see eligibility.py)
+    eligible_departments = models.JSONField(default=list, blank=True)
+    eligible_levels = models.JSONField(default=list, blank=True)
+    # Set when the roll is frozen on opening; None means every active voter is eligible
+    eligible_count = models.PositiveIntegerField(null=True, blank=True, editable=False)
+    roll_frozen_at = models.DateTimeField(null=True, blank=True, editable=False)
+
+    objects = ElectionQuerySet.as_manager()
     
     class Meta:
         ordering = ['-created_at']
@@ -63,28 +135,61 @@ class Election(models.Model):
     
     @property
     def total_votes(self):
-        return Vote.objects.filter(candidate__position__election=self).count()
+        if hasattr(self, 'total_votes_agg'):
+            return self.total_votes_agg
+        lazy_query(self, 'total_votes')
+        return Vote.objects.filter(election=self).count()
+
+    @property
+    def ballots_cast(self):
+        if hasattr(self, 'ballots_agg'):
+            return self.ballots_agg
+        lazy_query(self, 'ballots_cast')
+        return self.voter_records.count()
 
     @property
     def candidate_count(self):
+        if hasattr(self, 'candidate_count_agg'):
+            return self.candidate_count_agg
+        lazy_query(self, 'candidate_count')
         return Candidate.objects.filter(position__election=self).count()
     
+    @property
+    def eligible_voters(self):
+        if self.eligible_count is not None:
+            return self.eligible_count
+        if hasattr(self, 'eligible_voters_agg'):
+            return self.eligible_voters_agg
+        lazy_query(self, 'eligible_voters')
+        return User.objects.filter(user_type='voter', is_active=True).count()
+
     @property
     def voter_turnout(self):
-        total_voters = User.objects.filter(user_type='voter', is_active=True).count()
+        total_voters = self.eligible_voters
         if total_voters == 0:
             return 0
-        return (self.total_votes / total_voters) * 100
+        # One ballot per voter, however many positions it fills
+        return (self.ballots_cast / total_voters) * 100
+
+
+class PositionQuerySet(models.QuerySet):
+    def with_stats(self):
+        """Attach total_votes in the same query"""
+        return self.annotate(
+            total_votes_agg=count_subquery(Vote.objects.filter(candidate__position=models.OuterRef('pk')), 'candidate__position'),
+        )
 
 
 class Position(models.Model):
     """Positions available in an election (President, VP, etc.)"""
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
-    election = models.ForeignKey(Election, on_delete=models.CASCADE, related_name='positions')
+    election = models.ForeignKey(Election, on_delete=models.CASCADE, related_name='positions', db_index=False)  # Covered by unique (election, title)
     title = models.CharField(max_length=100)  # e.g., "President", "Vice President"
     description = models.TextField(blank=True)
     order = models.IntegerField(default=0)  # Display order
     max_votes = models.IntegerField(default=1)  # Usually 1 vote per position
+
+    objects = PositionQuerySet.as_manager()
     
     class Meta:
         ordering = ['order', 'title']
@@ -95,37 +200,123 @@ class Position(models.Model):
 
     @property
     def total_votes(self):
+        if hasattr(self, 'total_votes_agg'):
+            return self.total_votes_agg
+        lazy_query(self, 'total_votes')
         return Vote.objects.filter(candidate__position=self).count()
 
 
+class CandidateQuerySet(models.QuerySet):
+    def with_stats(self):
+        """Attach vote_count and vote_percentage in the same query"""
+        return self.annotate(
+            vote_count_agg=count_subquery(Vote.objects.filter(candidate=models.OuterRef('pk')), 'candidate'),
+            position_votes_agg=count_subquery(
+                Vote.objects.filter(candidate__position=models.OuterRef('position')), 'candidate__position'
+            ),
+        )
+
+
 class Candidate(models.Model):
     """Candidates running for positions"""
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
-    position = models.ForeignKey(Position, on_delete=models.CASCADE, related_name='candidates')
+    position = models.ForeignKey(Position, on_delete=models.CASCADE, related_name='candidates', db_index=False)  # Covered by unique (position, user)
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='candidacies')
     full_name = models.CharField(max_length=200)
     department = models.CharField(max_length=100)
     level = models.CharField(max_length=20)
     manifesto = models.TextField()
     photo = models.ImageField(upload_to='candidates/', blank=True, null=True)
+    photo_variants = models.JSONField(default=dict, blank=True, editable=False)  # Resized copies, see images.py
+    ordinal = models.PositiveSmallIntegerField(default=0)  # Compact per-election candidate number
     created_at = models.DateTimeField(auto_now_add=True)
+
+    objects = CandidateQuerySet.as_manager()
     
+    ORDINAL_ATTEMPTS = 5  # Writers racing for the next ordinal retry with a fresh one
+
     class Meta:
         ordering = ['full_name']
         unique_together = ['position', 'user']
+        constraints = [
+            models.UniqueConstraint(fields=['position', 'ordinal'], name='vsapp_candidate_unique_ordinal'),
+        ]
     
     def __str__(self):
         return f"{self.full_name} - {self.position.title}"
+
+    def save(self, *args, **kwargs):
+        if self.ordinal:
+            return super().save(*args, **kwargs)
+
+        def write(ordinal):
+            self.ordinal = ordinal
+            super(Candidate, self).save(*args, **kwargs)
+
+        try:
+            Candidate.allocate_ordinals(self.position.election_id, write)
+        except IntegrityError:
+            self.ordinal = 0  # Saving again allocates a fresh one
+            raise
+
+    @staticmethod
+    def next_ordinal(election_id):
+        current = Candidate.objects.filter(position__election_id=election_id).aggregate(
+            highest=models.Max('ordinal')
+        )['highest']
+        return (current or 0) + 1
+
+    @staticmethod
+    def allocate_ordinals(election_id, write):
+        """
+        Call ``write(first_ordinal)`` in a transaction with the election's next
+        free ordinal. The max + 1 read is not a lock, so a concurrent writer can
+        take the same number; the unique (position, ordinal) constraint then
+        rejects one of them, which is retried with a fresh ordinal.
+        """
+        for attempt in range(Candidate.ORDINAL_ATTEMPTS):
+            try:
+                with transaction.atomic():
+                    return write(Candidate.next_ordinal(election_id))
+            except IntegrityError:
+                if attempt == Candidate.ORDINAL_ATTEMPTS - 1:
+                    raise
     
+    @property
+    def photo_url(self):
+        return photo_variant_url(self, 'thumb')
+
+    @property
+    def photo_jpeg_url(self):
+        return photo_variant_url(self, 'thumb', 'jpeg')
+
+    @property
+    def photo_webp_url(self):
+        # No fallback: a <source type="image/webp"> must never point at a JPEG
+        return photo_variant_url(self, 'thumb', 'webp', fallback=False)
+
+    @property
+    def photo_card_url(self):
+        return photo_variant_url(self, 'card')
+
     @property
     def vote_count(self):
+        if hasattr(self, 'vote_count_agg'):
+            return self.vote_count_agg
+        lazy_query(self, 'vote_count')
         return self.votes.count()
     
     @property
     def vote_percentage(self):
-        total_votes = self.position.candidates.aggregate(
-            total=models.Count('votes')
-        )['total'] or 0
+        if hasattr(self, 'position_votes_agg'):
+            total_votes = self.position_votes_agg
+        elif Candidate.position.is_cached(self) and hasattr(self.position, 'total_votes_agg'):
+            total_votes = self.position.total_votes_agg
+        else:
+            lazy_query(self, 'vote_percentage')
+            total_votes = self.position.candidates.aggregate(
+                total=models.Count('votes')
+            )['total'] or 0
 
         if total_votes == 0:
             return 0
@@ -138,9 +329,10 @@ class Candidate(models.Model):
 
 class Vote(models.Model):
     """Individual vote records (encrypted/anonymized)"""
-    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
-    candidate = models.ForeignKey(Candidate, on_delete=models.CASCADE, related_name='votes')
-    vote_hash = models.CharField(max_length=256, unique=True)  # Blockchain hash
+    id = models.BigAutoField(primary_key=True)
+    election = models.ForeignKey(Election, on_delete=models.CASCADE, related_name='votes', db_index=False)  # Denormalized from candidate.position
+    candidate = models.ForeignKey(Candidate, on_delete=models.CASCADE, related_name='votes', db_index=False)
+    vote_hash = models.BinaryField(max_length=32, unique=True)  # Raw SHA-256 digest of the ballot
     timestamp = models.DateTimeField(auto_now_add=True)
     ip_address = models.GenericIPAddressField(blank=True, null=True)
     
@@ -150,18 +342,22 @@ class Vote(models.Model):
     class Meta:
         ordering = ['-timestamp']
         indexes = [
+            models.Index(fields=['election', 'candidate']),  # Tallies without joining through position
             models.Index(fields=['candidate', 'timestamp']),
-            models.Index(fields=['vote_hash']),
         ]
     
     def __str__(self):
         return f"Vote for {self.candidate.full_name} at {self.timestamp}"
 
+    @property
+    def hash_hex(self):
+        return bytes(self.vote_hash).hex()
+
 
 class VoterRecord(models.Model):
     """Tracks which voters have participated (separate from actual votes)"""
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
-    voter = models.ForeignKey(User, on_delete=models.CASCADE, related_name='voter_records')
+    voter = models.ForeignKey(User, on_delete=models.CASCADE, related_name='voter_records', db_index=False)  # Covered by unique (voter, election)
     election = models.ForeignKey(Election, on_delete=models.CASCADE, related_name='voter_records')
     voted_at = models.DateTimeField(auto_now_add=True)
     verification_code = models.CharField(max_length=20, unique=True)  # For voter to verify their vote was counted
@@ -174,42 +370,164 @@ class VoterRecord(models.Model):
         return f"{self.voter.matric_number} voted in {self.election.title}"
 
 
+class EligibleVoter(models.Model):
+    """Membership of an election's frozen eligibility roll"""
+    id = models.BigAutoField(primary_key=True)
+    election = models.ForeignKey(Election, on_delete=models.CASCADE, related_name='roll', db_index=False)  # Covered by unique (election, voter)
+    voter = models.ForeignKey(User, on_delete=models.CASCADE, related_name='eligibility')
+
+    class Meta:
+        unique_together = ['election', 'voter']
+
+    def __str__(self):
+        return f"{self.voter_id} eligible in {self.election_id}"
+
+
+# ==================== TALLIES ====================
+
+class TallyShard(models.Model):
+    """One slice of a sharded vote counter; the counter's value is the sum of its shards (see tallies.py)"""
+    BALLOTS = 0  # Counter of ballots cast; candidate counters use the candidate's ordinal
+
+    id = models.BigAutoField(primary_key=True)
+    election = models.ForeignKey(Election, on_delete=models.CASCADE, related_name='tally_shards', db_index=False)  # Covered by unique (election, counter, shard)
+    counter = models.PositiveSmallIntegerField()
+    shard = models.PositiveSmallIntegerField()
+    count = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        unique_together = ['election', 'counter', 'shard']
+
+    def __str__(self):
+        return f"{self.election_id} counter {self.counter} shard {self.shard}: {self.count}"
+
+
+class TurnoutRollup(models.Model):
+    """Ballots cast per minute, department or level of an election (see turnout.py)"""
+    DIMENSION_CHOICES = [
+        ('minute', 'Minute'),
+        ('department', 'Department'),
+        ('level', 'Level'),
+    ]
+
+    id = models.BigAutoField(primary_key=True)
+    election = models.ForeignKey(Election, on_delete=models.CASCADE, related_name='turnout_rollups', db_index=False)  # Covered by unique (election, dimension, bucket)
+    dimension = models.CharField(max_length=10, choices=DIMENSION_CHOICES)
+    bucket = models.CharField(max_length=100, blank=True)  # UTC minute (YYYY-MM-DDTHH:MM) or the voter's department/level
+    count = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        unique_together = ['election', 'dimension', 'bucket']
+
+    def __str__(self):
+        return f"{self.election_id} {self.dimension} {self.bucket}: {self.count}"
+
+
+# ==================== RESULTS ====================
+
+class ResultSnapshot(models.Model):
+    """Immutable results frozen when an election closes"""
+    election = models.OneToOneField(Election, on_delete=models.CASCADE, related_name='result_snapshot')
+    payload = models.JSONField()  # Positions, candidates and tallies as served to clients
+    total_votes = models.PositiveIntegerField(default=0)
+    total_voters = models.PositiveIntegerField(default=0)
+    ballots_cast = models.PositiveIntegerField(default=0)
+    turnout = models.FloatField(default=0)
+    ledger_root = models.CharField(max_length=64)  # SHA-256 over the sorted vote hashes
+    artifact = models.FileField(upload_to='results/', blank=True)  # Static JSON copy of payload
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ['-created_at']
+
+    def __str__(self):
+        return f"Results for {self.election.title}"
+
+
 # ==================== AUDIT & SECURITY ====================
 
+class UserAgent(models.Model):
+    """A distinct User-Agent string, referenced by audit entries"""
+    MAX_LENGTH = 512  # Longer strings are truncated before interning
+
+    value = models.CharField(max_length=MAX_LENGTH, unique=True)
+
+    def __str__(self):
+        return self.value
+
+
+class IPAddress(models.Model):
+    """A distinct client address, referenced by audit entries"""
+    address = models.GenericIPAddressField(unique=True)
+
+    def __str__(self):
+        return self.address
+
+
 class AuditLog(models.Model):
-    """System audit trail for all administrative actions"""
-    ACTION_TYPES = (
-        ('create', 'Create'),
-        ('update', 'Update'),
-        ('delete', 'Delete'),
-        ('login', 'Login'),
-        ('logout', 'Logout'),
-        ('vote', 'Vote Cast'),
-        ('election_start', 'Election Started'),
-        ('election_close', 'Election Closed'),
-    )
-    
+    """System audit trail: event codes with their parameters (see audit.py)"""
+    class Event(models.IntegerChoices):
+        LEGACY = 0, 'Legacy entry'
+        VOTER_CREATED = 1, 'Voter account created'
+        ADMIN_CREATED = 2, 'Admin account created'
+        ADMIN_LOGIN = 3, 'Admin login'
+        VOTER_LOGIN = 4, 'Voter login'
+        LOGOUT = 5, 'Logout'
+        ELECTION_CREATED = 10, 'Election created'
+        ELECTION_UPDATED = 11, 'Election updated'
+        ELECTION_DELETED = 12, 'Election deleted'
+        CANDIDATE_ADDED = 20, 'Candidate added'
+        CANDIDATE_UPDATED = 21, 'Candidate updated'
+        CANDIDATE_DELETED = 22, 'Candidate deleted'
+        CANDIDATES_IMPORTED = 23, 'Candidates imported'
+        VOTE_CAST = 30, 'Vote cast'
+
+    # Message of each event, formatted with the entry's params
+    MESSAGES = {
+        Event.LEGACY: '{text}',
+        Event.VOTER_CREATED: 'Voter account created',
+        Event.ADMIN_CREATED: 'Admin account created for {username}',
+        Event.ADMIN_LOGIN: 'Admin login',
+        Event.VOTER_LOGIN: 'Voter login',
+        Event.LOGOUT: 'User logout',
+        Event.ELECTION_CREATED: 'Created election: {title}',
+        Event.ELECTION_UPDATED: 'Updated election: {title}',
+        Event.ELECTION_DELETED: 'Deleted election: {title}',
+        Event.CANDIDATE_ADDED: 'Added candidate: {name}',
+        Event.CANDIDATE_UPDATED: 'Updated candidate: {name}',
+        Event.CANDIDATE_DELETED: 'Deleted candidate: {name}',
+        Event.CANDIDATES_IMPORTED: 'Imported {candidates} candidates and {positions} new positions into {title}',
+        Event.VOTE_CAST: 'Voted in election: {title}',
+    }
+
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
     user = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, related_name='audit_logs')
-    action_type = models.CharField(max_length=20, choices=ACTION_TYPES)
-    description = models.TextField()
-    ip_address = models.GenericIPAddressField(blank=True, null=True)
-    user_agent = models.TextField(blank=True)
+    event = models.PositiveSmallIntegerField(choices=Event.choices)
+    params = models.JSONField(default=dict, blank=True)
+    ip = models.ForeignKey(IPAddress, on_delete=models.PROTECT, null=True, blank=True, related_name='+', db_index=False)
+    agent = models.ForeignKey(UserAgent, on_delete=models.PROTECT, null=True, blank=True, related_name='+', db_index=False)
     timestamp = models.DateTimeField(auto_now_add=True)
     
-    # Optional: Store affected object details
-    content_type = models.CharField(max_length=50, blank=True)
-    object_id = models.CharField(max_length=100, blank=True)
+    # Election the entry concerns; not a foreign key, so entries outlive the election
+    object_id = models.UUIDField(null=True, blank=True)
     
     class Meta:
         ordering = ['-timestamp']
         indexes = [
             models.Index(fields=['user', 'timestamp']),
-            models.Index(fields=['action_type', 'timestamp']),
+            models.Index(fields=['event', 'timestamp']),
+            models.Index(fields=['timestamp']),  # Newest-first admin changelist
         ]
     
     def __str__(self):
-        return f"{self.action_type} by {self.user} at {self.timestamp}"
+        return f"{self.get_event_display()} by {self.user} at {self.timestamp}"
+
+    @property
+    def description(self):
+        try:
+            return self.MESSAGES[self.event].format(**self.params)
+        except (KeyError, IndexError):
+            return self.get_event_display()
 
 
 class SystemSetting(models.Model):
@@ -0,0 +1,191 @@
+"""
+Bulk candidate import.
+
+Officers set up an election from a CSV file with one candidate per row and,
+optionally, a zip of photos named in its ``photo`` column. ``matric_number``
+and ``position`` are required; ``full_name``, ``department`` and ``level``
+default to the voter's profile, and ``manifesto`` to blank. Positions not
+yet in the election are created in the order they first appear.
+
+The import is all or nothing: every row is checked before anything is
+written, and any error (an unknown matric number, a voter listed twice for
+a position, a missing photo) rejects the whole file with a line-numbered
+list of problems.
+
+Matric numbers, positions and existing candidacies are resolved with one
+query each (batched under SQLite's parameter limit), instead of the lookups
+the candidate form makes per candidate. Photos are stored and their
+variants rendered in a thread pool before the transaction opens; Pillow
+releases the GIL while resizing and encoding, so this is most of the work
+done in parallel. Missing positions and the candidates are then written
+with one bulk insert each, numbered after the election's existing
+candidates (renumbered and retried if a concurrent writer took the same
+ordinals). Bulk inserts skip the post_save signal, so the search index is
+rebuilt afterwards.
+"""
+import csv
+import io
+import posixpath
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db.models import Max
+
+from .images import render_photo_variants
+from .models import Candidate, Position, User
+from .search import rebuild_index
+
+REQUIRED_COLUMNS = {'matric_number', 'position'}
+MAX_ROWS = 2000
+MAX_PHOTO_BYTES = 10 * 1024 * 1024  # Uncompressed size of one photo in the zip
+MAX_ERRORS = 20  # Problems listed before the rest are summarised
+DEFAULT_WORKERS = 4
+LOOKUP_BATCH = 900
+
+
+class NominationError(Exception):
+    def __init__(self, errors):
+        self.errors = errors
+        super().__init__('\n'.join(errors))
+
+
+def read_rows(handle):
+    """Rows of a candidate CSV (text stream) as dicts with their line numbers, values stripped"""
+    reader = csv.DictReader(handle)
+    columns = {(name or '').strip().lower() for name in reader.fieldnames or []}
+    missing = REQUIRED_COLUMNS - columns
+    if missing:
+        raise NominationError([f"The CSV has no {', '.join(sorted(missing))} column."])
+
+    rows = []
+    for record in reader:
+        values = {(key or '').strip().lower(): (value or '').strip() for key, value in record.items() if key}
+        if not any(values.values()):
+            continue  # Blank line
+        values['line'] = reader.line_num
+        rows.append(values)
+        if len(rows) > MAX_ROWS:
+            raise NominationError([f'The CSV has more than {MAX_ROWS} candidates; split it into smaller files.'])
+    if not rows:
+        raise NominationError(['The CSV has no candidates.'])
+    return rows
+
+
+def _photo_members(photos):
+    """Photo zip members by full path and, where unambiguous, by file name"""
+    members, by_name = {}, {}
+    for info in photos.infolist():
+        if info.is_dir():
+            continue
+        members[info.filename] = info
+        by_name.setdefault(posixpath.basename(info.filename), []).append(info)
+    members.update({name: infos[0] for name, infos in by_name.items() if len(infos) == 1 and name not in members})
+    return members
+
+
+def _lookup(queryset, field, values, *columns):
+    values, found = sorted(values), []
+    for start in range(0, len(values), LOOKUP_BATCH):
+        found.extend(queryset.filter(**{f'{field}__in': values[start:start + LOOKUP_BATCH]}).values_list(*columns))
+    return found
+
+
+def _store_photo(photos, info):
+    """Save one zip member as a candidate photo; returns its storage name and rendered variants"""
+    holder = Candidate()
+    holder.photo.save(posixpath.basename(info.filename), ContentFile(photos.read(info)), save=False)
+    return holder.photo.name, render_photo_variants(holder)
+
+
+def import_candidates(election, rows, photos=None, workers=DEFAULT_WORKERS):
+    """Create the candidates in ``rows`` (from read_rows); ``photos`` is an open ZipFile. Returns counts."""
+    errors = []
+    users = {
+        matric: (user_id, first, last, department, level)
+        for matric, user_id, first, last, department, level in _lookup(
+            User.objects.all(), 'matric_number', {row['matric_number'] for row in rows},
+            'matric_number', 'id', 'first_name', 'last_name', 'department', 'level',
+        )
+    }
+    titles = list(dict.fromkeys(row['position'] for row in rows if row['position']))  # First appearance order
+    positions = dict(_lookup(Position.objects.filter(election=election), 'title', titles, 'title', 'id'))
+    taken = set(_lookup(
+        Candidate.objects.filter(position__election=election), 'user_id',
+        {user[0] for user in users.values()}, 'position_id', 'user_id',
+    ))
+    members = _photo_members(photos) if photos else {}
+
+    seen, planned = set(), []
+    for row in rows:
+        line = row['line']
+        if not row['position']:
+            errors.append(f'Line {line}: no position.')
+            continue
+        user = users.get(row['matric_number'])
+        if user is None:
+            errors.append(f"Line {line}: no voter has matric number {row['matric_number'] or '(blank)'}.")
+            continue
+        user_id, first, last, department, level = user
+        key = (row['position'], user_id)
+        if key in seen or (positions.get(row['position']), user_id) in taken:
+            errors.append(f"Line {line}: {row['matric_number']} is already a candidate for {row['position']}.")
+            continue
+        seen.add(key)
+        photo = row.get('photo', '')
+        if photo:
+            info = members.get(photo)
+            if info is None:
+                errors.append(f'Line {line}: {photo} is not in the photo archive.')
+                continue
+            if info.file_size > MAX_PHOTO_BYTES:
+                errors.append(f'Line {line}: {photo} is larger than {MAX_PHOTO_BYTES // (1024 * 1024)} MB.')
+                continue
+        planned.append((row, Candidate(
+            user_id=user_id,
+            full_name=row.get('full_name') or f'{first} {last}'.strip() or row['matric_number'],
+            department=row.get('department') or department or '',
+            level=row.get('level') or level or '',
+            manifesto=row.get('manifesto', ''),
+        )))
+    if errors:
+        if len(errors) > MAX_ERRORS:
+            errors = errors[:MAX_ERRORS] + [f'... and {len(errors) - MAX_ERRORS} more problems.']
+        raise NominationError(errors)
+
+    # Each member is stored once, however many rows name it
+    uploads = list(dict.fromkeys(members[row['photo']] for row, _ in planned if row.get('photo')))
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+        stored = dict(zip(uploads, pool.map(lambda info: _store_photo(photos, info), uploads)))
+    for row, candidate in planned:
+        if row.get('photo'):
+            candidate.photo, candidate.photo_variants = stored[members[row['photo']]]
+
+    def write(ordinal):
+        # Runs again from the top if a concurrent writer took the ordinals
+        order = (Position.objects.filter(election=election).aggregate(highest=Max('order'))['highest'] or 0) + 1
+        new_positions = Position.objects.bulk_create([
+            Position(election=election, title=title, order=order + index)
+            for index, title in enumerate(title for title in titles if title not in positions)
+        ])
+        position_ids = {**positions, **{position.title: position.pk for position in new_positions}}
+        for index, (row, candidate) in enumerate(planned):
+            candidate.position_id = position_ids[row['position']]
+            candidate.ordinal = ordinal + index
+        Candidate.objects.bulk_create([candidate for row, candidate in planned])
+        return new_positions
+
+    try:
+        new_positions = Candidate.allocate_ordinals(election.pk, write)
+    except Exception:
+        for name, _ in stored.values():
+            default_storage.delete(name)  # Variants are content-addressed and may be shared; leave them
+        raise
+
+    rebuild_index()
+    return {'candidates': len(planned), 'positions': len(new_positions), 'photos': len(stored)}
+
+
+def open_csv(binary):
+    """A text stream over an uploaded or opened CSV file; tolerates the BOM spreadsheets write"""
+    return io.TextIOWrapper(binary, encoding='utf-8-sig', newline='')
@@ -0,0 +1,60 @@
+"""
+Per-session cache of the elections a voter has already voted in.
+
+The cache is filled from VoterRecord with one query the first time a voting
+page needs it and updated when a ballot is committed, so the election
+selector and the success and already-voted pages do not query VoterRecord
+again. The unique (voter, election) constraint stays the source of truth at
+commit time.
+"""
+from collections import namedtuple
+
+from django.utils.dateparse import parse_datetime
+
+from .models import VoterRecord
+
+SESSION_KEY = 'participation'
+
+Participation = namedtuple('Participation', ['verification_code', 'voted_at'])
+
+
+def _elections(request, refresh=False):
+    cached = request.session.get(SESSION_KEY)
+    if refresh or not cached or cached.get('voter') != request.user.pk:
+        records = VoterRecord.objects.filter(voter=request.user).values_list(
+            'election_id', 'verification_code', 'voted_at'
+        )
+        cached = {
+            'voter': request.user.pk,
+            'elections': {
+                str(election_id): [code, voted_at.isoformat()]
+                for election_id, code, voted_at in records
+            },
+        }
+        request.session[SESSION_KEY] = cached
+    return cached['elections']
+
+
+def voted_election_ids(request):
+    """Ids (as strings) of every election the current voter has voted in"""
+    return set(_elections(request))
+
+
+def get_participation(request, election_id):
+    """The voter's receipt for an election, or None if they have not voted in it"""
+    entry = _elections(request).get(str(election_id))
+    if entry is None:
+        return None
+    return Participation(entry[0], parse_datetime(entry[1]))
+
+
+def record_participation(request, record):
+    """Add a freshly committed VoterRecord to the cache"""
+    elections = _elections(request)
+    elections[str(record.election_id)] = [record.verification_code, record.voted_at.isoformat()]
+    request.session.modified = True
+
+
+def refresh_participation(request):
+    """Reload the cache, e.g. after a ballot was committed from another session"""
+    _elections(request, refresh=True)
@@ -0,0 +1,137 @@
+"""
+On-demand request profiling for staff.
+
+An admin adds ``?_profile=1`` to a URL (or sends ``X-Profile: 1``) and the
+request runs under cProfile, or under pyinstrument when it is installed and
+``?_profile=pyinstrument`` / ``X-Profile: pyinstrument`` is used. The capture
+(view name, timings, SQL queries and the profile itself) goes into a bounded
+in-memory ring buffer of this process, listed at /adm/profiles/. With several
+worker processes each keeps its own buffer.
+"""
+import cProfile
+import io
+import marshal
+import pstats
+import threading
+import time
+import uuid
+from collections import deque
+
+from django.conf import settings
+from django.db import connection
+from django.utils import timezone
+
+try:
+    from pyinstrument import Profiler as Pyinstrument
+except ImportError:  # Optional dependency
+    Pyinstrument = None
+
+QUERY_PARAM = '_profile'
+HEADER = 'X-Profile'
+MAX_QUERIES = 500
+STATS_LINES = 60
+
+_captures = deque(maxlen=getattr(settings, 'PROFILE_BUFFER_SIZE', 50))
+_lock = threading.Lock()
+
+
+def captures():
+    """Captured profiles, newest first"""
+    with _lock:
+        return list(reversed(_captures))
+
+
+def get_capture(capture_id):
+    with _lock:
+        return next((capture for capture in _captures if capture['id'] == capture_id), None)
+
+
+def clear_captures():
+    with _lock:
+        _captures.clear()
+
+
+def requested_profiler(request):
+    """'cprofile', 'pyinstrument' or None when the request did not ask to be profiled"""
+    flag = request.GET.get(QUERY_PARAM) or request.headers.get(HEADER)
+    if not flag or flag in ('0', 'false'):
+        return None
+    if flag == 'pyinstrument' and Pyinstrument is not None:
+        return 'pyinstrument'
+    return 'cprofile'
+
+
+def can_profile(user):
+    return user.is_authenticated and (getattr(user, 'user_type', None) == 'admin' or user.is_staff)
+
+
+class QueryRecorder:
+    """execute_wrapper that keeps the SQL and duration of every query"""
+
+    def __init__(self):
+        self.queries = []
+        self.count = 0
+        self.total = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            duration = time.perf_counter() - started
+            self.count += 1
+            self.total += duration
+            if len(self.queries) < MAX_QUERIES:
+                self.queries.append({'sql': sql, 'ms': round(duration * 1000, 3), 'many': many})
+
+
+class ProfilingMiddleware:
+    """Profile requests from staff that ask for it; everyone else passes straight through"""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        kind = requested_profiler(request) if getattr(settings, 'PROFILING_ENABLED', True) else None
+        if kind is None or not can_profile(request.user):
+            return self.get_response(request)
+
+        recorder = QueryRecorder()
+        profiler = Pyinstrument() if kind == 'pyinstrument' else cProfile.Profile()
+        started_at = timezone.now()
+        started = time.perf_counter()
+        with connection.execute_wrapper(recorder):
+            profiler.start() if kind == 'pyinstrument' else profiler.enable()
+            try:
+                response = self.get_response(request)
+            finally:
+                profiler.stop() if kind == 'pyinstrument' else profiler.disable()
+        duration = time.perf_counter() - started
+
+        capture = {
+            'id': uuid.uuid4().hex,
+            'kind': kind,
+            'method': request.method,
+            'path': request.get_full_path(),
+            'view': request.resolver_match.view_name if request.resolver_match else '',
+            'status': response.status_code,
+            'user': request.user.get_username(),
+            'started_at': started_at,
+            'duration_ms': round(duration * 1000, 1),
+            'query_count': recorder.count,
+            'query_ms': round(recorder.total * 1000, 1),
+            'queries': recorder.queries,
+        }
+        if kind == 'pyinstrument':
+            capture['summary'] = profiler.output_text(unicode=True, color=False)
+            capture['data'] = profiler.output_html().encode()
+        else:
+            stats = pstats.Stats(profiler, stream=io.StringIO())
+            stats.sort_stats('cumulative').print_stats(STATS_LINES)
+            capture['summary'] = stats.stream.getvalue()
+            capture['data'] = marshal.dumps(stats.stats)  # Same format as pstats.dump_stats()
+        with _lock:
+            _captures.append(capture)
+
+        response['X-Profile-Id'] = capture['id']
+        return response
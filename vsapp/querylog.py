@@ -0,0 +1,189 @@
+"""
+Slow-query log and per-view query fingerprints.
+
+``QueryLogMiddleware`` wraps every request's database work in
+``connection.execute_wrapper``. Each statement is reduced to a fingerprint
+(literals, placeholders and IN/VALUES lists collapsed) and counted per view
+with its total and worst time, so the same query fired once per row by a
+model property in a template loop shows up as one fingerprint with a large
+count. Statements slower than ``QUERY_LOG_SLOW_MS`` are logged to the
+``vsapp.querylog`` logger with the lines in ``vsapp/views.py`` and
+``vsapp/models.py`` that issued them.
+
+Each process keeps its counters in memory and writes them to its own file in
+``QUERY_LOG_DIR`` every ``QUERY_LOG_FLUSH_INTERVAL`` seconds and at exit;
+``manage.py top_queries`` merges the files.
+"""
+import atexit
+import json
+import logging
+import os
+import re
+import socket
+import sys
+import threading
+import time
+from functools import lru_cache
+from pathlib import Path
+
+from django.conf import settings
+from django.db import connection
+
+logger = logging.getLogger(__name__)
+
+_LITERALS = [
+    (re.compile(r"'(?:[^']|'')*'"), '?'),
+    (re.compile(r"\bX'[0-9A-Fa-f]*'"), '?'),
+    (re.compile(r'%s|\?|\b\d+(?:\.\d+)?\b'), '?'),
+    (re.compile(r'\bIN\s*\(\s*\?(?:\s*,\s*\?)*\s*\)', re.IGNORECASE), 'IN (...)'),
+    (re.compile(r'(\bVALUES\s*\([^()]*\))(?:\s*,\s*\([^()]*\))+', re.IGNORECASE), r'\1, ...'),
+    (re.compile(r'\s+'), ' '),
+]
+# Where a query came from: the view that ran it, or the model property a template called
+SOURCE_FILES = {
+    str(Path(__file__).resolve().with_name('views.py')),
+    str(Path(__file__).resolve().with_name('models.py')),
+}
+APP_ROOT = str(Path(__file__).resolve().parent.parent)
+
+_stats = {}
+_lock = threading.Lock()
+_flush_lock = threading.Lock()
+_last_flush = time.monotonic()
+
+
+@lru_cache(maxsize=2048)
+def fingerprint(sql):
+    """The statement with every literal and placeholder replaced by ``?``"""
+    for pattern, replacement in _LITERALS:
+        sql = pattern.sub(replacement, sql)
+    return sql.strip()
+
+
+def source_location():
+    """``file:line in function`` for each vsapp view/model frame on the stack, innermost first"""
+    frames = []
+    frame = sys._getframe(1)
+    while frame is not None:
+        if frame.f_code.co_filename in SOURCE_FILES:
+            path = os.path.relpath(frame.f_code.co_filename, APP_ROOT)
+            frames.append(f'{path}:{frame.f_lineno} in {frame.f_code.co_name}')
+        frame = frame.f_back
+    return ' < '.join(frames)
+
+
+def record(view, sql, duration):
+    """Count one statement against its view and fingerprint; returns the fingerprint"""
+    key = (view, fingerprint(sql))
+    with _lock:
+        entry = _stats.get(key)
+        if entry is None:
+            # Only the first occurrence pays for the stack walk
+            _stats[key] = {'count': 1, 'total': duration, 'max': duration, 'location': source_location()}
+        else:
+            entry['count'] += 1
+            entry['total'] += duration
+            entry['max'] = max(entry['max'], duration)
+    return key[1]
+
+
+def snapshot():
+    """This process's counters as a list of rows"""
+    with _lock:
+        return [{'view': view, 'fingerprint': fp, **entry} for (view, fp), entry in _stats.items()]
+
+
+def reset():
+    with _lock:
+        _stats.clear()
+
+
+def stats_dir():
+    return Path(getattr(settings, 'QUERY_LOG_DIR', Path(settings.BASE_DIR) / 'querylog'))
+
+
+def stats_path():
+    return stats_dir() / f'{socket.gethostname()}-{os.getpid()}.json'
+
+
+def flush():
+    """Write this process's counters to its file in QUERY_LOG_DIR"""
+    global _last_flush
+    with _flush_lock:
+        _last_flush = time.monotonic()
+        rows = snapshot()
+        if not rows:
+            return
+        path = stats_path()
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_suffix('.tmp')
+        tmp.write_text(json.dumps(rows))
+        os.replace(tmp, path)  # Readers never see a half-written file
+
+
+def load_all():
+    """Counters from every process that has flushed, merged per view and fingerprint"""
+    merged = {}
+    for path in sorted(stats_dir().glob('*.json')):
+        try:
+            rows = json.loads(path.read_text())
+        except (OSError, ValueError):
+            continue
+        for row in rows:
+            entry = merged.setdefault((row['view'], row['fingerprint']), {
+                'view': row['view'], 'fingerprint': row['fingerprint'], 'count': 0, 'total': 0.0, 'max': 0.0,
+                'location': row['location'],
+            })
+            entry['count'] += row['count']
+            entry['total'] += row['total']
+            entry['max'] = max(entry['max'], row['max'])
+    return list(merged.values())
+
+
+def clear_all():
+    reset()
+    for path in stats_dir().glob('*.json'):
+        path.unlink(missing_ok=True)
+
+
+class _Recorder:
+    """execute_wrapper for one request"""
+
+    def __init__(self, request):
+        self.request = request
+        self.slow = getattr(settings, 'QUERY_LOG_SLOW_MS', 100) / 1000
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            duration = time.perf_counter() - started
+            match = self.request.resolver_match
+            view = match.view_name if match else '-'
+            fp = record(view, sql, duration)
+            if duration >= self.slow:
+                logger.warning(
+                    'Slow query (%.1f ms) in %s at %s: %s',
+                    duration * 1000, view, source_location() or 'unknown', fp,
+                )
+
+
+class QueryLogMiddleware:
+    """Fingerprint and time every query a request makes"""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.enabled = getattr(settings, 'QUERY_LOG_ENABLED', True)
+        self.interval = getattr(settings, 'QUERY_LOG_FLUSH_INTERVAL', 30)
+        if self.enabled:
+            atexit.register(flush)
+
+    def __call__(self, request):
+        if not self.enabled:
+            return self.get_response(request)
+        with connection.execute_wrapper(_Recorder(request)):
+            response = self.get_response(request)
+        if time.monotonic() - _last_flush >= self.interval:
+            flush()
+        return response
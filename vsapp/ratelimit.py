@@ -0,0 +1,140 @@
+"""
+Token-bucket rate limiting for the expensive endpoints.
+
+Budgets live in ``settings.RATE_LIMITS``, keyed by URL name. Each budget can
+limit the client IP, the identity behind the request (signed-in user, the
+account waiting for its OTP, or the matric number or username being tried)
+and the endpoint as a whole. Buckets are stored in the default cache, so use a shared
+backend (Redis, Memcached or the database cache) when running several worker
+processes. The read-modify-write on a bucket is not atomic; a burst of
+simultaneous requests may get a few more tokens than the budget allows.
+"""
+import hashlib
+import math
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.http import HttpResponse, JsonResponse
+
+CACHE_PREFIX = 'ratelimit'
+SCOPES = ('ip', 'identity', 'endpoint')
+
+
+def take_token(key, burst, per_minute, now=None):
+    """
+    Take one token from the bucket at ``key``.
+
+    Returns ``(allowed, retry_after)``; ``retry_after`` is the number of seconds
+    until a token is available again when the request is refused.
+    """
+    now = time.time() if now is None else now
+    rate = per_minute / 60.0
+    tokens, updated = cache.get(key, (float(burst), now))
+    tokens = min(float(burst), tokens + (now - updated) * rate)
+    allowed = tokens >= 1
+    if allowed:
+        tokens -= 1
+    # Expire the bucket once it would have refilled anyway
+    cache.set(key, (tokens, now), timeout=math.ceil(burst / rate) + 1)
+    return allowed, 0 if allowed else math.ceil((1 - tokens) / rate)
+
+
+def client_ip(request):
+    return request.META.get('REMOTE_ADDR', '')
+
+
+def client_identity(request):
+    """Who the request acts for, as far as can be told before the view runs"""
+    if request.user.is_authenticated:
+        return f'user:{request.user.pk}'
+    pending = request.session.get('pending_otp_user_id')
+    if pending:
+        return f'pending:{pending}'
+    if request.method == 'POST':
+        matric = request.POST.get('matric_number')
+        if matric:
+            return f'matric:{matric.strip().upper()}'
+        username = request.POST.get('username')
+        if username:
+            return f'username:{username.strip().lower()}'
+    return None
+
+
+def _rejected_key(endpoint, scope):
+    return f'{CACHE_PREFIX}:rejected:{endpoint}:{scope}'
+
+
+def record_rejection(endpoint, scope):
+    key = _rejected_key(endpoint, scope)
+    if not cache.add(key, 1, timeout=None):
+        try:
+            cache.incr(key)
+        except ValueError:  # Evicted between add() and incr()
+            cache.set(key, 1, timeout=None)
+
+
+def rejection_counts():
+    """Rejected requests per endpoint and scope since the cache was last cleared"""
+    keys = {
+        _rejected_key(endpoint, scope): (endpoint, scope)
+        for endpoint, budget in getattr(settings, 'RATE_LIMITS', {}).items()
+        for scope in SCOPES if scope in budget
+    }
+    values = cache.get_many(list(keys))
+    counts = {}
+    for key, (endpoint, scope) in keys.items():
+        counts.setdefault(endpoint, {})[scope] = values.get(key, 0)
+    return counts
+
+
+def reset_rejection_counts():
+    cache.delete_many([
+        _rejected_key(endpoint, scope)
+        for endpoint in getattr(settings, 'RATE_LIMITS', {}) for scope in SCOPES
+    ])
+
+
+def too_many_requests(request, retry_after):
+    message = f'Too many requests. Please try again in {retry_after} seconds.'
+    if request.path.startswith('/api/') or 'application/json' in request.headers.get('Accept', ''):
+        response = JsonResponse({'error': message, 'retry_after': retry_after}, status=429)
+    else:
+        response = HttpResponse(message, status=429, content_type='text/plain; charset=utf-8')
+    response['Retry-After'] = str(retry_after)
+    return response
+
+
+class RateLimitMiddleware:
+    """Refuse requests over their endpoint's budget with 429 and Retry-After"""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        return self.get_response(request)
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        if not getattr(settings, 'RATE_LIMIT_ENABLED', True) or request.resolver_match is None:
+            return None
+        endpoint = request.resolver_match.url_name
+        budget = getattr(settings, 'RATE_LIMITS', {}).get(endpoint)
+        if not budget or request.method not in budget.get('methods', ('POST',)):
+            return None
+
+        subjects = {'ip': client_ip(request), 'identity': None, 'endpoint': '*'}
+        if 'identity' in budget:
+            subjects['identity'] = client_identity(request)
+
+        # The endpoint-wide bucket goes last so refused clients do not drain it
+        for scope in SCOPES:
+            if scope not in budget or subjects[scope] is None:
+                continue
+            burst, per_minute = budget[scope]
+            # Hashed so client-supplied values are always valid cache keys
+            subject = hashlib.blake2b(subjects[scope].encode(), digest_size=12).hexdigest()
+            allowed, retry_after = take_token(f'{CACHE_PREFIX}:{endpoint}:{scope}:{subject}', burst, per_minute)
+            if not allowed:
+                record_rejection(endpoint, scope)
+                return too_many_requests(request, retry_after)
+        return None
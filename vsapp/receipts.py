@@ -0,0 +1,92 @@
+"""
+Receipt verification.
+
+A voter's receipt is the ``verification_code`` of their VoterRecord; it is
+written in the same transaction as their votes, so a receipt on file means
+the ballot was counted. Checking one is a probe of the unique index on
+``verification_code``.
+
+Observers check receipts in bulk once an election closes, and most of the
+codes they send are expected to be valid, but a bulk check must not turn
+into thousands of probes for codes that were never issued. Each process
+keeps, per closed election, a sorted array of the 64-bit BLAKE2b digests of
+its receipts. A code whose digest is not in the array is rejected without a
+query. Codes that are in it are confirmed against the database in batches,
+so a digest collision can never confirm a code that does not exist. Closed
+elections do not gain receipts, so an index stays valid until the election
+is saved again (e.g. reopened), which changes ``updated_at`` and the cache
+key. Active elections are checked against the database only.
+"""
+import bisect
+import hashlib
+import threading
+from array import array
+from collections import OrderedDict
+
+from .models import VoterRecord
+
+MAX_INDEXES = 8  # Closed elections kept in memory per process, least recently used evicted
+BULK_LIMIT = 1000  # Codes per bulk request
+LOOKUP_BATCH = 900  # Codes per IN (...) query; SQLite allows 999 parameters
+
+_indexes = OrderedDict()
+_lock = threading.Lock()
+
+
+def receipt_digest(code):
+    return int.from_bytes(hashlib.blake2b(code.encode(), digest_size=8).digest(), 'big')
+
+
+class ReceiptIndex:
+    """Sorted 64-bit digests of one election's receipts"""
+
+    def __init__(self, codes):
+        self.digests = array('Q', sorted(receipt_digest(code) for code in codes))
+
+    def __len__(self):
+        return len(self.digests)
+
+    def __contains__(self, code):
+        digest = receipt_digest(code)
+        position = bisect.bisect_left(self.digests, digest)
+        return position < len(self.digests) and self.digests[position] == digest
+
+
+def get_index(election):
+    """The receipt index of a closed election, built on first use; None for other elections"""
+    if election.status != 'closed':
+        return None
+    key = (election.pk, election.updated_at)
+    with _lock:
+        index = _indexes.get(key)
+        if index is None:
+            codes = VoterRecord.objects.filter(election=election).values_list('verification_code', flat=True)
+            index = ReceiptIndex(codes.iterator(chunk_size=5000))
+            # Drop indexes of earlier versions of this election, then the least recently used
+            for stale in [k for k in _indexes if k[0] == election.pk]:
+                del _indexes[stale]
+            _indexes[key] = index
+            while len(_indexes) > MAX_INDEXES:
+                _indexes.popitem(last=False)
+        else:
+            _indexes.move_to_end(key)
+    return index
+
+
+def clear_indexes():
+    with _lock:
+        _indexes.clear()
+
+
+def verify_receipts(election, codes):
+    """``{code: counted}`` for each receipt code (surrounding whitespace ignored)"""
+    codes = list(dict.fromkeys(code.strip() for code in codes))
+    index = get_index(election)
+    candidates = [code for code in codes if code and (index is None or code in index)]
+    counted = set()
+    for start in range(0, len(candidates), LOOKUP_BATCH):
+        counted.update(
+            VoterRecord.objects.filter(election=election, verification_code__in=candidates[start:start + LOOKUP_BATCH])
+            .values_list('verification_code', flat=True)
+        )
+    return {code: code in counted for code in codes}
@@ -0,0 +1,229 @@
+"""
+Result computation and frozen snapshots.
+
+Closed elections never change, so their results are computed once when the
+election closes and served from ``ResultSnapshot`` from then on. Exports of
+an election still open are cached per results version, so a burst of
+downloads builds the payload and its ledger root once.
+
+Pollers use ``results_delta``: the results version is the highest vote id,
+so a client that saw version ``v`` only needs the candidates that received a
+vote with a larger id. Live tallies come from the sharded counters in
+``tallies.py`` and are keyed by the candidates' per-election ordinals to keep
+the payload small.
+"""
+import hashlib
+import json
+
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import transaction
+from django.db.models import Count, Max
+
+from .models import Candidate, ResultSnapshot, TallyShard, Vote
+from .tallies import totals as tally_totals
+
+try:
+    import orjson
+except ImportError:  # Optional dependency
+    orjson = None
+
+# A client more votes behind than this gets a full snapshot instead of a delta
+DELTA_MAX_VOTES = 20000
+TALLY_CACHE_TIMEOUT = 60
+
+
+def ledger_root(election):
+    """SHA-256 over every ballot hash of the election (as hex), in hash order"""
+    digest = hashlib.sha256()
+    hashes = (
+        Vote.objects.filter(election=election)
+        .order_by('vote_hash')
+        .values_list('vote_hash', flat=True)
+    )
+    for vote_hash in hashes.iterator(chunk_size=2000):
+        digest.update(bytes(vote_hash).hex().encode())
+    return digest.hexdigest()
+
+
+def build_results(election):
+    """Compute the results payload for an election from the vote ledger"""
+    candidates = (
+        Candidate.objects.filter(position__election=election)
+        .annotate(vote_count_agg=Count('votes'))
+        .order_by('-vote_count_agg', 'full_name')
+    )
+    by_position = {}
+    for candidate in candidates:
+        by_position.setdefault(candidate.position_id, []).append(candidate)
+
+    positions = []
+    total_votes = 0
+    for position in election.positions.all():
+        position_candidates = by_position.get(position.id, [])
+        position_total = sum(c.vote_count_agg for c in position_candidates)
+        total_votes += position_total
+        positions.append({
+            'id': position.id,
+            'title': position.title,
+            'description': position.description,
+            'total_votes': position_total,
+            'candidates': [
+                {
+                    'id': c.id,
+                    'ordinal': c.ordinal,
+                    'full_name': c.full_name,
+                    'department': c.department,
+                    'level': c.level,
+                    'photo_url': c.photo_url,
+                    'vote_count': c.vote_count_agg,
+                    'vote_percentage': (c.vote_count_agg / position_total) * 100 if position_total else 0,
+                }
+                for c in position_candidates
+            ],
+        })
+
+    total_voters = election.eligible_voters
+    ballots_cast = election.voter_records.count()
+    return {
+        'election': {
+            'id': election.id,
+            'title': election.title,
+            'status': election.status,
+            'start_date': election.start_date,
+            'end_date': election.end_date,
+        },
+        'total_votes': total_votes,
+        'total_voters': total_voters,
+        'ballots_cast': ballots_cast,
+        'turnout': (ballots_cast / total_voters) * 100 if total_voters else 0,
+        'ledger_root': ledger_root(election),
+        'positions': positions,
+    }
+
+
+def freeze_results(election):
+    """Compute and store the final results snapshot for a closed election"""
+    payload = json.loads(json.dumps(build_results(election), cls=DjangoJSONEncoder))
+    with transaction.atomic():
+        previous = ResultSnapshot.objects.filter(election=election).first()
+        if previous:
+            previous.artifact.delete(save=False)
+            previous.delete()
+        snapshot = ResultSnapshot.objects.create(
+            election=election,
+            payload=payload,
+            total_votes=payload['total_votes'],
+            total_voters=payload['total_voters'],
+            ballots_cast=payload['ballots_cast'],
+            turnout=payload['turnout'],
+            ledger_root=payload['ledger_root'],
+        )
+    artifact = json.dumps(payload, separators=(',', ':')).encode()
+    snapshot.artifact.save(f'{election.id}.json', ContentFile(artifact), save=True)
+    return snapshot
+
+
+def get_snapshot(election):
+    """Return the frozen results of a closed election, freezing them on first use"""
+    try:
+        return election.result_snapshot
+    except ResultSnapshot.DoesNotExist:
+        return freeze_results(election)
+
+
+def dumps(payload):
+    """Compact JSON bytes, with orjson when it is installed"""
+    if orjson is not None:
+        return orjson.dumps(payload, option=orjson.OPT_NON_STR_KEYS)
+    return json.dumps(payload, cls=DjangoJSONEncoder, separators=(',', ':')).encode()
+
+
+def results_version():
+    """Highest vote id so far; it grows with every ballot in any election"""
+    return Vote.objects.aggregate(version=Max('id'))['version'] or 0
+
+
+def live_results(election):
+    """``build_results`` for an election still open, cached per results version"""
+    key = f'results:export:{election.pk.hex}:{results_version()}'
+    payload = cache.get(key)
+    if payload is None:
+        payload = build_results(election)
+        cache.set(key, payload, TALLY_CACHE_TIMEOUT)
+    return payload
+
+
+def tallies(election, version):
+    """Votes per candidate ordinal, ballots and eligible voters, cached per ``version``"""
+    if election.status == 'closed':
+        snapshot = get_snapshot(election)
+        return {
+            'counts': {
+                c['ordinal']: c['vote_count']
+                for position in snapshot.payload['positions'] for c in position['candidates']
+            },
+            'ballots': snapshot.ballots_cast,
+            'voters': snapshot.total_voters,
+        }
+
+    key = f'results:tallies:{election.pk.hex}:{version}'
+    cached = cache.get(key)
+    if cached is None:
+        counters = tally_totals(election)
+        ordinals = Candidate.objects.filter(position__election=election).values_list('ordinal', flat=True)
+        cached = {
+            'counts': {ordinal: counters.get(ordinal, 0) for ordinal in ordinals},
+            'ballots': counters.get(TallyShard.BALLOTS, 0),
+            'voters': election.eligible_voters,
+        }
+        # Every poller at this version shares one computation
+        cache.set(key, cached, TALLY_CACHE_TIMEOUT)
+    return cached
+
+
+def results_delta(election, since=None):
+    """
+    Results payload for a client that last saw version ``since``.
+
+    Only candidates with new votes are listed in ``c``, unless the client has
+    no version, a version from the future or is too far behind, in which case
+    ``full`` is true and every candidate is listed with the positions they
+    belong to.
+    """
+    version = results_version()
+    current = tallies(election, version)
+    full = since is None or since > version or version - since > DELTA_MAX_VOTES
+    if full:
+        changed = current['counts']
+    else:
+        # Walk the primary key range only: filtering on the election would make
+        # SQLite scan the election's whole (election, candidate) index instead
+        new_votes = (
+            Vote.objects.filter(id__gt=since, id__lte=version)
+            .order_by().values_list('election_id', 'candidate_id').distinct()
+        )
+        candidate_ids = [candidate_id for election_id, candidate_id in new_votes if election_id == election.pk]
+        ordinals = Candidate.objects.filter(id__in=candidate_ids).values_list('ordinal', flat=True) if candidate_ids else []
+        changed = {ordinal: current['counts'][ordinal] for ordinal in ordinals}
+
+    total_votes = sum(current['counts'].values())
+    payload = {
+        'v': version,
+        'full': full,
+        'status': election.status,
+        'c': changed,
+        'votes': total_votes,
+        'ballots': current['ballots'],
+        'turnout': round((current['ballots'] / current['voters']) * 100, 2) if current['voters'] else 0,
+    }
+    if full:
+        candidates = {}
+        for c in Candidate.objects.filter(position__election=election).values('position_id', 'ordinal', 'full_name'):
+            candidates.setdefault(c['position_id'], []).append([c['ordinal'], c['full_name']])
+        payload['positions'] = [
+            {'id': position.id.hex, 'title': position.title, 'candidates': candidates.get(position.id, [])}
+            for position in election.positions.all()
+        ]
+    return payload
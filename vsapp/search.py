@@ -0,0 +1,160 @@
+"""
+Candidate search backed by an SQLite FTS5 table.
+
+``vsapp_candidate_fts`` holds each candidate's name, department, matric
+number, position title and manifesto. Signal handlers in ``signals.py`` keep
+it in step with Candidate; ``manage.py rebuild_search_index`` repopulates it
+after bulk loads. On other databases the helpers fall back to ``icontains``
+filters.
+"""
+import re
+import uuid
+
+from django.db import connection
+from django.db.models import Q
+from django.db.models.expressions import RawSQL
+from django.utils.html import escape
+
+FTS_TABLE = 'vsapp_candidate_fts'
+FTS_COLUMNS = ['full_name', 'department', 'matric_number', 'position', 'manifesto']
+# bm25() column weights, in table order: candidate_id, then FTS_COLUMNS
+RANK_WEIGHTS = (0.0, 10.0, 3.0, 8.0, 4.0, 1.0)
+SNIPPET_TOKENS = 16
+
+# Control characters cannot appear in form input, so they are safe snippet markers
+_MARK_START, _MARK_END = '\x02', '\x03'
+
+
+def fts_enabled():
+    return connection.vendor == 'sqlite'
+
+
+def match_expression(query):
+    """Turn free text into an FTS5 query: every word must match, as a prefix"""
+    terms = re.findall(r'\w+', query.lower())
+    return ' '.join(f'"{term}"*' for term in terms)
+
+
+def _row(candidate):
+    return [
+        candidate.pk.hex,
+        candidate.full_name,
+        candidate.department,
+        candidate.user.matric_number or '',
+        candidate.position.title,
+        candidate.manifesto,
+    ]
+
+
+def index_candidate(candidate):
+    """Insert or refresh a candidate's row in the search index"""
+    if not fts_enabled():
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(f'DELETE FROM {FTS_TABLE} WHERE candidate_id = %s', [candidate.pk.hex])
+        cursor.execute(
+            f"INSERT INTO {FTS_TABLE} (candidate_id, {', '.join(FTS_COLUMNS)}) VALUES (%s, %s, %s, %s, %s, %s)",
+            _row(candidate),
+        )
+
+
+def unindex_candidate(candidate_id):
+    if not fts_enabled():
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(f'DELETE FROM {FTS_TABLE} WHERE candidate_id = %s', [candidate_id.hex])
+
+
+def rebuild_index():
+    """Repopulate the whole index from the candidate tables; returns the number of rows"""
+    if not fts_enabled():
+        return 0
+    from .models import Candidate, Position, User
+
+    with connection.cursor() as cursor:
+        cursor.execute(f'DELETE FROM {FTS_TABLE}')
+        cursor.execute(
+            f"INSERT INTO {FTS_TABLE} (candidate_id, {', '.join(FTS_COLUMNS)}) "
+            "SELECT c.id, c.full_name, c.department, COALESCE(u.matric_number, ''), p.title, c.manifesto "
+            f'FROM {Candidate._meta.db_table} c '
+            f'JOIN {User._meta.db_table} u ON u.id = c.user_id '
+            f'JOIN {Position._meta.db_table} p ON p.id = c.position_id'
+        )
+        count = cursor.rowcount
+        cursor.execute(f"INSERT INTO {FTS_TABLE} ({FTS_TABLE}) VALUES ('optimize')")
+    return count
+
+
+def search_candidates(queryset, query):
+    """Filter a Candidate queryset to those matching ``query``"""
+    if not fts_enabled():
+        return queryset.filter(
+            Q(full_name__icontains=query) |
+            Q(department__icontains=query) |
+            Q(user__matric_number__icontains=query) |
+            Q(position__title__icontains=query) |
+            Q(manifesto__icontains=query)
+        )
+    expression = match_expression(query)
+    if not expression:
+        return queryset.none()
+    return queryset.filter(id__in=RawSQL(
+        f'SELECT candidate_id FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s', [expression]
+    ))
+
+
+def _highlight(snippet):
+    return escape(snippet).replace(_MARK_START, '<mark>').replace(_MARK_END, '</mark>')
+
+
+def ranked_search(query, election_ids=None, limit=20):
+    """
+    Best matches for ``query`` as (candidate, score, manifesto snippet) tuples.
+
+    ``election_ids`` restricts results to those elections. Snippets are
+    HTML-escaped with the matched terms wrapped in <mark>.
+    """
+    from .models import Candidate, Position
+
+    candidates = Candidate.objects.select_related('position__election')
+    if election_ids is not None:
+        election_ids = list(election_ids)
+        if not election_ids:
+            return []
+        candidates = candidates.filter(position__election__in=election_ids)
+
+    if not fts_enabled():
+        matches = search_candidates(candidates, query)[:limit]
+        return [(candidate, 0.0, escape(candidate.manifesto[:200])) for candidate in matches]
+
+    expression = match_expression(query)
+    if not expression:
+        return []
+
+    sql = (
+        f"SELECT candidate_id, bm25({FTS_TABLE}, {', '.join(map(str, RANK_WEIGHTS))}), "
+        f"snippet({FTS_TABLE}, {FTS_COLUMNS.index('manifesto') + 1}, %s, %s, '...', {SNIPPET_TOKENS}) "
+        f'FROM {FTS_TABLE} '
+        f'JOIN {Candidate._meta.db_table} c ON c.id = {FTS_TABLE}.candidate_id '
+        f'JOIN {Position._meta.db_table} p ON p.id = c.position_id '
+        f'WHERE {FTS_TABLE} MATCH %s'
+    )
+    params = [_MARK_START, _MARK_END, expression]
+    if election_ids is not None:
+        sql += f" AND p.election_id IN ({', '.join(['%s'] * len(election_ids))})"
+        params += [uuid.UUID(str(election_id)).hex for election_id in election_ids]
+    sql += ' ORDER BY 2 LIMIT %s'
+    params.append(limit)
+
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        rows = cursor.fetchall()
+
+    by_id = candidates.in_bulk([uuid.UUID(row[0]) for row in rows])
+    results = []
+    for candidate_id, rank, snippet in rows:
+        candidate = by_id.get(uuid.UUID(candidate_id))
+        if candidate is not None:
+            # bm25() is lower-is-better and negative; report a positive score
+            results.append((candidate, round(-rank, 4), _highlight(snippet)))
+    return results
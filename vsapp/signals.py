@@ -0,0 +1,50 @@
+from django.core.signals import setting_changed
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .audit import clear_cache as clear_audit_cache
+
+from .models import Candidate, Position, TallyShard, User
+from .search import index_candidate, unindex_candidate
+
+# Fields copied into the candidate search index from related models
+INDEXED_USER_FIELDS = {'matric_number'}
+INDEXED_POSITION_FIELDS = {'title'}
+
+
+@receiver(post_save, sender=Candidate)
+def candidate_saved(sender, instance, raw=False, **kwargs):
+    if not raw:
+        index_candidate(instance)
+
+
+@receiver(post_delete, sender=Candidate)
+def candidate_deleted(sender, instance, **kwargs):
+    unindex_candidate(instance.pk)
+    # Its ordinal may be handed out again; the new candidate must start from zero
+    TallyShard.objects.filter(
+        election__positions=instance.position_id, counter=instance.ordinal,
+    ).delete()
+
+
+@receiver(post_save, sender=User)
+def user_saved(sender, instance, created, raw=False, update_fields=None, **kwargs):
+    # Logins and OTP checks save only a few fields; skip the lookup for those
+    if created or raw or (update_fields is not None and not INDEXED_USER_FIELDS & set(update_fields)):
+        return
+    for candidate in instance.candidacies.select_related('position'):
+        index_candidate(candidate)
+
+
+@receiver(post_save, sender=Position)
+def position_saved(sender, instance, created, raw=False, update_fields=None, **kwargs):
+    if created or raw or (update_fields is not None and not INDEXED_POSITION_FIELDS & set(update_fields)):
+        return
+    for candidate in instance.candidates.select_related('user'):
+        index_candidate(candidate)
+
+
+@receiver(setting_changed)
+def databases_changed(setting, **kwargs):
+    if setting == 'DATABASES':
+        clear_audit_cache()  # Interned ids belong to the databases they were read from
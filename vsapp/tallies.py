@@ -0,0 +1,111 @@
+"""
+Sharded vote counters.
+
+Every election keeps one counter per candidate (keyed by the candidate's
+ordinal) and one for ballots cast (``TallyShard.BALLOTS``). A counter is
+split over up to ``TALLY_SHARDS`` rows: each ballot commit adds to a shard
+picked at random, so concurrent ballots for the same front-runner update
+different rows instead of queueing on one. Reading a counter sums its shards,
+which is a handful of rows rather than a count over the vote ledger.
+
+Shard rows are created on first use with an upsert (``INSERT ... ON CONFLICT
+DO UPDATE``, SQLite 3.24+ and PostgreSQL). ``compact`` folds each counter
+back into a single row; ``rebuild`` recomputes an election's counters from
+the ledger after bulk loads that bypass ``ballots.write_ballots``.
+
+On SQLite the whole database has one writer at a time, so shards do not add
+write concurrency there; they pay off on row-locking databases. See
+``manage.py bench_tally_contention``.
+"""
+import random
+from collections import Counter
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Count, Sum
+
+from .models import Candidate, Election, TallyShard, Vote, VoterRecord
+
+
+def shard_count():
+    return max(1, getattr(settings, 'TALLY_SHARDS', 8))
+
+
+def ballot_counts(ballots):
+    """Counter increments for a batch of ballots: {(election_id, counter): n}"""
+    counts = Counter()
+    for ballot in ballots:
+        counts[(ballot.election.pk, TallyShard.BALLOTS)] += 1
+        for candidate in ballot.candidates:
+            counts[(ballot.election.pk, candidate.ordinal)] += 1
+    return counts
+
+
+def increment(counts, shards=None, rng=random):
+    """Add ``{(election_id, counter): n}`` to one random shard of each counter, in the caller's transaction"""
+    if not counts:
+        return
+    shards = shards or shard_count()
+    table = connection.ops.quote_name(TallyShard._meta.db_table)
+    election_pk = Election._meta.pk
+    rows = [
+        (election_pk.get_db_prep_value(election_id, connection), counter, rng.randrange(shards), n)
+        for (election_id, counter), n in sorted(counts.items())  # Fixed order: no lock-order deadlocks
+    ]
+    with connection.cursor() as cursor:
+        cursor.executemany(
+            f'INSERT INTO {table} (election_id, counter, shard, count) VALUES (%s, %s, %s, %s) '
+            f'ON CONFLICT (election_id, counter, shard) DO UPDATE SET count = {table}.count + excluded.count',
+            rows,
+        )
+
+
+def totals(election):
+    """Current value of every counter of an election: {counter: total}"""
+    return dict(
+        TallyShard.objects.filter(election=election)
+        .values_list('counter').annotate(total=Sum('count')).order_by()
+    )
+
+
+def compact(election=None):
+    """Fold every counter into its lowest shard; returns the number of shard rows removed"""
+    table = connection.ops.quote_name(TallyShard._meta.db_table)
+    same_counter = f's.election_id = {table}.election_id AND s.counter = {table}.counter'
+    scope, params = '', []
+    if election is not None:
+        scope, params = ' AND election_id = %s', [Election._meta.pk.get_db_prep_value(election.pk, connection)]
+    with transaction.atomic():
+        if connection.features.has_select_for_update:
+            # Keep concurrent increments out until the fold is done
+            list(TallyShard.objects.select_for_update().filter(
+                **({'election': election} if election is not None else {})
+            ).values_list('id'))
+        with connection.cursor() as cursor:
+            # Write first: SQLite takes its write lock here rather than upgrading a read
+            cursor.execute(
+                f'UPDATE {table} SET count = (SELECT SUM(s.count) FROM {table} s WHERE {same_counter}) '
+                f'WHERE shard = (SELECT MIN(s.shard) FROM {table} s WHERE {same_counter}){scope}',
+                params,
+            )
+            cursor.execute(
+                f'DELETE FROM {table} WHERE shard > (SELECT MIN(s.shard) FROM {table} s WHERE {same_counter}){scope}',
+                params,
+            )
+            return cursor.rowcount
+
+
+def rebuild(election):
+    """Recompute an election's counters from its votes and voter records"""
+    ordinals = dict(Candidate.objects.filter(position__election=election).values_list('id', 'ordinal'))
+    counts = Counter()
+    rows = Vote.objects.filter(election=election).values_list('candidate').annotate(n=Count('id')).order_by()
+    for candidate_id, n in rows:
+        counts[ordinals[candidate_id]] += n
+    counts[TallyShard.BALLOTS] = VoterRecord.objects.filter(election=election).count()
+    with transaction.atomic():
+        TallyShard.objects.filter(election=election).delete()
+        TallyShard.objects.bulk_create([
+            TallyShard(election=election, counter=counter, shard=0, count=n) for counter, n in counts.items() if n
+        ])
+    return counts
@@ -1,3 +1,991 @@
-from django.test import TestCase
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import uuid
+import zipfile
+from concurrent.futures import Future
+from datetime import timedelta
+from io import BytesIO, StringIO
+from unittest import mock
 
-# Create your tests here.
+from django.conf import settings
+from django.contrib import admin
+from django.core.management import CommandError, call_command
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.signals import setting_changed
+from django.db import IntegrityError, connection, transaction
+from django.db.models import F
+from django.db.migrations.executor import MigrationExecutor
+from django.template import Context, Template
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from PIL import Image
+
+from vsapp import audit, turnout
+from vsapp.admin import ElectionAdmin
+from vsapp.archive import export_election, import_election
+from vsapp.nominations import NominationError, import_candidates, open_csv, read_rows
+from vsapp.participation import SESSION_KEY as PARTICIPATION_KEY
+from vsapp.ratelimit import rejection_counts
+from vsapp.receipts import BULK_LIMIT, clear_indexes, verify_receipts
+from vsapp.recount import recount, sign_report, verify_report
+from vsapp.search import FTS_TABLE, ranked_search, rebuild_index, search_candidates
+from vsapp.eligibility import freeze_roll, is_eligible
+from vsapp.lifecycle import status_changed
+from vsapp.ballots import Ballot, BallotWriter, commit_ballot
+from vsapp.models import (
+    AuditLog, Candidate, Election, EligibleVoter, LazyQueryError, Position, ResultSnapshot, TallyShard, TurnoutRollup, User, UserAgent, Vote, VoterRecord,
+)
+from vsapp.results import build_results, freeze_results, ledger_root, results_delta
+
+
+class ElectionFixtureMixin:
+    """An active election with two positions, three candidates and six voters"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_user(username='officer', password='pw', user_type='admin')
+        cls.voters = [
+            User.objects.create_user(
+                username=f'voter{i}', password='pw', matric_number=f'M{i:04d}',
+                department=['CS', 'EE'][i % 2], level=['100', '200'][i % 2],
+            )
+            for i in range(6)
+        ]
+        cls.election = cls.create_election('SUG')
+        cls.president, cls.vice = cls.election.positions.order_by('order')
+        cls.alice, cls.bob, cls.carol = Candidate.objects.filter(position__election=cls.election).order_by('ordinal')
+
+    @classmethod
+    def create_election(cls, title, status='active'):
+        now = timezone.now()
+        election = Election.objects.create(
+            title=title, description='', start_date=now - timedelta(hours=1), end_date=now + timedelta(hours=2),
+            status=status, created_by=cls.admin,
+        )
+        president = Position.objects.create(election=election, title='President', order=1)
+        vice = Position.objects.create(election=election, title='Vice President', order=2)
+        for position, voter, name in [
+            (president, cls.voters[0], 'Alice'), (president, cls.voters[1], 'Bob'), (vice, cls.voters[2], 'Carol'),
+        ]:
+            Candidate.objects.create(position=position, user=voter, full_name=name, department=voter.department)
+        return election
+
+    def setUp(self):
+        super().setUp()
+        # Result artifacts and photos are written under MEDIA_ROOT
+        self.media = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media)
+        media = override_settings(MEDIA_ROOT=self.media)
+        media.enable()
+        self.addCleanup(media.disable)
+
+    def cast(self, voter, *candidates, election=None):
+        return commit_ballot(Ballot(election or self.election, voter, list(candidates), '10.0.0.1', 'tests'))
+
+    def login_voter(self, voter):
+        """Log a voter in past the OTP check"""
+        self.client.force_login(voter)
+        session = self.client.session
+        session['otp_verified'] = True
+        session.save()
+        self.client.cookies[settings.SESSION_COOKIE_NAME] = session.session_key
+
+
+@override_settings(STRICT_TEMPLATE_QUERIES=True, QUERY_LOG_ENABLED=False)
+class StrictTemplateQueryTests(ElectionFixtureMixin, TestCase):
+    """Pages listing elections load their statistics up front, however many elections there are"""
+
+    def setUp(self):
+        super().setUp()
+        self.cast(self.voters[3], self.alice, self.carol)
+        self.cast(self.voters[4], self.bob)
+        self.client.force_login(self.admin)
+
+    def test_admin_dashboard(self):
+        with self.assertNumQueries(10):
+            response = self.client.get(reverse('admin_dashboard'))
+        self.assertEqual(response.status_code, 200)
+
+        for title in ['Faculty', 'Departmental']:
+            self.create_election(title)
+        with self.assertNumQueries(10):
+            self.client.get(reverse('admin_dashboard'))
+
+    def test_live_results(self):
+        url = reverse('live_results') + f'?election={self.election.pk}'
+        with self.assertNumQueries(11):
+            response = self.client.get(url)
+        self.assertContains(response, 'Alice')
+
+        self.create_election('Faculty')
+        with self.assertNumQueries(11):
+            self.client.get(url)
+
+    def test_closed_results_are_served_from_the_snapshot(self):
+        Election.objects.filter(pk=self.election.pk).update(status='closed')
+        url = reverse('live_results') + f'?election={self.election.pk}'
+        self.client.get(url)  # Freezes the snapshot
+        with self.assertNumQueries(6):
+            response = self.client.get(url)
+        self.assertContains(response, 'Carol')
+
+    def test_guard_rejects_objects_without_stats(self):
+        template = Template('{% for election in elections %}{{ election.voter_turnout }}{% endfor %}')
+        with self.assertRaises(LazyQueryError):
+            template.render(Context({'elections': Election.objects.all()}))
+        with self.assertNumQueries(1):
+            template.render(Context({'elections': Election.objects.with_stats()}))
+
+
+class TurnoutTests(ElectionFixtureMixin, TestCase):
+    """Turnout is ballots cast over eligible voters, however many positions a ballot fills"""
+
+    def setUp(self):
+        super().setUp()
+        # Five of six voters fill both positions: 10 votes, 5 ballots
+        for voter in self.voters[:5]:
+            self.cast(voter, self.alice, self.carol)
+
+    def test_results_and_snapshot(self):
+        results = build_results(self.election)
+        self.assertEqual((results['total_votes'], results['ballots_cast'], results['total_voters']), (10, 5, 6))
+        self.assertAlmostEqual(results['turnout'], 500 / 6)
+
+        Election.objects.filter(pk=self.election.pk).update(status='closed')
+        snapshot = freeze_results(Election.objects.get(pk=self.election.pk))
+        self.assertAlmostEqual(snapshot.turnout, 500 / 6)
+        self.assertAlmostEqual(snapshot.payload['turnout'], 500 / 6)
+
+    def test_pages(self):
+        self.assertAlmostEqual(Election.objects.with_stats().get(pk=self.election.pk).voter_turnout, 500 / 6)
+        self.assertAlmostEqual(Election.objects.get(pk=self.election.pk).voter_turnout, 500 / 6)
+
+        response = self.client.get(reverse('live_results') + f'?election={self.election.pk}')
+        self.assertContains(response, '83.3%')
+        self.client.force_login(self.admin)
+        for name in ['admin_dashboard', 'admin_elections']:
+            self.assertContains(self.client.get(reverse(name)), '83.3%')
+        self.assertContains(self.client.get(reverse('admin_elections')), '5 / 6')
+
+    def test_export(self):
+        url = reverse('results_export', args=[self.election.pk])
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('attachment', response['Content-Disposition'])
+        self.assertEqual((response.json()['ballots_cast'], round(response.json()['turnout'], 2)), (5, 83.33))
+
+        # Cached per results version: a new ballot is in the next export
+        self.cast(self.voters[5], self.bob)
+        self.assertEqual(self.client.get(url).json()['ballots_cast'], 6)
+
+        Election.objects.filter(pk=self.election.pk).update(status='closed')
+        response = self.client.get(url)
+        self.assertEqual(json.loads(b''.join(response.streaming_content))['ballots_cast'], 6)
+
+    def test_delta(self):
+        payload = results_delta(self.election)
+        self.assertEqual((payload['votes'], payload['ballots'], payload['turnout']), (10, 5, 83.33))
+
+        self.cast(self.voters[5], self.bob)
+        payload = results_delta(self.election, since=payload['v'])
+        self.assertFalse(payload['full'])
+        self.assertEqual(payload['turnout'], 100)
+
+    def test_closed_delta_reads_the_snapshot(self):
+        Election.objects.filter(pk=self.election.pk).update(status='closed')
+        payload = results_delta(Election.objects.get(pk=self.election.pk))
+        self.assertEqual(payload['turnout'], 83.33)
+
+
+class ArchiveTests(ElectionFixtureMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.cast(self.voters[3], self.alice, self.carol)
+        self.cast(self.voters[4], self.bob)
+        self.path = os.path.join(self.media, 'election.zip')
+
+    def rows(self):
+        return {
+            'votes': sorted(
+                (bytes(vote_hash), candidate_id, timestamp) for vote_hash, candidate_id, timestamp in
+                Vote.objects.filter(election=self.election).values_list('vote_hash', 'candidate_id', 'timestamp')
+            ),
+            'records': sorted(
+                VoterRecord.objects.filter(election=self.election).values_list('voter_id', 'verification_code')
+            ),
+            'audit': sorted(
+                AuditLog.objects.filter(object_id=self.election.pk).values_list(
+                    'id', 'user_id', 'event', 'params', 'ip__address', 'agent__value', 'timestamp',
+                )
+            ),
+        }
+
+    def test_round_trip(self):
+        before, root = self.rows(), ledger_root(self.election)
+        export_election(self.election, self.path, chunk_size=2)
+        AuditLog.objects.filter(object_id=self.election.pk).delete()
+        Election.objects.filter(pk=self.election.pk).delete()
+
+        self.election = import_election(self.path)
+        self.assertEqual(ledger_root(self.election), root)
+        self.assertEqual(self.rows(), before)
+        self.assertEqual(results_delta(self.election)['ballots'], 2)  # Tallies are rebuilt from the ledger
+
+    def test_imported_accounts_are_unprivileged_voters(self):
+        Election.objects.filter(pk=self.election.pk).update(created_by=self.voters[5])
+        User.objects.filter(pk=self.voters[5].pk).update(is_staff=True, is_superuser=True, user_type='admin')
+        export_election(Election.objects.get(pk=self.election.pk), self.path)
+        Election.objects.filter(pk=self.election.pk).delete()
+        User.objects.filter(pk=self.voters[5].pk).delete()
+
+        election = import_election(self.path)
+        creator = election.created_by
+        self.assertNotEqual(creator.pk, self.voters[5].pk)
+        self.assertEqual(creator.matric_number, self.voters[5].matric_number)
+        self.assertEqual((creator.user_type, creator.is_staff, creator.is_superuser), ('voter', False, False))
+        self.assertFalse(creator.has_usable_password())
+
+
+class InternCacheTests(TransactionTestCase):
+    """Interned ids are cached on commit, per database"""
+
+    def setUp(self):
+        audit.clear_cache()
+        self.addCleanup(audit.clear_cache)
+
+    def test_cached_after_commit(self):
+        agent_id = audit.intern(UserAgent, 'Mozilla/5.0')
+        with self.assertNumQueries(0):
+            self.assertEqual(audit.intern(UserAgent, 'Mozilla/5.0'), agent_id)
+
+    def test_other_database_is_looked_up(self):
+        audit.intern(UserAgent, 'Mozilla/5.0')
+        # What the benchmarks do to move the connection to a scratch database
+        with mock.patch.dict(connection.settings_dict, NAME='scratch.sqlite3'):
+            self.assertEqual(audit._cache(UserAgent), {})
+            with CaptureQueriesContext(connection) as queries:
+                audit.intern(UserAgent, 'Mozilla/5.0')
+            self.assertIn('Mozilla/5.0', audit._cache(UserAgent))
+        self.assertTrue(queries.captured_queries)
+
+    def test_cleared_when_databases_change(self):
+        audit.intern(UserAgent, 'Mozilla/5.0')
+        setting_changed.send(sender=self.__class__, setting='DATABASES', value=None, enter=True)
+        self.assertEqual(audit._cache(UserAgent), {})
+
+    def test_rolled_back_ids_are_not_cached(self):
+        with self.assertRaises(RuntimeError), transaction.atomic():
+            audit.intern(UserAgent, 'rolled back')
+            raise RuntimeError
+        self.assertEqual(audit._cache(UserAgent), {})
+        self.assertFalse(UserAgent.objects.exists())
+
+
+class MigrationTestCase(TransactionTestCase):
+    """Migrates vsapp back to ``migrate_from`` for the test and forward to the latest migration afterwards"""
+
+    migrate_from = None
+    migrate_to = None
+
+    def setUp(self):
+        self.latest = MigrationExecutor(connection).loader.graph.leaf_nodes('vsapp')
+        self.addCleanup(self.migrate, self.latest)
+        self.old_apps = self.migrate([('vsapp', self.migrate_from)])
+
+    def migrate(self, targets):
+        executor = MigrationExecutor(connection)
+        executor.migrate(targets)
+        return executor.loader.project_state(targets).apps
+
+
+class CompactVoteMigrationTests(MigrationTestCase):
+    """0004 moves the ledger to binary digests and back without losing a ballot"""
+
+    migrate_from = '0003_vote_election_and_hot_path_indexes'
+    migrate_to = '0004_compact_vote_storage'
+
+    def votes(self, apps):
+        Vote = apps.get_model('vsapp', 'Vote')
+        return sorted(Vote.objects.values_list('election_id', 'candidate_id', 'vote_hash', 'timestamp', 'ip_address'))
+
+    def test_round_trip(self):
+        apps = self.old_apps
+        now = timezone.now()
+        officer = apps.get_model('vsapp', 'User').objects.create(username='officer', user_type='admin')
+        voter = apps.get_model('vsapp', 'User').objects.create(username='voter', matric_number='M0001')
+        election = apps.get_model('vsapp', 'Election').objects.create(
+            title='SUG', description='', start_date=now, end_date=now + timedelta(hours=2), status='active',
+            created_by=officer,
+        )
+        position = apps.get_model('vsapp', 'Position').objects.create(election=election, title='President', order=1)
+        candidate = apps.get_model('vsapp', 'Candidate').objects.create(position=position, user=voter, full_name='Alice')
+        hashes = [hashlib.sha256(f'ballot-{i}'.encode()).hexdigest() for i in range(3)]
+        for vote_hash in hashes:
+            apps.get_model('vsapp', 'Vote').objects.create(
+                election=election, candidate=candidate, ip_address='10.0.0.1', vote_hash=vote_hash,
+            )
+        before = self.votes(apps)
+
+        compact = self.migrate([('vsapp', self.migrate_to)])
+        stored = compact.get_model('vsapp', 'Vote').objects.values_list('vote_hash', flat=True)
+        self.assertEqual(sorted(bytes(vote_hash).hex() for vote_hash in stored), sorted(hashes))
+
+        self.assertEqual(self.votes(self.migrate([('vsapp', self.migrate_from)])), before)
+
+
+class CompactAuditMigrationTests(MigrationTestCase):
+    """0012 turns free-text audit entries into events and back, references included"""
+
+    migrate_from = '0011_eligibility_roll'
+    migrate_to = '0012_compact_audit_storage'
+
+    def entries(self, apps):
+        AuditLog = apps.get_model('vsapp', 'AuditLog')
+        return sorted(AuditLog.objects.values_list(
+            'id', 'user_id', 'action_type', 'description', 'ip_address', 'user_agent', 'timestamp',
+            'content_type', 'object_id',
+        ))
+
+    def test_round_trip(self):
+        apps = self.old_apps
+        voter = apps.get_model('vsapp', 'User').objects.create(username='voter', matric_number='M0001')
+        election_id, candidate_id = uuid.uuid4(), uuid.uuid4()
+        for action_type, description, content_type, object_id in [
+            ('vote', 'Voted in election: SUG', 'election', str(election_id)),
+            ('login', 'Voter login', '', ''),
+            ('update', 'Updated candidate: Alice', 'candidate', str(candidate_id)),
+            ('election_start', 'Started by the scheduler', 'election', 'not-a-uuid'),
+        ]:
+            apps.get_model('vsapp', 'AuditLog').objects.create(
+                id=uuid.uuid4(), user=voter, action_type=action_type, description=description,
+                ip_address='10.0.0.1', user_agent='Mozilla/5.0', content_type=content_type, object_id=object_id,
+            )
+        before = self.entries(apps)
+
+        AuditLog = self.migrate([('vsapp', self.migrate_to)]).get_model('vsapp', 'AuditLog')
+        entries = {entry.params.get('text') or entry.event: entry for entry in AuditLog.objects.select_related('agent')}
+        vote = entries[30]
+        self.assertEqual((vote.object_id, vote.params, vote.agent.value), (election_id, {'title': 'SUG'}, 'Mozilla/5.0'))
+        self.assertEqual(entries[21].params, {'name': 'Alice', 'content_type': 'candidate', 'object_id': str(candidate_id)})
+        self.assertEqual(entries['Started by the scheduler'].params['object_id'], 'not-a-uuid')
+
+        self.assertEqual(self.entries(self.migrate([('vsapp', self.migrate_from)])), before)
+
+
+class CandidateOrdinalMigrationTests(MigrationTestCase):
+    """0015 renumbers candidates that share an ordinal before making ordinals unique"""
+
+    migrate_from = '0014_snapshot_turnout_from_ballots'
+    migrate_to = '0015_candidate_unique_ordinal'
+
+    def test_duplicates_renumbered(self):
+        apps = self.old_apps
+        now = timezone.now()
+        User, Candidate = apps.get_model('vsapp', 'User'), apps.get_model('vsapp', 'Candidate')
+        officer = User.objects.create(username='officer', user_type='admin')
+        election = apps.get_model('vsapp', 'Election').objects.create(
+            title='SUG', description='', start_date=now, end_date=now + timedelta(hours=2), status='active',
+            created_by=officer,
+        )
+        president = apps.get_model('vsapp', 'Position').objects.create(election=election, title='President', order=1)
+        first, second, third = [
+            Candidate.objects.create(
+                position=president, user=User.objects.create(username=name, matric_number=name), full_name=name,
+                ordinal=1, created_at=now + timedelta(seconds=i),
+            )
+            for i, name in enumerate(['Alice', 'Bob', 'Carol'])
+        ]
+        for candidate, n in [(first, 2), (second, 1)]:
+            for i in range(n):
+                apps.get_model('vsapp', 'Vote').objects.create(
+                    election=election, candidate=candidate, vote_hash=hashlib.sha256(f'{candidate.pk}{i}'.encode()).digest(),
+                )
+        TallyShard = apps.get_model('vsapp', 'TallyShard')
+        TallyShard.objects.create(election=election, counter=0, shard=0, count=3)
+        TallyShard.objects.create(election=election, counter=1, shard=0, count=3)
+
+        apps = self.migrate([('vsapp', self.migrate_to)])
+        ordinals = dict(apps.get_model('vsapp', 'Candidate').objects.values_list('full_name', 'ordinal'))
+        self.assertEqual(ordinals, {'Alice': 1, 'Bob': 2, 'Carol': 3})
+        counters = dict(apps.get_model('vsapp', 'TallyShard').objects.values_list('counter', 'count'))
+        self.assertEqual(counters, {0: 3, 1: 2, 2: 1})
+
+
+class ElectionAdminTests(ElectionFixtureMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        User.objects.filter(pk=self.admin.pk).update(is_staff=True, is_superuser=True)
+        self.client.force_login(self.admin)
+
+    def test_turnout_column_sorts_by_ballots(self):
+        # SUG: 2 of 6 voters, 4 votes. Faculty: 3 of 6 voters, 3 votes.
+        faculty = self.create_election('Faculty')
+        self.cast(self.voters[0], self.alice, self.carol)
+        self.cast(self.voters[1], self.bob, self.carol)
+        for voter in self.voters[2:5]:
+            self.cast(voter, faculty.positions.get(order=1).candidates.first(), election=faculty)
+
+        column = ElectionAdmin.list_display.index('voter_turnout') + 1
+        response = self.client.get(reverse('admin:vsapp_election_changelist') + f'?o={column}')
+        self.assertEqual([election.title for election in response.context['cl'].result_list], ['SUG', 'Faculty'])
+
+    def test_closing_from_the_admin_freezes_results(self):
+        election = Election.objects.get(pk=self.election.pk)
+        election.status = 'closed'
+        form = mock.Mock(initial={'status': 'active'}, changed_data=['status'])
+        admin.site._registry[Election].save_model(None, election, form, change=True)
+        self.assertTrue(ResultSnapshot.objects.filter(election=election).exists())
+
+
+class CommandArgumentTests(TestCase):
+    """A malformed election id is a usage error, not a traceback"""
+
+    def test_explain_hotpaths(self):
+        with self.assertRaisesMessage(CommandError, 'Election nope not found.'):
+            call_command('explain_hotpaths', '--election', 'nope')
+
+    def test_compact_tallies(self):
+        with self.assertRaisesMessage(CommandError, 'Election nope not found.'):
+            call_command('compact_tallies', '--election', 'nope')
+
+
+class RateLimitTests(ElectionFixtureMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        cache.clear()  # Buckets live in the cache
+        self.addCleanup(cache.clear)
+
+    def test_login_attempts_per_account(self):
+        url = reverse('login')
+        for _ in range(5):
+            self.assertEqual(self.client.post(url, {'matric_number': 'M0001', 'password': 'wrong'}).status_code, 200)
+        response = self.client.post(url, {'matric_number': 'M0001', 'password': 'wrong'})
+        self.assertEqual(response.status_code, 429)
+        self.assertGreater(int(response['Retry-After']), 0)
+        self.assertEqual(rejection_counts()['login']['identity'], 1)
+
+        # Other accounts behind the same address still get through
+        self.assertEqual(self.client.post(url, {'matric_number': 'M0002', 'password': 'wrong'}).status_code, 200)
+
+    @override_settings(RATE_LIMIT_ENABLED=False)
+    def test_disabled(self):
+        for _ in range(7):
+            response = self.client.post(reverse('login'), {'matric_number': 'M0001', 'password': 'wrong'})
+        self.assertEqual(response.status_code, 200)
+
+    def test_api_rejections_are_json(self):
+        url = reverse('receipts_api', args=[self.election.pk])
+        for _ in range(30):
+            self.client.get(url)
+        response = self.client.get(url, HTTP_ACCEPT='application/json')
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(response.json()['retry_after'], int(response['Retry-After']))
+
+
+class BallotWriterTests(ElectionFixtureMixin, TransactionTestCase):
+    """The group-commit writer runs on its own thread and connection, so these tests commit"""
+
+    def setUp(self):
+        self.setUpTestData()
+        super().setUp()
+        # The flush between tests deletes interned rows the cache still points at
+        audit.clear_cache()
+        self.addCleanup(audit.clear_cache)
+        self.writer = BallotWriter(max_batch=10, max_wait=0.05, timeout=5)
+        self.addCleanup(self.writer.stop)
+
+    def queue(self, *ballots):
+        """Queue ballots before the thread starts, so they land in one batch"""
+        futures = []
+        for voter, candidates in ballots:
+            futures.append(Future())
+            self.writer.queue.put((Ballot(self.election, voter, candidates, '10.0.0.1', 'tests'), futures[-1]))
+        self.writer.start()
+        return futures
+
+    def test_one_transaction_per_batch(self):
+        futures = self.queue(*[(voter, [self.alice, self.carol]) for voter in self.voters[:4]])
+        records = [future.result(timeout=5) for future in futures]
+        self.assertEqual({record.voter_id for record in records}, {voter.pk for voter in self.voters[:4]})
+        self.assertEqual((self.writer.batches, self.writer.ballots), (1, 4))
+        self.assertEqual(Vote.objects.filter(election=self.election).count(), 8)
+        self.assertEqual(results_delta(self.election)['ballots'], 4)
+
+    def test_second_ballot_fails_alone(self):
+        self.cast(self.voters[0], self.alice)
+        futures = self.queue((self.voters[0], [self.bob]), (self.voters[1], [self.bob]), (self.voters[2], [self.carol]))
+        with self.assertRaises(IntegrityError):
+            futures[0].result(timeout=5)
+        self.assertEqual(futures[1].result(timeout=5).voter_id, self.voters[1].pk)
+        self.assertEqual(futures[2].result(timeout=5).voter_id, self.voters[2].pk)
+        self.assertEqual(self.writer.batches, 1)
+        self.assertEqual(Vote.objects.filter(candidate=self.bob).count(), 1)
+
+    def test_stop_writes_what_is_queued(self):
+        futures = self.queue((self.voters[3], [self.alice]), (self.voters[4], [self.bob]))
+        self.writer.stop()
+        self.assertTrue(all(future.done() and not future.exception() for future in futures))
+        self.assertEqual(VoterRecord.objects.filter(election=self.election).count(), 2)
+
+    @override_settings(BALLOT_COMMIT_MODE='group')
+    def test_commit_ballot_waits_for_the_batch(self):
+        with mock.patch('vsapp.ballots.get_writer', return_value=self.writer):
+            record = self.cast(self.voters[5], self.carol)
+        self.assertTrue(VoterRecord.objects.filter(pk=record.pk).exists())
+
+
+class RecountTests(ElectionFixtureMixin, TestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.cast(self.voters[0], self.alice, self.carol)
+        self.cast(self.voters[1], self.bob, self.carol)
+        self.cast(self.voters[2], self.alice)
+
+    def test_matches(self):
+        report = recount(self.election, range_size=2)
+        self.assertEqual(report['differences'], [])
+        self.assertEqual((report['total_votes'], report['ballots']), (5, 3))
+        self.assertEqual(report['ledger_root'], ledger_root(self.election))
+        votes = {c['full_name']: c['votes'] for position in report['positions'] for c in position['candidates']}
+        self.assertEqual(votes, {self.alice.full_name: 2, self.bob.full_name: 1, self.carol.full_name: 2})
+
+    def test_tally_drift(self):
+        shard = TallyShard.objects.filter(election=self.election, counter=self.alice.ordinal).first()
+        TallyShard.objects.filter(pk=shard.pk).update(count=F('count') + 2)
+        [difference] = recount(self.election)['differences']
+        self.assertEqual((difference['source'], difference['recorded'], difference['recount'], difference['delta']), ('tally', 4, 2, 2))
+        self.assertIn(self.alice.full_name, difference['subject'])
+
+    def test_ledger_changed_after_freeze(self):
+        Election.objects.filter(pk=self.election.pk).update(status='closed')
+        freeze_results(Election.objects.get(pk=self.election.pk))
+        Vote.objects.filter(election=self.election, candidate=self.bob).delete()
+        differences = {(d['subject'], d['source']) for d in recount(self.election)['differences']}
+        subject = f'candidate {self.bob.ordinal} ({self.bob.full_name})'
+        self.assertEqual(differences, {(subject, 'tally'), (subject, 'snapshot'), ('ledger root', 'snapshot')})
+
+    def test_signature(self):
+        report = json.loads(sign_report(recount(self.election)))
+        self.assertTrue(verify_report(report))
+        report['total_votes'] += 1
+        self.assertFalse(verify_report(report))
+        del report['signature']
+        self.assertFalse(verify_report(report))
+
+    def test_command(self):
+        path = os.path.join(self.media, 'recount.json')
+        call_command('recount', str(self.election.pk), workers=1, output=path, stdout=StringIO())
+        out = StringIO()
+        call_command('recount', verify=path, stdout=out)
+        self.assertIn('signature valid', out.getvalue())
+        with open(path) as f:
+            report = json.load(f)
+        report['ballots'] = 2
+        with open(path, 'w') as f:
+            json.dump(report, f)
+        with self.assertRaisesMessage(CommandError, 'signature does not match'):
+            call_command('recount', verify=path, stdout=StringIO())
+        Vote.objects.filter(election=self.election, candidate=self.carol).delete()
+        with self.assertRaisesMessage(CommandError, 'Recount found 1 difference(s)'):
+            call_command('recount', str(self.election.pk), workers=1, stdout=StringIO())
+
+
+class TurnoutRollupTests(ElectionFixtureMixin, TestCase):
+
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+        for voter in self.voters[:3]:
+            self.cast(voter, self.alice)
+        self.other = self.create_election('NUS')
+        self.cast(self.voters[0], Candidate.objects.filter(position__election=self.other).first(), election=self.other)
+
+    def snapshot(self, election):
+        return {dimension: turnout.series(election, dimension) for dimension in turnout.DIMENSIONS}
+
+    def test_incremented_per_ballot(self):
+        rollups = self.snapshot(self.election)
+        self.assertEqual(rollups['department'], [('CS', 2), ('EE', 1)])
+        self.assertEqual(rollups['level'], [('100', 2), ('200', 1)])
+        self.assertEqual(sum(n for minute, n in rollups['minute']), 3)
+        self.assertEqual(self.snapshot(self.other)['department'], [('CS', 1)])
+
+    def test_rebuild(self):
+        expected = self.snapshot(self.election)
+        TurnoutRollup.objects.filter(election=self.election).update(count=F('count') + 5)
+        turnout.rebuild(self.election)
+        self.assertEqual(self.snapshot(self.election), expected)
+        TurnoutRollup.objects.filter(election=self.election).delete()
+        turnout.rebuild(self.election)
+        self.assertEqual(self.snapshot(self.election), expected)
+        self.assertEqual(self.snapshot(self.other)['level'], [('100', 1)])
+
+    def test_view(self):
+        self.client.force_login(self.admin)
+        url = reverse('admin_turnout', args=[self.election.pk])
+        payload = self.client.get(url).json()
+        self.assertEqual(payload['ballots'], 3)
+        self.assertEqual(payload['department'], [['CS', 2, 3], ['EE', 1, 3]])
+        self.assertEqual(self.client.get(url, {'dimension': 'minute', 'since': '9999'}).json()['minute'], [])
+        self.assertEqual(self.client.get(url, {'dimension': 'bogus'}).status_code, 400)
+        self.client.force_login(self.voters[0])
+        self.assertEqual(self.client.get(url).status_code, 403)
+
+
+class ReceiptTests(ElectionFixtureMixin, TestCase):
+
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+        clear_indexes()
+        self.addCleanup(clear_indexes)
+        self.first = self.cast(self.voters[0], self.alice).verification_code
+        self.second = self.cast(self.voters[1], self.bob).verification_code
+
+    def close(self):
+        election = Election.objects.get(pk=self.election.pk)
+        election.status = 'closed'
+        election.save()
+        return election
+
+    def test_lookup(self):
+        self.assertEqual(
+            verify_receipts(self.election, [self.first, f' {self.second} ', 'NOT-A-RECEIPT', '']),
+            {self.first: True, self.second: True, 'NOT-A-RECEIPT': False, '': False},
+        )
+        other = self.create_election('NUS')
+        self.assertEqual(verify_receipts(other, [self.first]), {self.first: False})
+
+    def test_closed_election_rejects_unknown_codes_without_queries(self):
+        election = self.close()
+        with self.assertNumQueries(2):  # Build the index, then confirm the codes it holds
+            self.assertEqual(verify_receipts(election, [self.first, 'NOT-A-RECEIPT']), {self.first: True, 'NOT-A-RECEIPT': False})
+        with self.assertNumQueries(0):
+            self.assertEqual(verify_receipts(election, ['NOT-A-RECEIPT', 'NOR-THIS']), {'NOT-A-RECEIPT': False, 'NOR-THIS': False})
+
+    def test_reopening_rebuilds_the_index(self):
+        election = self.close()
+        verify_receipts(election, [self.first])
+        election.status = 'active'
+        election.save()
+        third = self.cast(self.voters[2], self.carol).verification_code
+        election = self.close()
+        self.assertEqual(verify_receipts(election, [third]), {third: True})
+
+    def test_page(self):
+        url = reverse('verify_receipt')
+        response = self.client.post(url, {'election': self.election.pk, 'code': f' {self.first} '})
+        self.assertIs(response.context['result'], True)
+        response = self.client.post(url, {'election': self.election.pk, 'code': 'NOT-A-RECEIPT'})
+        self.assertIs(response.context['result'], False)
+        response = self.client.post(url, {'election': 'nope', 'code': self.first})
+        self.assertIsNone(response.context['result'])
+
+    def test_api(self):
+        url = reverse('receipts_api', args=[self.election.pk])
+        payload = self.client.post(url, json.dumps({'codes': [self.first, 'NOT-A-RECEIPT']}), content_type='application/json').json()
+        self.assertEqual(payload['counted'], 1)
+        self.assertEqual(payload['results'], {self.first: True, 'NOT-A-RECEIPT': False})
+        payload = self.client.get(url, {'code': [self.first, self.second]}).json()
+        self.assertEqual(payload['counted'], 2)
+
+        for body in ['not json', json.dumps({'code': self.first}), json.dumps({'codes': self.first}), json.dumps({'codes': [1]})]:
+            self.assertEqual(self.client.post(url, body, content_type='application/json').status_code, 400)
+        too_many = json.dumps({'codes': [str(i) for i in range(BULK_LIMIT + 1)]})
+        self.assertEqual(self.client.post(url, too_many, content_type='application/json').status_code, 400)
+
+        draft = self.create_election('Draft', status='draft')
+        self.assertEqual(self.client.get(reverse('receipts_api', args=[draft.pk])).status_code, 404)
+
+
+class CandidateImportTests(ElectionFixtureMixin, TestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.election = self.create_election('Faculty')
+
+    def rows(self, text):
+        return read_rows(open_csv(BytesIO(text.encode('utf-8-sig'))))
+
+    def photos(self, *names):
+        image = BytesIO()
+        Image.new('RGB', (40, 40), 'navy').save(image, 'PNG')
+        archive = BytesIO()
+        with zipfile.ZipFile(archive, 'w') as photos:
+            for name in names:
+                photos.writestr(name, image.getvalue())
+        archive.seek(0)
+        return archive
+
+    def test_import(self):
+        rows = self.rows(
+            'Matric_Number,Position,full_name,photo\n'
+            'M0003,President,,headshots/dave.png\n'
+            '\n'
+            'M0004,Treasurer,Erin E.,dave.png\n'
+            'M0005,Treasurer,,\n'
+        )
+        self.assertEqual([row['line'] for row in rows], [2, 4, 5])
+        with zipfile.ZipFile(self.photos('headshots/dave.png')) as photos:
+            counts = import_candidates(self.election, rows, photos, workers=2)
+        self.assertEqual(counts, {'candidates': 3, 'positions': 1, 'photos': 1})
+
+        imported = Candidate.objects.filter(user__in=self.voters[3:]).select_related('position').order_by('ordinal')
+        self.assertEqual([(c.position.title, c.full_name) for c in imported], [
+            ('President', self.voters[3].matric_number), ('Treasurer', 'Erin E.'), ('Treasurer', self.voters[5].matric_number),
+        ])
+        self.assertEqual([c.ordinal for c in imported], [4, 5, 6])
+        self.assertEqual(imported[0].photo.name, imported[1].photo.name)
+        self.assertTrue(imported[0].photo_variants)
+        self.assertEqual(self.election.positions.get(title='Treasurer').order, 3)
+
+    def test_bad_rows_reject_the_file(self):
+        rows = self.rows(
+            'matric_number,position,photo\n'
+            'M9999,President,\n'
+            'M0000,President,\n'
+            'M0003,,\n'
+            'M0003,Treasurer,\n'
+            'M0003,Treasurer,\n'
+            'M0004,Treasurer,missing.png\n'
+        )
+        with self.assertRaises(NominationError) as raised:
+            import_candidates(self.election, rows, zipfile.ZipFile(self.photos('other.png')))
+        self.assertEqual(raised.exception.errors, [
+            'Line 2: no voter has matric number M9999.',
+            'Line 3: M0000 is already a candidate for President.',
+            'Line 4: no position.',
+            'Line 6: M0003 is already a candidate for Treasurer.',
+            'Line 7: missing.png is not in the photo archive.',
+        ])
+        self.assertEqual(Candidate.objects.filter(position__election=self.election).count(), 3)
+        self.assertFalse(self.election.positions.filter(title='Treasurer').exists())
+        self.assertEqual(os.listdir(self.media), [])
+
+    def test_header_checked(self):
+        for text, error in [
+            ('matric_number,name\nM0003,Dave\n', 'The CSV has no position column.'),
+            ('matric_number,position\n\n', 'The CSV has no candidates.'),
+        ]:
+            with self.assertRaises(NominationError) as raised:
+                self.rows(text)
+            self.assertEqual(raised.exception.errors, [error])
+
+    def test_admin_page(self):
+        self.client.force_login(self.admin)
+        url = reverse('admin_candidates')
+        csv_file = SimpleUploadedFile('candidates.csv', b'matric_number,position\nM0003,Treasurer\nM9999,Treasurer\n')
+        response = self.client.post(url, {'import': '1', 'election': self.election.pk, 'csv_file': csv_file}, follow=True)
+        self.assertContains(response, 'Line 3: no voter has matric number M9999.')
+        self.assertFalse(Candidate.objects.filter(user=self.voters[3]).exists())
+
+        csv_file = SimpleUploadedFile('candidates.csv', b'matric_number,position\nM0003,Treasurer\n')
+        response = self.client.post(url, {'import': '1', 'election': self.election.pk, 'csv_file': csv_file}, follow=True)
+        self.assertContains(response, 'Imported 1 candidates and 1 new positions into Faculty.')
+        self.assertTrue(AuditLog.objects.filter(event=AuditLog.Event.CANDIDATES_IMPORTED, object_id=self.election.pk).exists())
+
+
+class SearchIndexTests(ElectionFixtureMixin, TestCase):
+    """Signals keep the FTS table in step with candidates, their voters and positions"""
+
+    def found(self, query):
+        return {candidate.full_name for candidate, score, snippet in ranked_search(query)}
+
+    def indexed(self):
+        with connection.cursor() as cursor:
+            cursor.execute(f'SELECT candidate_id, full_name, matric_number, position, manifesto FROM {FTS_TABLE} ORDER BY candidate_id')
+            return cursor.fetchall()
+
+    def test_candidate_saved_and_deleted(self):
+        self.assertEqual(self.found('ali'), {'Alice'})
+        self.alice.full_name = 'Alicia'
+        self.alice.manifesto = 'Cheaper textbooks'
+        self.alice.save()
+        self.assertEqual(self.found('alice'), set())
+        self.assertEqual(self.found('alicia'), {'Alicia'})
+        [(candidate, score, snippet)] = ranked_search('textbooks')
+        self.assertEqual(snippet, 'Cheaper <mark>textbooks</mark>')
+        self.assertEqual(set(search_candidates(Candidate.objects.all(), 'vice pres')), {self.carol})
+
+        self.cast(self.voters[3], self.alice)
+        self.alice.delete()
+        self.assertEqual(self.found('alicia'), set())
+        self.assertEqual(len(self.indexed()), 2)
+        self.assertFalse(TallyShard.objects.filter(election=self.election, counter=self.alice.ordinal).exists())
+
+    def test_voter_and_position_changes(self):
+        voter = self.voters[2]
+        voter.matric_number = 'X9999'
+        voter.save()
+        self.assertEqual(self.found('x9999'), {'Carol'})
+        self.vice.title = 'Welfare Director'
+        self.vice.save(update_fields=['title'])
+        self.assertEqual(self.found('welfare'), {'Carol'})
+        self.assertEqual(self.found('vice'), set())
+
+        with self.assertNumQueries(1):  # Saving unindexed fields does not touch the index
+            voter.save(update_fields=['last_login'])
+
+    def test_rebuild_matches_the_signals(self):
+        self.vice.title = 'Welfare Director'
+        self.vice.save()
+        expected = self.indexed()
+        with connection.cursor() as cursor:
+            cursor.execute(f'DELETE FROM {FTS_TABLE}')
+        self.assertEqual(rebuild_index(), 3)
+        self.assertEqual(self.indexed(), expected)
+
+
+class EligibilityTests(ElectionFixtureMixin, TestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.faculty = self.create_election('Faculty', status='draft')
+        self.faculty.eligible_departments = ['CS']
+        self.faculty.save()
+        self.dave = Candidate.objects.filter(position__election=self.faculty).first()
+
+    def roll(self, election):
+        return set(EligibleVoter.objects.filter(election=election).values_list('voter_id', flat=True))
+
+    def test_roll_frozen_when_opened(self):
+        self.assertIsNone(self.faculty.eligible_count)
+        self.client.force_login(self.admin)
+        self.client.post(reverse('admin_elections'), {'update_status': '1', 'election_id': self.faculty.pk, 'status': 'active'})
+        self.faculty.refresh_from_db()
+        self.assertEqual(self.faculty.eligible_count, 3)
+        self.assertIsNotNone(self.faculty.roll_frozen_at)
+        self.assertEqual(self.roll(self.faculty), {voter.pk for voter in self.voters[::2]})
+        self.assertEqual(self.faculty.eligible_voters, 3)
+
+    def test_roll_kept_until_refrozen(self):
+        self.faculty.status = 'active'
+        self.faculty.save()
+        status_changed(self.faculty, 'draft')
+        late = User.objects.create_user(username='late', password='pw', matric_number='M0100', department='CS', level='100')
+        self.voters[0].is_active = False
+        self.voters[0].save()
+        self.assertFalse(is_eligible(self.faculty, late))
+        self.assertTrue(is_eligible(self.faculty, self.voters[0]))
+
+        self.faculty.eligible_levels = ['100']
+        self.faculty.save()
+        status_changed(self.faculty, 'active', rules_changed=True)
+        self.assertEqual(self.roll(self.faculty), {late.pk, self.voters[2].pk, self.voters[4].pk})
+        self.assertEqual(self.faculty.eligible_count, 3)
+
+        status_changed(self.faculty, 'active')  # Saving without changing the rules keeps the roll
+        self.assertEqual(EligibleVoter.objects.filter(election=self.faculty).count(), 3)
+
+    def test_elections_without_a_roll_are_open_to_every_voter(self):
+        self.assertIsNone(self.election.eligible_count)
+        self.assertTrue(is_eligible(self.election, self.voters[1]))
+        self.assertFalse(is_eligible(self.election, self.admin))
+
+    def test_voting(self):
+        self.faculty.status = 'active'
+        self.faculty.save()
+        freeze_roll(self.faculty)
+        url = reverse('vote_with_election', args=[self.faculty.pk])
+
+        self.login_voter(self.voters[1])
+        elections = [row['election'] for row in self.client.get(reverse('vote')).context['elections']]
+        self.assertEqual(elections, [self.election])
+        response = self.client.post(url, {f'position_{self.dave.position_id}': self.dave.pk}, follow=True)
+        self.assertRedirects(response, reverse('vote'))
+        self.assertEqual([str(m) for m in response.context['messages']], ['You are not eligible to vote in this election.'])
+        self.assertFalse(VoterRecord.objects.filter(election=self.faculty).exists())
+
+        self.login_voter(self.voters[0])
+        response = self.client.post(url, {f'position_{self.dave.position_id}': self.dave.pk})
+        self.assertRedirects(response, reverse('vote_success', args=[self.faculty.pk]))
+        self.assertTrue(VoterRecord.objects.filter(election=self.faculty, voter=self.voters[0]).exists())
+
+
+class ParticipationCacheTests(ElectionFixtureMixin, TestCase):
+    """The session's record of elections voted in follows the ballots committed"""
+
+    def setUp(self):
+        super().setUp()
+        self.url = reverse('vote_with_election', args=[self.election.pk])
+        self.login_voter(self.voters[3])
+
+    def cached(self):
+        return set(self.client.session[PARTICIPATION_KEY]['elections'])
+
+    def test_recorded_after_voting(self):
+        self.assertEqual(self.client.get(self.url).status_code, 200)
+        self.assertEqual(self.cached(), set())
+        response = self.client.post(self.url, {f'position_{self.president.pk}': self.alice.pk})
+        self.assertRedirects(response, reverse('vote_success', args=[self.election.pk]))
+        record = VoterRecord.objects.get(voter=self.voters[3])
+        self.assertEqual(self.client.session[PARTICIPATION_KEY]['elections'], {
+            str(self.election.pk): [record.verification_code, record.voted_at.isoformat()],
+        })
+        with self.assertNumQueries(2):  # Session user and the election; the receipt comes from the session
+            response = self.client.get(reverse('vote_success', args=[self.election.pk]))
+        self.assertEqual(response.context['record'].verification_code, record.verification_code)
+        self.assertRedirects(self.client.get(self.url), reverse('already_voted', args=[self.election.pk]))
+
+    def test_refreshed_after_a_ballot_from_another_session(self):
+        self.client.get(self.url)
+        record = self.cast(self.voters[3], self.bob)
+        self.assertEqual(self.cached(), set())
+        response = self.client.post(self.url, {f'position_{self.president.pk}': self.alice.pk})
+        self.assertRedirects(response, reverse('already_voted', args=[self.election.pk]))
+        self.assertEqual(self.cached(), {str(self.election.pk)})
+        [(code, voted_at)] = self.client.session[PARTICIPATION_KEY]['elections'].values()
+        self.assertEqual(code, record.verification_code)
+        self.assertEqual(Vote.objects.filter(election=self.election).count(), 1)
+
+    def test_reloaded_for_another_voter(self):
+        self.cast(self.voters[4], self.bob)
+        self.client.get(self.url)
+        cached = self.client.session[PARTICIPATION_KEY]
+        self.login_voter(self.voters[4])
+        session = self.client.session
+        session[PARTICIPATION_KEY] = cached  # Left over from the other voter
+        session.save()
+        self.client.cookies[settings.SESSION_COOKIE_NAME] = session.session_key
+        self.assertRedirects(self.client.get(self.url), reverse('already_voted', args=[self.election.pk]))
+        self.assertEqual(self.client.session[PARTICIPATION_KEY]['voter'], self.voters[4].pk)
+
+
+class CandidateOrdinalTests(ElectionFixtureMixin, TestCase):
+    """Ordinals stay unique within a position when writers race for the next one"""
+
+    def test_unique(self):
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            Candidate.objects.filter(pk=self.bob.pk).update(ordinal=self.alice.ordinal)
+
+    def test_taken_ordinal_retried(self):
+        expected = Candidate.next_ordinal(self.election.pk)
+        with mock.patch.object(Candidate, 'next_ordinal', side_effect=[self.alice.ordinal, expected]) as next_ordinal:
+            dave = Candidate.objects.create(position=self.president, user=self.voters[3], full_name='Dave')
+        self.assertEqual(next_ordinal.call_count, 2)
+        self.assertEqual(dave.ordinal, expected)
+
+    def test_gives_up(self):
+        candidate = Candidate(position=self.president, user=self.voters[3], full_name='Dave')
+        with mock.patch.object(Candidate, 'next_ordinal', return_value=self.alice.ordinal) as next_ordinal:
+            with self.assertRaises(IntegrityError):
+                candidate.save()
+        self.assertEqual(next_ordinal.call_count, Candidate.ORDINAL_ATTEMPTS)
+        self.assertEqual(candidate.ordinal, 0)
+        candidate.save()
+        self.assertEqual(candidate.ordinal, 4)
+
+    def test_import_retried(self):
+        rows = read_rows(open_csv(BytesIO(b'matric_number,position\nM0003,Treasurer\nM0004,President\n')))
+        with mock.patch.object(Candidate, 'next_ordinal', side_effect=[self.alice.ordinal, 4]):
+            self.assertEqual(import_candidates(self.election, rows), {'candidates': 2, 'positions': 1, 'photos': 0})
+        self.assertEqual(self.election.positions.filter(title='Treasurer').count(), 1)
+        imported = Candidate.objects.filter(user__in=self.voters[3:5]).order_by('ordinal')
+        self.assertEqual([(c.position.title, c.ordinal) for c in imported], [('Treasurer', 4), ('President', 5)])
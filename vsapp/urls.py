@@ -15,10 +15,21 @@ urlpatterns = [
     path('vote/success/<uuid:election_id>/', views.vote_success, name='vote_success'),
     path('vote/already-voted/<uuid:election_id>/', views.already_voted, name='already_voted'),
     path('live_results/', views.live_results, name='live_results'),
+    path('results/<uuid:election_id>/export/', views.results_export, name='results_export'),
+    path('api/results/<uuid:election_id>/', views.results_api, name='results_api'),
+    path('api/candidates/search/', views.candidate_search, name='candidate_search'),
+    path('api/receipts/<uuid:election_id>/', views.receipts_api, name='receipts_api'),
+    path('verify/', views.verify_receipt, name='verify_receipt'),
+    path('photos/<str:name>', views.photo_variant, name='photo_variant'),
     path('adm/login/', views.admin_login, name='admin_login'),
     path('adm/dashboard/', views.admin_dashboard, name='admin_dashboard'),
     path('adm/elections/', views.admin_elections, name='admin_elections'),
+    path('adm/elections/<uuid:election_id>/turnout/', views.admin_turnout, name='admin_turnout'),
     path('adm/candidates/', views.admin_candidates, name='admin_candidates'),
+    path('adm/voters/lookup/', views.admin_voter_lookup, name='admin_voter_lookup'),
+    path('adm/rate-limits/', views.admin_rate_limits, name='admin_rate_limits'),
+    path('adm/profiles/', views.admin_profiles, name='admin_profiles'),
+    path('adm/profiles/<str:capture_id>/', views.admin_profile_download, name='admin_profile_download'),
     path('logout/', views.logout_view, name='logout'),
 ]
 
@@ -1,18 +1,42 @@
 from django.shortcuts import render, redirect, get_object_or_404
+from django.conf import settings
 from django.contrib.auth import authenticate, login, logout
 from django.contrib.auth.hashers import make_password, check_password
 from django.contrib import messages
 from django.contrib.auth.decorators import login_required
 from django.utils import timezone
 from django.utils.dateparse import parse_datetime
-from django.db import transaction
-from django.db.models import Q, Count, Prefetch
-from django.http import JsonResponse
+from django.db import IntegrityError
+from django.db.models import Count, Prefetch
+from django.http import HttpResponse, JsonResponse, FileResponse, Http404
+from django.core.files.storage import default_storage
+from django.core.exceptions import ValidationError
+from django.core.paginator import Paginator
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import etag
 from .models import *
+from .audit import log_event
+from .ballots import Ballot, BallotTimeout, commit_ballot
+from .eligibility import is_eligible, open_to, parse_rule_list
+from .lifecycle import status_changed
+from .images import IMMUTABLE_CACHE_CONTROL, VARIANT_DIR, VARIANT_NAME, generate_photo_variants
+from .nominations import NominationError, import_candidates, open_csv, read_rows
+from .profiling import Pyinstrument, captures, clear_captures, get_capture
+from .ratelimit import rejection_counts, reset_rejection_counts
+from .receipts import BULK_LIMIT, verify_receipts
+from .search import ranked_search, search_candidates
+from .participation import get_participation, record_participation, refresh_participation, voted_election_ids
+from .results import dumps, get_snapshot, live_results as cached_live_results, results_delta, results_version
+from .turnout import BREAKDOWNS, DIMENSIONS, MINUTE, population, series
 from functools import wraps
-import hashlib
+import json
 import secrets
 import string
+import zipfile
+
+CANDIDATES_PER_PAGE = 24
+VOTER_LOOKUP_LIMIT = 10
+SEARCH_RESULTS_LIMIT = 20
 
 # Create your views here.
 
@@ -74,13 +98,7 @@ def register_voter(request):
                 user_type='voter'
             )
             messages.success(request, 'Registration successful! Please login to vote.')
-            AuditLog.objects.create(
-                user=user,
-                action_type='create',
-                description='Voter account created',
-                ip_address=request.META.get('REMOTE_ADDR'),
-                user_agent=request.META.get('HTTP_USER_AGENT')
-            )
+            log_event(request, AuditLog.Event.VOTER_CREATED, user=user)
             return redirect('login')
         except Exception as e:
             messages.error(request, f'Registration failed: {str(e)}')
@@ -120,13 +138,7 @@ def register_admin(request):
                 user_type='admin'
             )
             messages.success(request, 'Admin account created successfully.')
-            AuditLog.objects.create(
-                user=request.user,
-                action_type='create',
-                description=f'Admin account created for {username}',
-                ip_address=request.META.get('REMOTE_ADDR'),
-                user_agent=request.META.get('HTTP_USER_AGENT')
-            )
+            log_event(request, AuditLog.Event.ADMIN_CREATED, username=username)
             return redirect('admin_dashboard')
         except Exception as e:
             messages.error(request, f'Registration failed: {str(e)}')
@@ -148,7 +160,7 @@ def login_view(request):
                     otp = ''.join(secrets.choice(string.digits) for _ in range(6))
                     user.otp_code = make_password(otp)
                     user.otp_created_at = timezone.now()
-                    user.save()
+                    user.save(update_fields=['otp_code', 'otp_created_at'])
                     request.session['pending_otp_user_id'] = str(user.id)
                     request.session.pop('otp_verified', None)
                     messages.success(request, f'OTP sent to your registered email/phone: {otp}')
@@ -182,7 +194,7 @@ def otp_verify(request):
             # Check if OTP is not expired (5 minutes)
             if pending_user.otp_created_at and timezone.now() - pending_user.otp_created_at < timezone.timedelta(minutes=5):
                 pending_user.otp_code = ''
-                pending_user.save()
+                pending_user.save(update_fields=['otp_code'])
                 login(request, pending_user)
                 request.session.pop('pending_otp_user_id', None)
                 request.session['otp_verified'] = True
@@ -222,9 +234,12 @@ def vote_with_election(request, election_id):
         messages.error(request, 'Election not found or not active.')
         return redirect('vote')
 
+    if not is_eligible(election, request.user):
+        messages.error(request, 'You are not eligible to vote in this election.')
+        return redirect('vote')
+
     # Check if user has already voted in this election
-    existing_record = VoterRecord.objects.filter(voter=request.user, election=election).first()
-    if existing_record:
+    if get_participation(request, election.id):
         return redirect('already_voted', election_id=election.id)
 
     positions = election.positions.all().prefetch_related('candidates')
@@ -245,7 +260,7 @@ def vote_with_election(request, election_id):
                 'department': candidate.department,
                 'level': candidate.level,
                 'manifesto': candidate.manifesto,
-                'photo_url': candidate.photo.url if candidate.photo else None
+                'photo_url': candidate.photo_url
             }
             position_dict['candidates'].append(candidate_dict)
         positions_data.append(position_dict)
@@ -256,52 +271,46 @@ def vote_with_election(request, election_id):
             messages.error(request, 'Voting is closed for this election.')
             return redirect('vote_with_election', election_id=election.id)
 
-        # Process vote
-        with transaction.atomic():
-            selections_made = 0
-            for position in positions:
-                selected_ids = request.POST.getlist(f'position_{position.id}')
-                if not selected_ids:
-                    continue
-                if position.max_votes and len(selected_ids) > position.max_votes:
-                    messages.error(request, f"You can select up to {position.max_votes} candidate(s) for {position.title}.")
-                    return redirect('vote_with_election', election_id=election.id)
-
-                for candidate_id in selected_ids:
-                    candidate = get_object_or_404(Candidate, id=candidate_id, position=position)
-                    # Create vote hash (non-reversible, anonymized)
-                    vote_data = f"{request.user.id}-{candidate.id}-{timezone.now()}"
-                    vote_hash = hashlib.sha256(vote_data.encode()).hexdigest()
-                    Vote.objects.create(
-                        candidate=candidate,
-                        vote_hash=vote_hash,
-                        ip_address=request.META.get('REMOTE_ADDR')
-                    )
-                    selections_made += 1
-
-            if selections_made == 0:
-                messages.error(request, 'Please select at least one candidate before submitting.')
+        # Validate the whole ballot before writing anything
+        selections = []
+        for position in positions:
+            selected_ids = request.POST.getlist(f'position_{position.id}')
+            if not selected_ids:
+                continue
+            if position.max_votes and len(selected_ids) > position.max_votes:
+                messages.error(request, f"You can select up to {position.max_votes} candidate(s) for {position.title}.")
                 return redirect('vote_with_election', election_id=election.id)
+            candidates_by_id = {str(c.id): c for c in position.candidates.all()}
+            for candidate_id in selected_ids:
+                if candidate_id not in candidates_by_id:
+                    raise Http404('Candidate not found.')
+                selections.append(candidates_by_id[candidate_id])
+
+        if not selections:
+            messages.error(request, 'Please select at least one candidate before submitting.')
+            return redirect('vote_with_election', election_id=election.id)
 
-            # Record voter participation
-            verification_code = secrets.token_urlsafe(16)
-            VoterRecord.objects.create(
-                voter=request.user,
-                election=election,
-                verification_code=verification_code
-            )
-
-            # Log the vote
-            AuditLog.objects.create(
-                user=request.user,
-                action_type='vote',
-                description=f'Voted in election: {election.title}',
-                ip_address=request.META.get('REMOTE_ADDR'),
-                user_agent=request.META.get('HTTP_USER_AGENT')
-            )
+        # Process vote
+        ballot = Ballot(
+            election=election,
+            voter=request.user,
+            candidates=selections,
+            ip_address=request.META.get('REMOTE_ADDR'),
+            user_agent=request.META.get('HTTP_USER_AGENT'),
+        )
+        try:
+            record = commit_ballot(ballot)
+        except IntegrityError:
+            # A ballot for this voter was committed from another session
+            refresh_participation(request)
+            return redirect('already_voted', election_id=election.id)
+        except BallotTimeout:
+            messages.error(request, 'The server is busy and your vote was not recorded. Please submit it again.')
+            return redirect('vote_with_election', election_id=election.id)
 
-            messages.success(request, f'Vote submitted successfully!')
-            return redirect('vote_success', election_id=election.id)
+        record_participation(request, record)
+        messages.success(request, f'Vote submitted successfully!')
+        return redirect('vote_success', election_id=election.id)
 
     return render(request, 'voting/vote.html', {
         'election': election,
@@ -320,23 +329,24 @@ def vote(request):
         messages.error(request, 'Access denied.')
         return redirect('index')
 
-    # Get active elections
-    active_elections = Election.objects.filter(status='active')
+    # Get the active elections this voter is on the roll of
+    active_elections = list(
+        Election.objects.filter(open_to(request.user), status='active').annotate(position_count=Count('positions'))
+    )
 
-    if not active_elections.exists():
+    if not active_elections:
         messages.info(request, 'No active elections available at the moment. Check back later or view past results.')
         return redirect('live_results')
 
     # Show election selection page for all active elections
     now = timezone.now()
+    voted_ids = voted_election_ids(request)
     elections_with_status = []
     for election in active_elections:
-        # Check if user has voted in this election
-        has_voted = VoterRecord.objects.filter(voter=request.user, election=election).exists()
         elections_with_status.append({
             'election': election,
             'is_active': election.status == 'active' and election.start_date <= now <= election.end_date,
-            'has_voted': has_voted
+            'has_voted': str(election.id) in voted_ids
         })
     return render(request, 'voting/election_select.html', {
         'elections': elections_with_status
@@ -347,26 +357,24 @@ def vote(request):
 def vote_success(request, election_id):
     """Vote confirmation page"""
     election = get_object_or_404(Election, id=election_id)
-    record = VoterRecord.objects.filter(voter=request.user, election=election).first()
     return render(request, 'voting/success.html', {
         'election': election,
-        'record': record,
+        'record': get_participation(request, election.id),
     })
 
 @login_required
 @otp_required
 def already_voted(request, election_id):
     election = get_object_or_404(Election, id=election_id)
-    record = VoterRecord.objects.filter(voter=request.user, election=election).first()
     return render(request, 'voting/already_voted.html', {
         'election': election,
-        'record': record,
+        'record': get_participation(request, election.id),
     })
 
 def live_results(request):
     """Live results dashboard"""
     # Get all active elections
-    active_elections = Election.objects.filter(status='active').prefetch_related('positions__candidates__votes')
+    active_elections = Election.objects.filter(status='active')
         
     # If no active elections, show the most recent closed election
     if not active_elections.exists():
@@ -383,45 +391,58 @@ def live_results(request):
         try:
             selected_election = Election.objects.get(id=selected_election_id, status__in=['active', 'closed'])
         except Election.DoesNotExist:
-            selected_election = active_elections.first()
+            selected_election = active_elections[0]
     else:
-        selected_election = active_elections.first()
-        
-    # Get positions and results for selected election (order candidates by votes desc)
-    candidates_qs = Candidate.objects.annotate(
-        vote_count_agg=Count('votes')
-    ).order_by('-vote_count_agg', 'full_name')
-    positions = selected_election.positions.all().prefetch_related(
-        Prefetch('candidates', queryset=candidates_qs, to_attr='candidates_ordered'),
-        'candidates__votes'
-    )
-        
-    # Calculate totals
-    total_voters = User.objects.filter(user_type='voter', is_active=True).count()
-    total_votes = selected_election.total_votes
+        selected_election = active_elections[0]
+
+    # Read before the tallies, so a vote that lands in between shows up in the next delta
+    version = results_version()
+
+    if selected_election.status == 'closed':
+        # Closed results never change: serve the frozen snapshot
+        snapshot = get_snapshot(selected_election)
+        positions = [
+            dict(position, candidates_ordered=position['candidates'])
+            for position in snapshot.payload['positions']
+        ]
+        positions_data = snapshot.payload['positions']
+        total_voters = snapshot.total_voters
+        total_votes = snapshot.total_votes
+        turnout = snapshot.turnout
+    else:
+        # Get positions and results for selected election (order candidates by votes desc)
+        candidates_qs = Candidate.objects.with_stats().order_by('-vote_count_agg', 'full_name')
+        positions = selected_election.positions.with_stats().prefetch_related(
+            Prefetch('candidates', queryset=candidates_qs, to_attr='candidates_ordered'),
+        )
 
-    # Prepare positions data for charts
-    positions_data = []
-    for position in positions:
-        position_dict = {
-            'id': position.id,
-            'title': position.title,
-            'description': position.description,
-            'candidates': []
-        }
-        for candidate in position.candidates.all():
-            candidate_dict = {
-                'id': candidate.id,
-                'full_name': candidate.full_name,
-                'department': candidate.department,
-                'level': candidate.level,
-                'manifesto': candidate.manifesto,
-                'photo_url': candidate.photo.url if candidate.photo else None,
-                'vote_count': candidate.vote_count,
-                'vote_percentage': candidate.vote_percentage
+        # Calculate totals
+        total_voters = selected_election.eligible_voters
+        total_votes = selected_election.total_votes
+        turnout = selected_election.voter_turnout
+
+        # Prepare positions data for charts
+        positions_data = []
+        for position in positions:
+            position_dict = {
+                'id': position.id,
+                'title': position.title,
+                'description': position.description,
+                'candidates': []
             }
-            position_dict['candidates'].append(candidate_dict)
-        positions_data.append(position_dict)
+            for candidate in sorted(position.candidates_ordered, key=lambda c: c.full_name):
+                candidate_dict = {
+                    'id': candidate.id,
+                    'full_name': candidate.full_name,
+                    'department': candidate.department,
+                    'level': candidate.level,
+                    'manifesto': candidate.manifesto,
+                    'photo_url': candidate.photo_url,
+                    'vote_count': candidate.vote_count,
+                    'vote_percentage': candidate.vote_percentage
+                }
+                position_dict['candidates'].append(candidate_dict)
+            positions_data.append(position_dict)
 
     template_name = 'results/live_results.html'
     if request.headers.get('HX-Request'):
@@ -434,10 +455,145 @@ def live_results(request):
         'positions_data': positions_data,
         'total_voters': total_voters,
         'total_votes': total_votes,
+        'turnout': turnout,
         'now': timezone.now(),
         'end_timestamp': int(selected_election.end_date.timestamp() * 1000),
+        'results_version': version,
     })
 
+def results_api(request, election_id):
+    """Compact results feed: only the tallies that changed since ?since=<version>"""
+    election = get_object_or_404(Election, id=election_id, status__in=['active', 'closed'])
+    since = request.GET.get('since')
+    try:
+        since = int(since) if since else None
+    except ValueError:
+        return JsonResponse({'error': 'Invalid version.'}, status=400)
+    response = HttpResponse(dumps(results_delta(election, since)), content_type='application/json')
+    response['Cache-Control'] = 'no-cache'
+    return response
+
+def verify_receipt(request):
+    """Public check that a vote receipt belongs to a counted ballot"""
+    elections = Election.objects.filter(status__in=['active', 'closed']).only('id', 'title')
+    election, result = None, None
+    code = request.POST.get('code', request.GET.get('code', '')).strip()
+    election_id = request.POST.get('election', request.GET.get('election'))
+    if election_id:
+        try:
+            election = elections.get(id=election_id)
+        except (Election.DoesNotExist, ValidationError):
+            election = None
+    if request.method == 'POST' and election and code:
+        result = verify_receipts(election, [code])[code]
+    return render(request, 'voting/verify_receipt.html', {
+        'elections': elections,
+        'election': election,
+        'code': code,
+        'result': result,
+    })
+
+@csrf_exempt  # Called by observers' scripts; it changes nothing
+def receipts_api(request, election_id):
+    """Bulk receipt check: POST {"codes": [...]} or GET ?code=...&code=..."""
+    election = get_object_or_404(Election, id=election_id, status__in=['active', 'closed'])
+    if request.method == 'POST':
+        try:
+            codes = json.loads(request.body)['codes']
+        except (ValueError, KeyError, TypeError):
+            return JsonResponse({'error': 'Expected a JSON body like {"codes": ["..."]}.'}, status=400)
+    else:
+        codes = request.GET.getlist('code')
+    if not isinstance(codes, list) or not all(isinstance(code, str) for code in codes):
+        return JsonResponse({'error': 'Codes must be a list of strings.'}, status=400)
+    if len(codes) > BULK_LIMIT:
+        return JsonResponse({'error': f'At most {BULK_LIMIT} codes per request.'}, status=400)
+    
+    results = verify_receipts(election, codes)
+    response = HttpResponse(dumps({
+        'election': election.id,
+        'status': election.status,
+        'counted': sum(results.values()),
+        'results': results,
+    }), content_type='application/json')
+    response['Cache-Control'] = 'no-store'
+    return response
+
+def results_export(request, election_id):
+    """Download election results as JSON"""
+    election = get_object_or_404(Election, id=election_id, status__in=['active', 'closed'])
+    filename = f'results-{election.id}.json'
+
+    if election.status == 'closed':
+        snapshot = get_snapshot(election)
+        if snapshot.artifact:
+            try:
+                return FileResponse(snapshot.artifact.open('rb'), as_attachment=True,
+                                    filename=filename, content_type='application/json')
+            except FileNotFoundError:
+                pass
+        response = JsonResponse(snapshot.payload)
+    else:
+        response = JsonResponse(cached_live_results(election))
+    response['Content-Disposition'] = f'attachment; filename="{filename}"'
+    return response
+
+@login_required
+def candidate_search(request):
+    """Ranked candidate search over names, positions and manifestos"""
+    query = request.GET.get('q', '').strip()
+    election_id = request.GET.get('election')
+    
+    if request.user.user_type == 'admin':
+        elections = Election.objects.all()
+    elif request.session.get('otp_verified'):
+        elections = Election.objects.filter(status__in=['active', 'closed'])
+    else:
+        return JsonResponse({'error': 'Please verify OTP to continue.'}, status=403)
+    if election_id:
+        try:
+            elections = elections.filter(id=election_id)
+        except ValidationError:
+            return JsonResponse({'error': 'Invalid election.'}, status=400)
+    
+    if len(query) < 2:
+        return JsonResponse({'query': query, 'results': []})
+    
+    try:
+        limit = min(max(int(request.GET.get('limit', SEARCH_RESULTS_LIMIT)), 1), SEARCH_RESULTS_LIMIT)
+    except ValueError:
+        limit = SEARCH_RESULTS_LIMIT
+    matches = ranked_search(query, election_ids=elections.values_list('id', flat=True), limit=limit)
+    
+    return JsonResponse({'query': query, 'results': [
+        {
+            'id': candidate.id,
+            'full_name': candidate.full_name,
+            'department': candidate.department,
+            'level': candidate.level,
+            'position': candidate.position.title,
+            'election': {'id': candidate.position.election.id, 'title': candidate.position.election.title},
+            'photo_url': candidate.photo_url,
+            'score': score,
+            'snippet': snippet,
+        }
+        for candidate, score, snippet in matches
+    ]})
+
+@etag(lambda request, name: f'"{name}"')
+def photo_variant(request, name):
+    """Serve a resized candidate photo; names are content hashes, so it can be cached forever"""
+    if not VARIANT_NAME.match(name):
+        raise Http404('Photo not found.')
+    try:
+        handle = default_storage.open(f'{VARIANT_DIR}/{name}', 'rb')
+    except FileNotFoundError:
+        raise Http404('Photo not found.')
+    content_type = 'image/webp' if name.endswith('.webp') else 'image/jpeg'
+    response = FileResponse(handle, content_type=content_type)
+    response['Cache-Control'] = IMMUTABLE_CACHE_CONTROL
+    return response
+
 def admin_login(request):
     """Admin login"""
     if request.method == 'POST':
@@ -447,13 +603,7 @@ def admin_login(request):
         user = authenticate(request, username=username, password=password)
         if user and user.user_type == 'admin':
             login(request, user)
-            AuditLog.objects.create(
-                user=user,
-                action_type='login',
-                description='Admin login',
-                ip_address=request.META.get('REMOTE_ADDR'),
-                user_agent=request.META.get('HTTP_USER_AGENT')
-            )
+            log_event(request, AuditLog.Event.ADMIN_LOGIN, user=user)
             return redirect('admin_dashboard')
         else:
             messages.error(request, 'Invalid admin credentials.')
@@ -467,7 +617,7 @@ def admin_dashboard(request):
         messages.error(request, 'Access denied.')
         return redirect('index')
     
-    elections = Election.objects.all()
+    elections = Election.objects.with_stats()
     total_voters = User.objects.filter(user_type='voter').count()
     total_votes = Vote.objects.count()
     active_elections = elections.filter(status='active').count()
@@ -511,7 +661,7 @@ def admin_elections(request):
         messages.error(request, 'Access denied.')
         return redirect('index')
 
-    elections = Election.objects.all()
+    elections = Election.objects.with_stats()
 
     def _parse_dt(value):
         dt = parse_datetime(value) if value else None
@@ -537,22 +687,19 @@ def admin_elections(request):
             if status == 'active' and start_dt > timezone.now():
                 start_dt = timezone.now()
 
-            Election.objects.create(
+            election = Election.objects.create(
                 title=title,
                 description=description,
                 start_date=start_dt,
                 end_date=end_dt,
                 status=status,
-                created_by=request.user
+                created_by=request.user,
+                eligible_departments=parse_rule_list(request.POST.get('eligible_departments')),
+                eligible_levels=parse_rule_list(request.POST.get('eligible_levels')),
             )
+            status_changed(election, None)
             messages.success(request, 'Election created successfully.')
-            AuditLog.objects.create(
-                user=request.user,
-                action_type='create',
-                description=f'Created election: {title}',
-                ip_address=request.META.get('REMOTE_ADDR'),
-                user_agent=request.META.get('HTTP_USER_AGENT')
-            )
+            log_event(request, AuditLog.Event.ELECTION_CREATED, object_id=election.id, title=title)
         elif 'update' in request.POST:
             election_id = request.POST.get('election_id')
             title = request.POST.get('title')
@@ -562,6 +709,7 @@ def admin_elections(request):
             status = request.POST.get('status')
             
             election = get_object_or_404(Election, id=election_id)
+            previous_status = election.status
             start_dt = _parse_dt(start_date)
             end_dt = _parse_dt(end_date)
             if not start_dt or not end_dt:
@@ -573,42 +721,38 @@ def admin_elections(request):
             if status == 'active' and start_dt > timezone.now():
                 start_dt = timezone.now()
 
+            rules = (parse_rule_list(request.POST.get('eligible_departments')),
+                     parse_rule_list(request.POST.get('eligible_levels')))
+            rules_changed = rules != (election.eligible_departments, election.eligible_levels)
+
             election.title = title
             election.description = description
             election.start_date = start_dt
             election.end_date = end_dt
             election.status = status
+            election.eligible_departments, election.eligible_levels = rules
             election.save()
+            status_changed(election, previous_status, rules_changed)
             messages.success(request, 'Election updated successfully.')
-            AuditLog.objects.create(
-                user=request.user,
-                action_type='update',
-                description=f'Updated election: {title}',
-                ip_address=request.META.get('REMOTE_ADDR'),
-                user_agent=request.META.get('HTTP_USER_AGENT')
-            )
+            log_event(request, AuditLog.Event.ELECTION_UPDATED, object_id=election.id, title=title)
         elif 'delete' in request.POST:
             election_id = request.POST.get('election_id')
             election = get_object_or_404(Election, id=election_id)
             title = election.title
             election.delete()
             messages.success(request, 'Election deleted successfully.')
-            AuditLog.objects.create(
-                user=request.user,
-                action_type='delete',
-                description=f'Deleted election: {title}',
-                ip_address=request.META.get('REMOTE_ADDR'),
-                user_agent=request.META.get('HTTP_USER_AGENT')
-            )
+            log_event(request, AuditLog.Event.ELECTION_DELETED, object_id=election_id, title=title)
         elif 'update_status' in request.POST:
             election_id = request.POST.get('election_id')
             status = request.POST.get('status')
             election = get_object_or_404(Election, id=election_id)
+            previous_status = election.status
             election.status = status
             election.save()
+            status_changed(election, previous_status)
             messages.success(request, f'Election status updated to {status}.')
     
-    return render(request, 'admin/elections.html', {'elections': elections, 'total_voters': User.objects.filter(user_type='voter', is_active=True).count()})
+    return render(request, 'admin/elections.html', {'elections': elections})
 
 @login_required
 def admin_candidates(request):
@@ -632,11 +776,7 @@ def admin_candidates(request):
         candidates = candidates.filter(position__title__icontains=position_filter)
     
     if search_query:
-        candidates = candidates.filter(
-            Q(full_name__icontains=search_query) |
-            Q(department__icontains=search_query) |
-            Q(user__matric_number__icontains=search_query)
-        )
+        candidates = search_candidates(candidates, search_query)
     
     if request.method == 'POST':
         if 'create' in request.POST:
@@ -657,7 +797,7 @@ def admin_candidates(request):
                 title=position_title
             )
             
-            Candidate.objects.create(
+            candidate = Candidate.objects.create(
                 position=position,
                 user=user,
                 full_name=full_name,
@@ -666,21 +806,10 @@ def admin_candidates(request):
                 manifesto=manifesto,
                 photo=photo
             )
+            if photo:
+                generate_photo_variants(candidate)
             messages.success(request, 'Candidate added successfully.')
-            AuditLog.objects.create(
-                user=request.user,
-                action_type='create',
-                description=f'Added candidate: {full_name}',
-                ip_address=request.META.get('REMOTE_ADDR'),
-                user_agent=request.META.get('HTTP_USER_AGENT')
-            )
-            AuditLog.objects.create(
-                user=request.user,
-                action_type='create',
-                description=f'Added candidate: {full_name}',
-                ip_address=request.META.get('REMOTE_ADDR'),
-                user_agent=request.META.get('HTTP_USER_AGENT')
-            )
+            log_event(request, AuditLog.Event.CANDIDATE_ADDED, name=full_name)
         elif 'update' in request.POST:
             candidate_id = request.POST.get('candidate_id')
             election_id = request.POST.get('election')
@@ -701,6 +830,8 @@ def admin_candidates(request):
                 title=position_title
             )
             
+            if candidate.position.election_id != election.id:
+                candidate.ordinal = 0  # Renumber within the new election
             candidate.position = position
             candidate.user = user
             candidate.full_name = full_name
@@ -710,47 +841,161 @@ def admin_candidates(request):
             if photo:
                 candidate.photo = photo
             candidate.save()
+            if photo:
+                generate_photo_variants(candidate)
             messages.success(request, 'Candidate updated successfully.')
-            AuditLog.objects.create(
-                user=request.user,
-                action_type='update',
-                description=f'Updated candidate: {full_name}',
-                ip_address=request.META.get('REMOTE_ADDR'),
-                user_agent=request.META.get('HTTP_USER_AGENT')
-            )
+            log_event(request, AuditLog.Event.CANDIDATE_UPDATED, name=full_name)
         elif 'delete' in request.POST:
             candidate_id = request.POST.get('candidate_id')
             candidate = get_object_or_404(Candidate, id=candidate_id)
             full_name = candidate.full_name
             candidate.delete()
             messages.success(request, 'Candidate deleted successfully.')
-            AuditLog.objects.create(
-                user=request.user,
-                action_type='delete',
-                description=f'Deleted candidate: {full_name}',
-                ip_address=request.META.get('REMOTE_ADDR'),
-                user_agent=request.META.get('HTTP_USER_AGENT')
-            )
+            log_event(request, AuditLog.Event.CANDIDATE_DELETED, name=full_name)
+        elif 'import' in request.POST:
+            election = get_object_or_404(Election, id=request.POST.get('election'))
+            csv_file = request.FILES.get('csv_file')
+            photo_zip = request.FILES.get('photo_zip')
+            if not csv_file:
+                messages.error(request, 'Choose a CSV file to import.')
+                return redirect('admin_candidates')
+            try:
+                rows = read_rows(open_csv(csv_file))
+                photos = zipfile.ZipFile(photo_zip) if photo_zip else None
+                counts = import_candidates(election, rows, photos)
+            except NominationError as exc:
+                for error in exc.errors:
+                    messages.error(request, error)
+            except (UnicodeDecodeError, zipfile.BadZipFile):
+                messages.error(request, 'The CSV must be UTF-8 text and the photos a zip archive.')
+            else:
+                messages.success(
+                    request,
+                    f"Imported {counts['candidates']} candidates and {counts['positions']} new positions into {election.title}.",
+                )
+                log_event(
+                    request, AuditLog.Event.CANDIDATES_IMPORTED, object_id=election.id, title=election.title,
+                    candidates=counts['candidates'], positions=counts['positions'],
+                )
     
     elections = Election.objects.all()
-    users = User.objects.filter(user_type='voter')
+    page_obj = Paginator(candidates, CANDIDATES_PER_PAGE).get_page(request.GET.get('page'))
     
     return render(request, 'admin/candidates.html', {
-        'candidates': candidates,
+        'candidates': page_obj,
+        'page_obj': page_obj,
         'elections': elections,
-        'users': users
     })
 
+@login_required
+def admin_voter_lookup(request):
+    """Matric number autocomplete for the candidate forms"""
+    if request.user.user_type != 'admin':
+        return JsonResponse({'error': 'Access denied.'}, status=403)
+    
+    query = request.GET.get('q', '').strip()
+    if len(query) < 2:
+        return JsonResponse({'results': []})
+    
+    # A range scan on the unique matric_number index; LIKE 'x%' cannot use it on SQLite.
+    # Only students have matric numbers, so no user_type filter is needed.
+    voters = (
+        User.objects.filter(matric_number__gte=query, matric_number__lt=query + '\uffff')
+        .order_by('matric_number')
+        .values('matric_number', 'first_name', 'last_name', 'department', 'level')[:VOTER_LOOKUP_LIMIT]
+    )
+    return JsonResponse({'results': [
+        {
+            'matric_number': voter['matric_number'],
+            'name': f"{voter['first_name']} {voter['last_name']}".strip(),
+            'department': voter['department'],
+            'level': voter['level'],
+        }
+        for voter in voters
+    ]})
+
+@login_required
+def admin_rate_limits(request):
+    """Rejected request counters per rate-limited endpoint"""
+    if request.user.user_type != 'admin':
+        return JsonResponse({'error': 'Access denied.'}, status=403)
+    
+    if request.method == 'POST' and 'reset' in request.POST:
+        reset_rejection_counts()
+    return JsonResponse({
+        'enabled': getattr(settings, 'RATE_LIMIT_ENABLED', True),
+        'budgets': getattr(settings, 'RATE_LIMITS', {}),
+        'rejected': rejection_counts(),
+    })
+
+@login_required
+def admin_turnout(request, election_id):
+    """Turnout chart data: ballots per minute, department and level from the rollups"""
+    if request.user.user_type != 'admin':
+        return JsonResponse({'error': 'Access denied.'}, status=403)
+    
+    election = get_object_or_404(Election, id=election_id)
+    dimension = request.GET.get('dimension')
+    if dimension and dimension not in DIMENSIONS:
+        return JsonResponse({'error': 'Unknown dimension.'}, status=400)
+    
+    payload = {'election': election.id, 'status': election.status}
+    for name in [dimension] if dimension else DIMENSIONS:
+        if name == MINUTE:
+            # ?since=<minute> lets a chart fetch only the minutes it has not drawn yet
+            payload[name] = series(election, name, since=request.GET.get('since'))
+        else:
+            voters = population(election, name)
+            payload[name] = [(bucket, n, voters.get(bucket, 0)) for bucket, n in series(election, name)]
+    if not dimension:
+        payload['ballots'] = sum(row[1] for row in payload[BREAKDOWNS[0]])
+    response = JsonResponse(payload)
+    response['Cache-Control'] = 'no-cache'
+    return response
+
+@login_required
+def admin_profiles(request):
+    """Request profiles captured with ?_profile=1"""
+    if request.user.user_type != 'admin':
+        messages.error(request, 'Access denied.')
+        return redirect('index')
+    
+    if request.method == 'POST' and 'clear' in request.POST:
+        clear_captures()
+        messages.success(request, 'Profiles cleared.')
+        return redirect('admin_profiles')
+    
+    return render(request, 'admin/profiles.html', {
+        'captures': captures(),
+        'buffer_size': settings.PROFILE_BUFFER_SIZE,
+        'pyinstrument_available': Pyinstrument is not None,
+    })
+
+@login_required
+def admin_profile_download(request, capture_id):
+    """Download a captured profile, or its queries as JSON"""
+    if request.user.user_type != 'admin':
+        return JsonResponse({'error': 'Access denied.'}, status=403)
+    
+    capture = get_capture(capture_id)
+    if capture is None:
+        raise Http404('Profile not found.')
+    
+    if request.GET.get('format') == 'queries':
+        return JsonResponse({
+            key: capture[key] for key in ('id', 'method', 'path', 'view', 'status', 'duration_ms',
+                                          'query_count', 'query_ms', 'queries')
+        })
+    if capture['kind'] == 'pyinstrument':
+        return HttpResponse(capture['data'], content_type='text/html; charset=utf-8')
+    response = HttpResponse(capture['data'], content_type='application/octet-stream')
+    response['Content-Disposition'] = f'attachment; filename="{capture["view"] or "request"}-{capture["id"][:8]}.prof"'
+    return response
+
 def logout_view(request):
     """Logout"""
     if request.user.is_authenticated:
-        AuditLog.objects.create(
-            user=request.user,
-            action_type='logout',
-            description='User logout',
-            ip_address=request.META.get('REMOTE_ADDR'),
-            user_agent=request.META.get('HTTP_USER_AGENT')
-        )
+        log_event(request, AuditLog.Event.LOGOUT)
     logout(request)
     request.session.pop('otp_verified', None)
     request.session.pop('pending_otp_user_id', None)